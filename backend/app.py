@@ -1,33 +1,138 @@
+import os
+import click
 from flask import Flask
 from flask_cors import CORS
-from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from flask_migrate import Migrate
 from config import Config
 from models import db
+from services.registry import services
+from services.browser_pool import browser_pool
+from services.article_cache import article_cache
+from services.search_cache import search_cache
+from services.response_cache import response_cache
+from services.persistence import query_tracker
+from services.ownership import project_ownership
+from services.rate_limit import rate_limiter, upstream_governor
+from services.hedging import hedge_policy
+from services.compression import article_codec
 
-app = Flask(__name__)
-app.config.from_object(Config)
+jwt = JWTManager()
+# マイグレーション（flask --app app db upgrade）はbackend/migrationsに置く
+migrate = Migrate(directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations'))
 
-# CORSの設定
-CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
 
-# CORS, DB, JWT, Migrateの初期化
-db.init_app(app)
-jwt = JWTManager(app)
-migrate = Migrate(app, db)
+def create_app(config_object=Config):
+    """
+    アプリケーションファクトリ。
+    テーブルの作成はワーカーの起動時には行わない（flask --app app init-db を事前に実行する）。
+    OpenAI・LangChain・newspaper3kなどの重い依存は最初に使われた時に読み込まれる。
+    """
+    app = Flask(__name__)
+    app.config.from_object(config_object)
 
-with app.app_context():
-    db.create_all()
+    # CORSの設定
+    CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True,
+         expose_headers=["ETag", "X-Next-Before-Id", "Server-Timing", "Retry-After"])
 
-# ルートの登録
-from routes.auth import auth_bp
-from routes.projects import projects_bp
-from routes.chat import chat_bp
+    # DB, JWT, Migrateの初期化
+    db.init_app(app)
+    jwt.init_app(app)
+    migrate.init_app(app, db)
+    services.init_app(app)
+    browser_pool.init_app(app)
+    article_cache.init_app(app)
+    search_cache.init_app(app)
+    response_cache.init_app(app)
+    query_tracker.init_app(app)
+    project_ownership.init_app(app)
+    rate_limiter.init_app(app)
+    upstream_governor.init_app(app)
+    hedge_policy.init_app(app)
+    article_codec.init_app(app)
+
+    # ルートの登録
+    from routes.auth import auth_bp
+    from routes.projects import projects_bp
+    from routes.chat import chat_bp
+    from routes.monitoring import monitoring_bp
+    from routes.metrics import metrics_bp
+    from routes.search import search_bp
+
+    app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    app.register_blueprint(projects_bp, url_prefix='/api/projects')
+    app.register_blueprint(chat_bp, url_prefix='/api/chat')
+    app.register_blueprint(monitoring_bp, url_prefix='/api/monitoring')
+    app.register_blueprint(search_bp, url_prefix='/api/search')
+    app.register_blueprint(metrics_bp)
+
+    register_commands(app)
+
+    # AI応答ジョブのワーカーと、参照されなくなった記事の定期的な削除
+    from services.job_queue import job_queue
+    from services.cleanup import article_collector
+    job_queue.init_app(app)
+    article_collector.init_app(app)
+    app.before_request(lambda: start_background_workers(app))
+
+    return app
+
+
+def start_background_workers(app):
+    """
+    ジョブのワーカーと記事の削除のスレッドを起動する（2回目以降は何もしない）。
+    リクエストを処理するプロセスでのみ起動し（WSGIは最初のリクエスト、ASGIはlifespanの開始時）、
+    init-dbなどのCLIコマンドではテーブルの作成前に動き出さないようにする。
+    """
+    from services.job_queue import job_queue
+    from services.cleanup import article_collector
+    job_queue.start()
+    article_collector.start()
+
+
+def register_commands(app):
+    # マイグレーション（migrations/versions）を適用し、テーブルと全文検索の索引を作成・更新する（flask --app app init-db）。
+    # デプロイ時にワーカーの起動前に実行する（flask --app app db upgradeと同じ）
+    @app.cli.command('init-db')
+    def init_db_command():
+        from flask_migrate import upgrade
+        from sqlalchemy import inspect
+        tables = inspect(db.engine).get_table_names()
+        if tables and 'alembic_version' not in tables:
+            # マイグレーションの導入前にdb.create_all()で作成したDBは、どこまで適用済みかを先に記録する
+            raise click.ClickException(
+                "マイグレーションの履歴が無い既存のデータベースです。"
+                "README.mdの手順でflask --app app db stampを実行してから、もう一度実行してください。"
+            )
+        upgrade()
+        print("テーブルを作成しました。")
+
+    # 全文検索の索引に無い既存のメッセージと記事を追加（flask --app app reindex-search）
+    @app.cli.command('reindex-search')
+    def reindex_search_command():
+        from services.persistence import reindex_search
+        added = reindex_search()
+        print(f"{added}件を全文検索の索引に追加しました。")
+
+    # 圧縮前の記事の本文を圧縮した形式に移行（flask --app app compress-articles）。
+    # body等の列はマイグレーションで追加するため、先にinit-db（flask --app app db upgrade）を実行しておく
+    @app.cli.command('compress-articles')
+    def compress_articles_command():
+        from services.persistence import compress_articles
+        result = compress_articles()
+        original, stored = result["original_bytes"], result["stored_bytes"]
+        saved = 1 - stored / original if original else 0
+        print(f"{result['articles']}件の記事の本文を圧縮しました"
+              f"（{original / 1024 / 1024:.1f}MB → {stored / 1024 / 1024:.1f}MB、{saved:.0%}削減）。")
+        print("SQLiteの場合、データベースファイルはVACUUMを実行するまで縮小されません。")
+
+    # どのメッセージからも参照されない記事を今すぐ削除（flask --app app gc-articles）
+    @app.cli.command('gc-articles')
+    def gc_articles_command():
+        from services.cleanup import article_collector
+        deleted = article_collector.collect()
+        print(f"参照されていない記事を{deleted}件削除しました。")
 
-app.register_blueprint(auth_bp, url_prefix='/api/auth')
-app.register_blueprint(projects_bp, url_prefix='/api/projects')
-app.register_blueprint(chat_bp, url_prefix='/api/chat')
 
 if __name__ == "__main__":
-    app.run()
+    create_app().run()
@@ -0,0 +1,175 @@
+"""
+ASGIモードのエントリポイント（uvicorn --factory asgi:create_asgi_app）。
+チャットの送信（通常・ストリーミング）はイベントループ上の非同期パイプラインで処理し、
+1プロセスで多数のチャットを同時に扱う。
+それ以外のルート（認証・プロジェクト・チャット履歴・ジョブ・検索・監視）は短時間で終わるため、
+既存のFlaskアプリをスレッドプール（ASGI_WSGI_WORKERS）で提供する。
+WSGIモード（flask --app app run、gunicorn "app:create_app()"）もそのまま使える。
+"""
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing, asynccontextmanager
+from a2wsgi import WSGIMiddleware
+from jwt import ExpiredSignatureError, InvalidTokenError
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+from flask_jwt_extended import decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from app import create_app, start_background_workers
+from routes.chat import enqueue_prompt, QUEUE_FULL, TOO_MANY_REQUESTS
+from services.registry import services
+from services.job_queue import JobQueueFull
+from services.ownership import project_ownership
+from services.rate_limit import rate_limiter, RateLimited
+from services.async_pipeline import run_sync, get_ai_response_async, stream_ai_response_async
+
+
+class _AuthError(Exception):
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def _current_user(request):
+    """
+    Authorizationヘッダーのアクセストークンを検証し、identity（{'id', 'username'}）を返す。
+    エラー時のステータスとメッセージはFlask-JWT-Extendedの既定に合わせる。
+    """
+    flask_app = request.app.state.flask_app
+    header = request.headers.get('Authorization', '')
+    if not header.startswith('Bearer '):
+        raise _AuthError("Missing Authorization Header", 401)
+    try:
+        with flask_app.app_context():
+            decoded = decode_token(header[len('Bearer '):])
+    except ExpiredSignatureError:
+        raise _AuthError("Token has expired", 401)
+    except (InvalidTokenError, JWTExtendedException) as e:
+        raise _AuthError(str(e), 422)
+    if decoded.get('type') != 'access':
+        raise _AuthError("Only non-refresh tokens are allowed", 422)
+    return decoded[flask_app.config['JWT_IDENTITY_CLAIM']]
+
+
+def _too_many_requests(message, retry_after):
+    return JSONResponse({"message": message}, 429, headers={'Retry-After': retry_after})
+
+
+async def _chat_request(request):
+    """チャット送信の共通の検証。(ユーザー, プロジェクト, リクエストの内容, エラーのレスポンス) を返す。"""
+    try:
+        user = _current_user(request)
+    except _AuthError as e:
+        return None, None, None, JSONResponse({"msg": e.message}, e.status)
+
+    try:
+        data = await request.json()
+    except ValueError:
+        return None, None, None, JSONResponse({"message": "リクエストの形式が正しくありません"}, 400)
+
+    project_id = request.path_params['project_id']
+    project = await run_sync(request.app.state.flask_app, project_ownership.get, user['id'], project_id)
+    if not project:
+        return None, None, None, JSONResponse({"message": "プロジェクトが見つかりません"}, 404)
+
+    if not data.get('content'):
+        return None, None, None, JSONResponse({"message": "プロンプトを入力してください"}, 400)
+
+    try:
+        await rate_limiter.check_async('user', user['id'])
+    except RateLimited as e:
+        return None, None, None, _too_many_requests(TOO_MANY_REQUESTS, e.retry_after_header)
+
+    return user, project, data, None
+
+
+# ユーザーからのプロンプト送信（routes.chat.send_promptの非同期版）
+async def send_prompt(request):
+    user, project, data, error = await _chat_request(request)
+    if error is not None:
+        return error
+    flask_app = request.app.state.flask_app
+    prompt = data['content']
+
+    # 非同期モードではジョブを登録してすぐに返す（結果は /jobs/<job_id> で取得）
+    if data.get('async') or request.query_params.get('async'):
+        try:
+            payload, status = await run_sync(flask_app, enqueue_prompt, user['id'], project.id, prompt)
+        except JobQueueFull as e:
+            return _too_many_requests(QUEUE_FULL, e.retry_after_header)
+        return JSONResponse(payload, status)
+
+    ai_data = await get_ai_response_async(flask_app, project, prompt, save_user_message=True)
+    if ai_data.get("retry_after"):
+        return _too_many_requests(ai_data["ai_response"], ai_data["retry_after"])
+
+    response = JSONResponse({
+        "message": "メッセージが送信されました",
+        "ai_response": ai_data.get("ai_response"),
+        "articles": ai_data.get("articles")
+    }, 201)
+    if ai_data.get("timings") is not None:
+        response.headers['Server-Timing'] = ai_data["timings"].server_timing(ai_data.get("db"))
+    return response
+
+
+# ユーザーからのプロンプト送信（Server-Sent Events、routes.chat.stream_promptの非同期版）
+async def stream_prompt(request):
+    _user, project, data, error = await _chat_request(request)
+    if error is not None:
+        return error
+    flask_app = request.app.state.flask_app
+    prompt = data['content']
+
+    async def generate():
+        # クライアント切断時はaclosingによりパイプラインと上流のストリームも閉じられる
+        async with aclosing(stream_ai_response_async(flask_app, project, prompt, save_user_message=True)) as events:
+            async for event, payload in events:
+                yield f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        generate(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+def create_asgi_app(flask_app=None):
+    flask_app = flask_app or create_app()
+
+    @asynccontextmanager
+    async def lifespan(_app):
+        # DBアクセスとHTML解析に使うスレッドの上限
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=flask_app.config['ASGI_THREADS'], thread_name_prefix='asgi-sync')
+        )
+        start_background_workers(flask_app)
+        yield
+        await services.aclose()
+
+    # Flaskアプリと同じCORSの設定（ネイティブのルートのみ。Flaskのルートはflask-corsが付ける）
+    cors = [Middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["ETag", "X-Next-Before-Id", "Server-Timing", "Retry-After"],
+    )]
+
+    asgi_app = Starlette(
+        routes=[
+            Route('/api/chat/{project_id:int}', send_prompt, methods=['POST'], middleware=cors),
+            Route('/api/chat/{project_id:int}/stream', stream_prompt, methods=['POST'], middleware=cors),
+            # 上記以外（GETの履歴やプリフライトを含む）は既存のFlaskアプリに渡す
+            Mount('', app=WSGIMiddleware(flask_app, workers=flask_app.config['ASGI_WSGI_WORKERS'])),
+        ],
+        lifespan=lifespan,
+    )
+    asgi_app.state.flask_app = flask_app
+    return asgi_app
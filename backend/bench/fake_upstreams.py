@@ -0,0 +1,193 @@
+# backend/bench/fake_upstreams.py
+"""
+ベンチマーク用のローカル上流サーバー。
+OpenAI互換API（/v1/chat/completions, /v1/completions）、Google CSE互換API、記事ページを1つのHTTPサーバーで提供する。
+各上流の遅延は設定で変更できる。
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+ARTICLE_PARAGRAPH = (
+    "画像生成AIの比較では、生成品質、商用利用の可否、料金体系、日本語プロンプトへの対応が重要な観点になる。"
+    "Midjourneyは芸術的な表現に強く、Stable Diffusionはローカル環境での利用や細かな制御に向いている。"
+    "DALL·E 3は自然言語の指示への追従性が高く、ChatGPTと組み合わせて使える点が特徴である。"
+)
+
+CHAT_REPLY = (
+    "ご要望に合う画像生成AIとして、Midjourney、Stable Diffusion、DALL·E 3を提案します。"
+    "それぞれの特徴と料金を比較して選択してください（2024年10月時点の情報）。"
+)
+
+
+class UpstreamSettings:
+    def __init__(self, openai_latency=0.5, cse_latency=0.2, article_latency=0.3,
+                 article_pool=50, paragraphs=30, stream_chunk=16,
+                 article_tail_ratio=0.0, article_tail_latency=5.0):
+        self.openai_latency = openai_latency
+        self.cse_latency = cse_latency
+        self.article_latency = article_latency
+        # 記事ページの一部（article_tail_ratioの割合）だけ極端に遅くする（テールレイテンシの再現用）
+        self.article_tail_ratio = article_tail_ratio
+        self.article_tail_latency = article_tail_latency
+        self.article_pool = article_pool
+        self.paragraphs = paragraphs
+        self.stream_chunk = stream_chunk
+        self.counts = {"chat": 0, "completions": 0, "cse": 0, "articles": 0}
+        self._lock = threading.Lock()
+
+    def count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    settings = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path == '/customsearch/v1':
+            self._search(parse_qs(parsed.query).get('q', [''])[0])
+        elif parsed.path.startswith('/articles/'):
+            self._article(parsed.path.rsplit('/', 1)[-1])
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        body = self._read_json()
+        if self.path.endswith('/chat/completions'):
+            self._chat(body)
+        elif self.path.endswith('/completions'):
+            self._completion(body)
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def _search(self, query):
+        settings = self.settings
+        settings.count("cse")
+        time.sleep(settings.cse_latency)
+        # クエリごとに決まった記事の組み合わせを返す
+        seed = int(hashlib.md5(query.encode('utf-8')).hexdigest(), 16)
+        host = f"http://{self.headers['Host']}"
+        items = []
+        for i in range(5):
+            article_id = (seed + i * 7) % settings.article_pool
+            items.append({"title": f"画像生成AI比較記事 {article_id}", "link": f"{host}/articles/{article_id}"})
+        self._send_json({"items": items})
+
+    def _article(self, article_id):
+        settings = self.settings
+        settings.count("articles")
+        if random.random() < settings.article_tail_ratio:
+            time.sleep(settings.article_tail_latency)
+        else:
+            time.sleep(settings.article_latency)
+        paragraphs = "".join(f"<p>{ARTICLE_PARAGRAPH}（第{i}節、記事{article_id}）</p>" for i in range(settings.paragraphs))
+        html = (f"<html lang='ja'><head><meta charset='utf-8'><title>画像生成AI比較記事 {article_id}</title></head>"
+                f"<body><article><h1>画像生成AI比較記事 {article_id}</h1>{paragraphs}</article></body></html>")
+        body = html.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _completion(self, body):
+        # LangChainの検索クエリ生成（旧Completions API）
+        settings = self.settings
+        settings.count("completions")
+        time.sleep(settings.openai_latency / 2)
+        # プロンプトごとに別の検索クエリを返す（--distinct-promptsで検索・記事取得もキャッシュに当たらないように）
+        prompt = body.get("prompt", "")
+        prompt = "".join(prompt) if isinstance(prompt, list) else prompt
+        variant = hashlib.md5(prompt.encode('utf-8')).hexdigest()[:6]
+        self._send_json({
+            "id": "cmpl-bench",
+            "object": "text_completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-3.5-turbo-instruct"),
+            "choices": [{"text": f"画像生成 AI 比較 料金 {variant}", "index": 0, "logprobs": None, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 50, "completion_tokens": 8, "total_tokens": 58},
+        })
+
+    def _chat(self, body):
+        settings = self.settings
+        settings.count("chat")
+        model = body.get("model", "gpt-4o")
+        prompt_tokens = sum(len(m.get("content", "")) for m in body.get("messages", []))
+
+        if not body.get("stream"):
+            time.sleep(settings.openai_latency)
+            self._send_json({
+                "id": "chatcmpl-bench",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": CHAT_REPLY}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(CHAT_REPLY),
+                          "total_tokens": prompt_tokens + len(CHAT_REPLY)},
+            })
+            return
+
+        # ストリーミング応答（最初のトークンまでに遅延の半分、残りをチャンクごとに分散）
+        pieces = [CHAT_REPLY[i:i + settings.stream_chunk] for i in range(0, len(CHAT_REPLY), settings.stream_chunk)]
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        time.sleep(settings.openai_latency / 2)
+        for piece in pieces:
+            chunk = {
+                "id": "chatcmpl-bench",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+            time.sleep(settings.openai_latency / 2 / len(pieces))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(CHAT_REPLY),
+                     "total_tokens": prompt_tokens + len(CHAT_REPLY)}
+            chunk = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model, "choices": [], "usage": usage}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+class _Server(ThreadingHTTPServer):
+    # 数百の同時接続を受けられるよう、待ち受けキューを既定の5から広げる
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+def start_fake_upstreams(settings, host='127.0.0.1', port=0):
+    """上流サーバーをバックグラウンドで起動し、(サーバー, ベースURL) を返す。"""
+    handler = type('FakeUpstreamHandler', (_Handler,), {'settings': settings})
+    server = _Server((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever, name='fake-upstreams', daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
@@ -0,0 +1,67 @@
+# backend/bench/password_hash.py
+"""
+パスワードハッシュの方式・コストごとの所要時間の計測。PASSWORD_HASH_METHODを決める際の目安にする。
+
+使い方（backendディレクトリで実行）:
+    python -m bench.password_hash
+    python -m bench.password_hash --method scrypt:16384:8:1 --method pbkdf2:sha256:600000 --rounds 20
+"""
+import argparse
+import json
+import sys
+import time
+from werkzeug.security import generate_password_hash, check_password_hash
+
+DEFAULT_METHODS = [
+    'scrypt:32768:8:1',
+    'scrypt:16384:8:1',
+    'pbkdf2:sha256:1000000',
+    'pbkdf2:sha256:600000',
+    'pbkdf2:sha256:260000',
+]
+
+
+def measure(method, rounds):
+    password = 'bench-password-0123'
+    hashes, hash_times, check_times = [], [], []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        hashes.append(generate_password_hash(password, method=method))
+        hash_times.append((time.perf_counter() - started) * 1000)
+    for stored in hashes:
+        started = time.perf_counter()
+        check_password_hash(stored, password)
+        check_times.append((time.perf_counter() - started) * 1000)
+    hash_times.sort()
+    check_times.sort()
+    return {
+        "method": method,
+        "hash_ms_p50": hash_times[len(hash_times) // 2],
+        "check_ms_p50": check_times[len(check_times) // 2],
+        "check_ms_max": check_times[-1],
+        # ログイン処理を1コアで直列に行った場合の上限
+        "logins_per_second_per_core": round(1000 / check_times[len(check_times) // 2], 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="パスワードハッシュのコスト計測")
+    parser.add_argument('--method', action='append', help="計測する方式（複数指定可）")
+    parser.add_argument('--rounds', type=int, default=10, help="方式ごとの試行回数")
+    parser.add_argument('--json', action='store_true', help="JSONで出力する")
+    args = parser.parse_args(argv)
+
+    results = [measure(method, args.rounds) for method in (args.method or DEFAULT_METHODS)]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    print(f"{'方式':<26}{'ハッシュ(ms)':>14}{'照合(ms)':>12}{'ログイン/秒/コア':>18}")
+    for result in results:
+        print(f"{result['method']:<26}{result['hash_ms_p50']:>14.1f}{result['check_ms_p50']:>12.1f}"
+              f"{result['logins_per_second_per_core']:>18}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
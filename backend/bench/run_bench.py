@@ -0,0 +1,319 @@
+# backend/bench/run_bench.py
+"""
+チャットパイプラインのオフライン負荷ベンチマーク。
+
+OpenAI・Google CSE・記事ページをローカルの偽サーバーに置き換え、SQLite上のFlaskアプリに
+N人の同時ユーザーからプロンプトを送信する。段階ごとのp50/p95/p99、スループット、DBクエリ数をJSONで出力する。
+--asgiを指定した場合はWSGIのサーバーの代わりにuvicornでASGIモード（asgi.py）のアプリを起動する。
+
+使い方（backendディレクトリで実行）:
+    python -m bench.run_bench --users 20 --requests 5 --output bench.json
+    python -m bench.run_bench --users 20 --requests 5 --compare bench.json
+    python -m bench.run_bench --users 200 --requests 2 --asgi
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .fake_upstreams import UpstreamSettings, start_fake_upstreams
+
+TOPICS = [
+    "ブログ用の画像を作れる生成AIを教えて",
+    "商用利用できる画像生成AIはどれ？",
+    "議事録を要約できるAIサービスを比較して",
+    "動画の字幕を自動生成できるAIは？",
+    "日本語に強い文章生成AIを探しています",
+]
+
+_TIMING_PATTERN = re.compile(r'(\w+)(?:;desc="queries=(\d+)")?;dur=([\d.]+)')
+_OPTIMIZATION_PATTERN = re.compile(r'opt;desc="([^"]*)"')
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else None,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+
+def parse_server_timing(header):
+    """Server-Timingヘッダーを {段階: ミリ秒} と DBクエリ数 に分解する。"""
+    stages, queries = {}, None
+    for name, query_count, duration in _TIMING_PATTERN.findall(header or ''):
+        stages[name] = float(duration)
+        if query_count:
+            queries = int(query_count)
+    return stages, queries
+
+
+def parse_optimizations(header):
+    """Server-Timingのoptから、ターンで効いた最適化を {名前: 回数} で返す。"""
+    match = _OPTIMIZATION_PATTERN.search(header or '')
+    if not match:
+        return {}
+    fired = {}
+    for item in match.group(1).split(','):
+        name, _, count = item.partition('=')
+        fired[name] = int(count or 1)
+    return fired
+
+
+def configure_environment(base_url, workdir, args):
+    # Configは環境変数から読み込まれるため、アプリの読み込み前に設定する
+    os.environ.update({
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'bench.db')}?timeout=30",
+        'JWT_SECRET_KEY': 'bench-secret-key-bench-secret-key',
+        'OPENAI_API_KEY': 'bench',
+        'OPENAI_BASE_URL': f"{base_url}/v1",
+        'OPENAI_FAKE': 'false',
+        'GOOGLE_API_KEY': 'bench',
+        'GOOGLE_CSE_ID': 'bench',
+        'GOOGLE_CSE_ENDPOINT': f"{base_url}/customsearch/v1",
+        'JOB_WORKERS': '0',
+        # 偽の上流にはクォータが無いため、レート制限は--envで指定した場合のみ有効にする
+        'USER_RATE_LIMIT_PER_MINUTE': '0',
+        'CSE_RATE_LIMIT_PER_MINUTE': '0',
+    })
+    for item in args.env:
+        key, _, value = item.partition('=')
+        os.environ[key] = value
+
+
+def _serve_asgi(app):
+    import socket
+    import uvicorn
+    from asgi import create_asgi_app
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    server = uvicorn.Server(uvicorn.Config(create_asgi_app(app), log_level='warning', backlog=2048))
+    threading.Thread(target=server.run, kwargs={'sockets': [sock]}, name='bench-app', daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    def stop():
+        server.should_exit = True
+    return stop, sock.getsockname()[1]
+
+
+def start_app(asgi=False):
+    from werkzeug.serving import make_server
+    from sqlalchemy import event
+    from app import create_app
+    from models import db
+
+    app = create_app()
+    query_count = {"total": 0}
+    lock = threading.Lock()
+
+    def count_query(*_):
+        with lock:
+            query_count["total"] += 1
+
+    with app.app_context():
+        db.create_all()
+        event.listen(db.engine, 'before_cursor_execute', count_query)
+
+    if asgi:
+        stop, port = _serve_asgi(app)
+    else:
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, name='bench-app', daemon=True).start()
+        stop, port = server.shutdown, server.server_port
+    return stop, f"http://127.0.0.1:{port}", query_count
+
+
+def setup_users(session, api, count):
+    users = []
+    for index in range(count):
+        credentials = {"username": f"bench{index}", "email": f"bench{index}@example.com", "password": "bench-password"}
+        session.post(f"{api}/api/auth/register", json=credentials)
+        token = session.post(f"{api}/api/auth/login", json=credentials).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        project = session.post(f"{api}/api/projects/", json={"name": f"bench{index}"}, headers=headers).json()
+        users.append((headers, project["project"]["id"]))
+    return users
+
+
+def run_user(api, user_index, headers, project_id, args, records):
+    import requests
+
+    session = requests.Session()
+    for request_index in range(args.requests):
+        topic = TOPICS[(user_index + request_index) % len(TOPICS)]
+        if args.distinct_prompts:
+            prompt = f"{topic}（ユーザー{user_index}、質問{request_index}）"
+        else:
+            prompt = topic
+        started = time.perf_counter()
+        response = session.post(f"{api}/api/chat/{project_id}", json={"content": prompt}, headers=headers)
+        elapsed = (time.perf_counter() - started) * 1000
+        stages, queries = parse_server_timing(response.headers.get('Server-Timing'))
+        optimizations = parse_optimizations(response.headers.get('Server-Timing'))
+        records.append({
+            "status": response.status_code,
+            "total_ms": elapsed,
+            "stages": stages,
+            "queries": queries,
+            "optimizations": optimizations,
+        })
+
+
+def run(args):
+    import requests
+
+    settings = UpstreamSettings(
+        openai_latency=args.openai_latency,
+        cse_latency=args.cse_latency,
+        article_latency=args.article_latency,
+        article_pool=args.article_pool,
+        article_tail_ratio=args.article_tail_ratio,
+        article_tail_latency=args.article_tail_latency,
+    )
+    upstream, base_url = start_fake_upstreams(settings)
+    workdir = tempfile.mkdtemp(prefix='chat-bench-')
+    configure_environment(base_url, workdir, args)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    stop_app, api, query_count = start_app(asgi=args.asgi)
+    users = setup_users(requests.Session(), api, args.users)
+
+    # 初回の記事解析でのライブラリの読み込みなどを計測から除く
+    for index in range(args.warmup):
+        headers, project_id = users[0]
+        requests.post(f"{api}/api/chat/{project_id}", json={"content": f"ウォームアップ{index}"}, headers=headers)
+    setup_queries = query_count["total"]
+
+    records = []
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as executor:
+        futures = [executor.submit(run_user, api, index, headers, project_id, args, records)
+                   for index, (headers, project_id) in enumerate(users)]
+        for future in futures:
+            future.result()
+    wall = time.perf_counter() - started
+
+    stop_app()
+    upstream.shutdown()
+
+    ok = [record for record in records if record["status"] == 201]
+    stage_names = sorted({name for record in ok for name in record["stages"]})
+    turn_queries = [record["queries"] for record in ok if record["queries"] is not None]
+    return {
+        "config": {
+            "users": args.users,
+            "requests_per_user": args.requests,
+            "openai_latency": args.openai_latency,
+            "cse_latency": args.cse_latency,
+            "article_latency": args.article_latency,
+            "article_tail_ratio": args.article_tail_ratio,
+            "distinct_prompts": args.distinct_prompts,
+            "asgi": args.asgi,
+            "warmup": args.warmup,
+            "env": args.env,
+        },
+        "requests": len(records),
+        "errors": len(records) - len(ok),
+        "wall_seconds": wall,
+        "throughput_rps": len(ok) / wall if wall else None,
+        "latency_ms": {
+            "total": summarize([record["total_ms"] for record in ok]),
+            **{name: summarize([record["stages"][name] for record in ok if name in record["stages"]])
+               for name in stage_names},
+        },
+        "db_queries": {
+            "per_turn": summarize(turn_queries),
+            "total_during_run": query_count["total"] - setup_queries,
+        },
+        "upstream_calls": dict(settings.counts),
+        # 最適化ごとの、効いたターンの数
+        "optimizations": {
+            name: sum(1 for record in ok if name in record["optimizations"])
+            for name in sorted({name for record in ok for name in record["optimizations"]})
+        },
+    }
+
+
+def compare(current, baseline, threshold):
+    """前回の結果と比較して差分を表示し、閾値を超えて悪化した指標の一覧を返す。"""
+    regressions = []
+    print(f"{'指標':<28}{'前回':>12}{'今回':>12}{'変化':>10}")
+    for stage, stats in current["latency_ms"].items():
+        previous = baseline["latency_ms"].get(stage)
+        if not previous:
+            continue
+        for key in ("p50", "p95", "p99"):
+            before, after = previous.get(key), stats.get(key)
+            if not before or after is None:
+                continue
+            change = (after - before) / before * 100
+            print(f"{stage + '.' + key:<28}{before:>12.1f}{after:>12.1f}{change:>+9.1f}%")
+            if stage == "total" and change > threshold:
+                regressions.append(f"{stage}.{key} {change:+.1f}%")
+    before, after = baseline.get("throughput_rps"), current.get("throughput_rps")
+    if before and after:
+        change = (after - before) / before * 100
+        print(f"{'throughput_rps':<28}{before:>12.2f}{after:>12.2f}{change:>+9.1f}%")
+        if -change > threshold:
+            regressions.append(f"throughput {change:+.1f}%")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="チャットパイプラインのオフライン負荷ベンチマーク")
+    parser.add_argument('--users', type=int, default=10, help="同時ユーザー数")
+    parser.add_argument('--requests', type=int, default=3, help="ユーザーごとの送信回数")
+    parser.add_argument('--openai-latency', type=float, default=0.5, help="偽OpenAIの応答遅延（秒）")
+    parser.add_argument('--cse-latency', type=float, default=0.2, help="偽CSEの応答遅延（秒）")
+    parser.add_argument('--article-latency', type=float, default=0.3, help="記事ページの応答遅延（秒）")
+    parser.add_argument('--article-tail-ratio', type=float, default=0.0, help="極端に遅い記事ページの割合")
+    parser.add_argument('--article-tail-latency', type=float, default=5.0, help="極端に遅い記事ページの応答遅延（秒）")
+    parser.add_argument('--article-pool', type=int, default=50, help="記事ページの種類数")
+    parser.add_argument('--distinct-prompts', action='store_true', help="すべてのプロンプトを別々にしてキャッシュを効かせない")
+    parser.add_argument('--warmup', type=int, default=0, help="計測の前に送信するウォームアップのリクエスト数")
+    parser.add_argument('--asgi', action='store_true', help="ASGIモード（uvicorn）でアプリを起動する")
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE', help="アプリに渡す追加の環境変数")
+    parser.add_argument('--output', help="結果のJSONを書き出すファイル")
+    parser.add_argument('--compare', help="比較対象の結果JSON")
+    parser.add_argument('--threshold', type=float, default=10.0, help="悪化とみなす変化率（%%）")
+    args = parser.parse_args(argv)
+
+    result = run(args)
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(result, json.load(f), args.threshold)
+        if regressions:
+            print("性能の悪化を検出しました: " + ", ".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+# backend/bench/startup.py
+"""
+ワーカーの起動時間の計測。
+新しいPythonプロセスでappを読み込み、アプリの作成と最初のリクエストまでの時間を測る。
+起動時に読み込まれた重い依存（LangChain、newspaper3kなど）も合わせて出力する。
+
+使い方（backendディレクトリで実行）:
+    python -m bench.startup --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+HEAVY_MODULES = ['langchain', 'langchain_openai', 'newspaper', 'openai', 'tiktoken', 'selenium', 'nltk']
+
+_SNIPPET = """
+import json, sys, time
+started = time.perf_counter()
+import app as module
+imported = time.perf_counter()
+application = module.create_app() if hasattr(module, 'create_app') else module.app
+created = time.perf_counter()
+application.test_client().get('/metrics')
+first_request = time.perf_counter()
+print(json.dumps({
+    "import_s": imported - started,
+    "create_s": created - imported,
+    "first_request_s": first_request - created,
+    "total_s": first_request - started,
+    "heavy_modules": [name for name in %r if name in sys.modules],
+}))
+"""
+
+
+def run_once(backend_dir, env):
+    output = subprocess.run(
+        [sys.executable, '-c', _SNIPPET % (HEAVY_MODULES,)],
+        cwd=backend_dir, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ワーカーの起動時間の計測")
+    parser.add_argument('--runs', type=int, default=5, help="計測回数")
+    parser.add_argument('--json', action='store_true', help="JSONで出力する")
+    args = parser.parse_args(argv)
+
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    workdir = tempfile.mkdtemp(prefix='startup-bench-')
+    env = {
+        **os.environ,
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'startup.db')}",
+        'JWT_SECRET_KEY': 'startup-bench-secret-key-0123456789',
+        'OPENAI_API_KEY': 'startup-bench',
+        'JOB_WORKERS': '0',
+    }
+
+    # 1回目はバイトコードの作成などを含むため捨てる
+    run_once(backend_dir, env)
+    runs = [run_once(backend_dir, env) for _ in range(args.runs)]
+
+    result = {
+        key: statistics.median([run[key] for run in runs])
+        for key in ("import_s", "create_s", "first_request_s", "total_s")
+    }
+    result["heavy_modules"] = runs[-1]["heavy_modules"]
+    result["runs"] = args.runs
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        for key in ("import_s", "create_s", "first_request_s", "total_s"):
+            print(f"{key:<18}{result[key] * 1000:>10.1f} ms")
+        print(f"{'heavy_modules':<18}{', '.join(result['heavy_modules']) or '-'}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
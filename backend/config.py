@@ -3,7 +3,174 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+def _env_bool(name, default=False):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
 class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY')
+
+    # パスワードハッシュの方式とコスト（werkzeugの形式、例: scrypt:32768:8:1, pbkdf2:sha256:600000）
+    # 変更した場合、既存ユーザーのハッシュは次回ログイン時に作り直される（bench/password_hash.pyで計測）
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+
+    # ユーザー→所有プロジェクトIDのキャッシュ（認証済みリクエストの所有確認用、TTLは秒）
+    PROJECT_OWNERSHIP_CACHE_SIZE = int(os.getenv('PROJECT_OWNERSHIP_CACHE_SIZE', 10000))
+    PROJECT_OWNERSHIP_CACHE_TTL = int(os.getenv('PROJECT_OWNERSHIP_CACHE_TTL', 30))
+
+    # 外部APIのキー
+    OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+    GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
+    GOOGLE_CSE_ID = os.getenv('GOOGLE_CSE_ID')
+
+    # 記事取得の並列数とタイムアウト（秒）
+    ARTICLE_FETCH_WORKERS = int(os.getenv('ARTICLE_FETCH_WORKERS', 5))
+    ARTICLE_FETCH_TIMEOUT = float(os.getenv('ARTICLE_FETCH_TIMEOUT', 10))
+    ARTICLE_FETCH_DEADLINE = float(os.getenv('ARTICLE_FETCH_DEADLINE', 20))
+
+    # 本文を取得できた記事がこの件数に達したら残りの取得を待たない（0ですべて待つ）
+    # 残りの取得はそのまま続け、終わり次第記事キャッシュに入れる
+    ARTICLE_FETCH_SUFFICIENT = int(os.getenv('ARTICLE_FETCH_SUFFICIENT', 3))
+
+    # 記事取得のヘッジ：最近の取得時間のパーセンタイルを過ぎても終わらない取得は同じURLをもう1本取得し、
+    # 先に終わった方を使う（取得時間の記録が少ないうちはヘッジしない）
+    ARTICLE_FETCH_HEDGE = _env_bool('ARTICLE_FETCH_HEDGE', True)
+    ARTICLE_FETCH_HEDGE_PERCENTILE = float(os.getenv('ARTICLE_FETCH_HEDGE_PERCENTILE', 95))
+    ARTICLE_FETCH_HEDGE_MIN_DELAY = float(os.getenv('ARTICLE_FETCH_HEDGE_MIN_DELAY', 0.5))
+    ARTICLE_FETCH_HEDGE_MAX_PER_TURN = int(os.getenv('ARTICLE_FETCH_HEDGE_MAX_PER_TURN', 2))
+    ARTICLE_FETCH_HEDGE_WORKERS = int(os.getenv('ARTICLE_FETCH_HEDGE_WORKERS', 4))
+
+    # 記事の取得中に会話履歴のみのコンテキストで応答の生成を先に始める（オプトイン、ストリーミング以外）
+    # 記事の取得をFETCH_BUDGET秒で打ち切り、本文を1件も取得できなかった場合に先行した応答を使う。
+    # 記事を取得できた場合は先行した応答を破棄するが、同期モードでは実行中のOpenAIの呼び出しは止められないため、
+    # 破棄した生成も完了までトークン・スレッド・OpenAIの同時呼び出し数の枠を消費する
+    # （chat_speculative_completions_total{outcome="discarded"}で確認できる）。
+    # 同時に先行生成するターンはPIPELINE_SPECULATIVE_WORKERS件までで、枠が空いていない場合は先行生成しない
+    PIPELINE_SPECULATIVE_COMPLETION = _env_bool('PIPELINE_SPECULATIVE_COMPLETION')
+    PIPELINE_SPECULATIVE_FETCH_BUDGET = float(os.getenv('PIPELINE_SPECULATIVE_FETCH_BUDGET', 5))
+    PIPELINE_SPECULATIVE_WORKERS = int(os.getenv('PIPELINE_SPECULATIVE_WORKERS', 4))
+
+    # Seleniumフォールバック用ブラウザプール（BROWSER_DRIVER=stubでオフライン動作）
+    BROWSER_DRIVER = os.getenv('BROWSER_DRIVER', 'chrome')
+    BROWSER_POOL_SIZE = int(os.getenv('BROWSER_POOL_SIZE', 2))
+    BROWSER_MAX_PAGES_PER_SESSION = int(os.getenv('BROWSER_MAX_PAGES_PER_SESSION', 50))
+    BROWSER_LEASE_TIMEOUT = float(os.getenv('BROWSER_LEASE_TIMEOUT', 30))
+
+    # 記事本文キャッシュ（TTLは秒、fetched_atからの経過時間で判定）
+    ARTICLE_CACHE_SIZE = int(os.getenv('ARTICLE_CACHE_SIZE', 512))
+    ARTICLE_CACHE_TTL = int(os.getenv('ARTICLE_CACHE_TTL', 86400))
+    ARTICLE_CACHE_REFRESH_WORKERS = int(os.getenv('ARTICLE_CACHE_REFRESH_WORKERS', 2))
+
+    # 記事本文の圧縮方式（'zstd'はzstandardが必要、無い場合は'zlib'）。レベルは未指定なら方式の既定値
+    ARTICLE_COMPRESSION = os.getenv('ARTICLE_COMPRESSION', 'zstd')
+    ARTICLE_COMPRESSION_LEVEL = int(os.getenv('ARTICLE_COMPRESSION_LEVEL')) if os.getenv('ARTICLE_COMPRESSION_LEVEL') else None
+
+    # 検索クエリ・検索結果キャッシュ（DB層は複数ワーカー間での共有用）
+    SEARCH_CACHE_SIZE = int(os.getenv('SEARCH_CACHE_SIZE', 1024))
+    SEARCH_QUERY_CACHE_TTL = int(os.getenv('SEARCH_QUERY_CACHE_TTL', 86400))
+    SEARCH_RESULT_CACHE_TTL = int(os.getenv('SEARCH_RESULT_CACHE_TTL', 21600))
+    SEARCH_CACHE_DB_TIER = _env_bool('SEARCH_CACHE_DB_TIER')
+    # 空の結果をプロセス内に保持する秒数（DBには書かない）
+    SEARCH_EMPTY_RESULT_CACHE_TTL = int(os.getenv('SEARCH_EMPTY_RESULT_CACHE_TTL', 300))
+    # DB層の期限切れエントリを削除する間隔（秒）と1回に削除する最大件数
+    SEARCH_CACHE_PRUNE_INTERVAL = int(os.getenv('SEARCH_CACHE_PRUNE_INTERVAL', 600))
+    SEARCH_CACHE_PRUNE_BATCH = int(os.getenv('SEARCH_CACHE_PRUNE_BATCH', 500))
+
+    # OpenAIのダミークライアントを使用（オフライン検証用）
+    OPENAI_FAKE = _env_bool('OPENAI_FAKE')
+
+    # 似たプロンプトへの応答キャッシュ（オプトイン、閾値はbigramのコサイン類似度）
+    # 同じプロジェクト内で、会話の要約と直近CONTEXT_MESSAGES件の会話が同じ場合のみ再利用する
+    RESPONSE_CACHE_ENABLED = _env_bool('RESPONSE_CACHE_ENABLED')
+    RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 500))
+    RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 3600))
+    RESPONSE_CACHE_THRESHOLD = float(os.getenv('RESPONSE_CACHE_THRESHOLD', 0.85))
+    RESPONSE_CACHE_CONTEXT_MESSAGES = int(os.getenv('RESPONSE_CACHE_CONTEXT_MESSAGES', 4))
+
+    # チャット補完に渡すコンテキストのトークン予算
+    CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', 12000))
+    CONTEXT_ARTICLE_TOKEN_BUDGET = int(os.getenv('CONTEXT_ARTICLE_TOKEN_BUDGET', 6000))
+    CONTEXT_RECENT_MESSAGES = int(os.getenv('CONTEXT_RECENT_MESSAGES', 10))
+    CONTEXT_SUMMARY_MODEL = os.getenv('CONTEXT_SUMMARY_MODEL', 'gpt-4o-mini')
+    CONTEXT_SUMMARY_MAX_TOKENS = int(os.getenv('CONTEXT_SUMMARY_MAX_TOKENS', 500))
+
+    # 記事チャンクの分割サイズと、コンテキストに含める上位チャンク数
+    CHUNK_MAX_TOKENS = int(os.getenv('CHUNK_MAX_TOKENS', 300))
+    CHUNK_TOP_K = int(os.getenv('CHUNK_TOP_K', 12))
+
+    # 記事の重複判定（MinHashで推定したJaccard係数の閾値）
+    ARTICLE_DEDUP_THRESHOLD = float(os.getenv('ARTICLE_DEDUP_THRESHOLD', 0.8))
+
+    # チャット履歴のページサイズ
+    CHAT_HISTORY_PAGE_SIZE = int(os.getenv('CHAT_HISTORY_PAGE_SIZE', 50))
+    CHAT_HISTORY_MAX_PAGE_SIZE = int(os.getenv('CHAT_HISTORY_MAX_PAGE_SIZE', 200))
+
+    # 全文検索の1ページあたりの件数
+    SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', 20))
+    SEARCH_MAX_PAGE_SIZE = int(os.getenv('SEARCH_MAX_PAGE_SIZE', 100))
+
+    # プロジェクト削除時に1トランザクションで削除するメッセージ数
+    PROJECT_DELETE_BATCH_SIZE = int(os.getenv('PROJECT_DELETE_BATCH_SIZE', 1000))
+
+    # どのメッセージからも参照されない記事の削除（間隔・猶予は秒、ARTICLE_GC_INTERVAL=0で起動しない）
+    ARTICLE_GC_INTERVAL = int(os.getenv('ARTICLE_GC_INTERVAL', 3600))
+    ARTICLE_GC_BATCH_SIZE = int(os.getenv('ARTICLE_GC_BATCH_SIZE', 500))
+    ARTICLE_GC_GRACE = int(os.getenv('ARTICLE_GC_GRACE', 3600))
+
+    # AI応答ジョブキュー（JOB_WORKERS=0でこのプロセスではワーカーを起動しない）
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+    JOB_MAX_RUNNING_PER_USER = int(os.getenv('JOB_MAX_RUNNING_PER_USER', 1))
+    JOB_MAX_QUEUED_PER_USER = int(os.getenv('JOB_MAX_QUEUED_PER_USER', 5))
+    JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+    JOB_RETRY_BACKOFF = float(os.getenv('JOB_RETRY_BACKOFF', 2.0))
+    JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1.0))
+    JOB_STALE_AFTER = int(os.getenv('JOB_STALE_AFTER', 600))
+    # 待機ジョブ数が上限の場合に返すRetry-After（秒）
+    JOB_QUEUE_FULL_RETRY_AFTER = int(os.getenv('JOB_QUEUE_FULL_RETRY_AFTER', 10))
+
+    # トークンバケットによるレート制限（1分あたりの回数と瞬間的に許容する回数、0で制限しない）
+    # ユーザーごとのチャット送信と、上流（OpenAI・Google CSE）への呼び出しに適用する
+    # RATE_LIMIT_DB_TIER=trueの場合はバケットをDBに置き、複数ワーカーで共有する
+    USER_RATE_LIMIT_PER_MINUTE = float(os.getenv('USER_RATE_LIMIT_PER_MINUTE', 20))
+    USER_RATE_LIMIT_BURST = int(os.getenv('USER_RATE_LIMIT_BURST', 10))
+    OPENAI_RATE_LIMIT_PER_MINUTE = float(os.getenv('OPENAI_RATE_LIMIT_PER_MINUTE', 0))
+    OPENAI_RATE_LIMIT_BURST = int(os.getenv('OPENAI_RATE_LIMIT_BURST', 50))
+    CSE_RATE_LIMIT_PER_MINUTE = float(os.getenv('CSE_RATE_LIMIT_PER_MINUTE', 100))
+    CSE_RATE_LIMIT_BURST = int(os.getenv('CSE_RATE_LIMIT_BURST', 20))
+    RATE_LIMIT_DB_TIER = _env_bool('RATE_LIMIT_DB_TIER')
+    # プロセス内のバケットの数の目安（超えた場合は満杯に戻ったバケットのみ削除する）
+    RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', 10000))
+
+    # 上流への同時呼び出し数（プロセスごと）、トークン・空きを待つ上限（秒）、429・5xxの再試行
+    OPENAI_MAX_CONCURRENCY = int(os.getenv('OPENAI_MAX_CONCURRENCY', 200))
+    CSE_MAX_CONCURRENCY = int(os.getenv('CSE_MAX_CONCURRENCY', 20))
+    UPSTREAM_MAX_WAIT = float(os.getenv('UPSTREAM_MAX_WAIT', 10))
+    UPSTREAM_MAX_RETRIES = int(os.getenv('UPSTREAM_MAX_RETRIES', 3))
+    UPSTREAM_RETRY_BASE = float(os.getenv('UPSTREAM_RETRY_BASE', 0.5))
+    UPSTREAM_RETRY_MAX = float(os.getenv('UPSTREAM_RETRY_MAX', 8))
+
+    # 外部サービスの接続先・接続プール・タイムアウト（秒）
+    OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL') or None
+    OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', 60))
+    OPENAI_CONNECT_TIMEOUT = float(os.getenv('OPENAI_CONNECT_TIMEOUT', 5))
+    OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', 20))
+    OPENAI_MAX_KEEPALIVE = int(os.getenv('OPENAI_MAX_KEEPALIVE', 10))
+    GOOGLE_CSE_ENDPOINT = os.getenv('GOOGLE_CSE_ENDPOINT', 'https://www.googleapis.com/customsearch/v1')
+    CSE_TIMEOUT = float(os.getenv('CSE_TIMEOUT', 10))
+    HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', 20))
+    HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', 10))
+    HTTP_USER_AGENT = os.getenv('HTTP_USER_AGENT', 'Mozilla/5.0 (compatible; ai-chat-service)')
+
+    # ASGIモード（uvicorn asgi:app）の非同期クライアントの接続数とスレッド数
+    # ASGI_THREADSはDBアクセスとHTML解析用、ASGI_WSGI_WORKERSはFlaskのまま提供するルート用
+    ASYNC_OPENAI_MAX_CONNECTIONS = int(os.getenv('ASYNC_OPENAI_MAX_CONNECTIONS', 200))
+    ASYNC_HTTP_MAX_CONNECTIONS = int(os.getenv('ASYNC_HTTP_MAX_CONNECTIONS', 200))
+    ASGI_THREADS = int(os.getenv('ASGI_THREADS', 32))
+    ASGI_WSGI_WORKERS = int(os.getenv('ASGI_WSGI_WORKERS', 16))
+
+    # ログレベル（DEBUGで検索結果などの詳細を出力）
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
@@ -0,0 +1,29 @@
+"""rate limit buckets
+
+Revision ID: 04b6cd0871ec
+Revises: 685f1a59d1e5
+Create Date: 2026-10-18 09:59:55.826439
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '04b6cd0871ec'
+down_revision = '685f1a59d1e5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('rate_limit_bucket',
+    sa.Column('key', sa.String(length=100), nullable=False),
+    sa.Column('tokens', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+
+
+def downgrade():
+    op.drop_table('rate_limit_bucket')
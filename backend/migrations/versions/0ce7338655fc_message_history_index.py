@@ -0,0 +1,26 @@
+"""message history index
+
+Revision ID: 0ce7338655fc
+Revises: 22502f26237e
+Create Date: 2026-10-18 09:59:48.706055
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0ce7338655fc'
+down_revision = '22502f26237e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.create_index('ix_message_project_created', ['project_id', 'created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.drop_index('ix_message_project_created')
@@ -0,0 +1,32 @@
+"""article chunk indexes
+
+Revision ID: 22502f26237e
+Revises: 5aa7aeefb5dd
+Create Date: 2026-10-18 09:59:47.187537
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '22502f26237e'
+down_revision = '5aa7aeefb5dd'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('article_chunk_index',
+    sa.Column('article_id', sa.Integer(), nullable=False),
+    sa.Column('content_hash', sa.String(length=40), nullable=False),
+    sa.Column('chunks', sa.JSON(), nullable=False),
+    sa.Column('terms', sa.JSON(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['article_id'], ['article.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('article_id')
+    )
+
+
+def downgrade():
+    op.drop_table('article_chunk_index')
@@ -0,0 +1,33 @@
+"""project summaries
+
+Revision ID: 5aa7aeefb5dd
+Revises: db69c4638775
+Create Date: 2026-10-18 09:59:45.646379
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5aa7aeefb5dd'
+down_revision = 'db69c4638775'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('project_summary',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('project_id', sa.Integer(), nullable=False),
+    sa.Column('summary', sa.Text(), nullable=False),
+    sa.Column('last_message_id', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['project_id'], ['project.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('project_id')
+    )
+
+
+def downgrade():
+    op.drop_table('project_summary')
@@ -0,0 +1,62 @@
+"""full-text search documents
+
+Revision ID: 5c9a514c4d33
+Revises: c5d8bdac6959
+Create Date: 2026-10-18 09:59:51.693638
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c9a514c4d33'
+down_revision = 'c5d8bdac6959'
+branch_labels = None
+depends_on = None
+
+
+# SQLite用の全文検索テーブル（search_documentを外部コンテンツとし、挿入・削除をトリガーで反映）。models.pyと同じ定義
+SQLITE_FTS = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_document_fts "
+    "USING fts5(terms, content='search_document', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS search_document_ai AFTER INSERT ON search_document BEGIN "
+    "INSERT INTO search_document_fts(rowid, terms) VALUES (new.id, new.terms); END",
+    "CREATE TRIGGER IF NOT EXISTS search_document_ad AFTER DELETE ON search_document BEGIN "
+    "INSERT INTO search_document_fts(search_document_fts, rowid, terms) VALUES ('delete', old.id, old.terms); END",
+    "CREATE TRIGGER IF NOT EXISTS search_document_au AFTER UPDATE ON search_document BEGIN "
+    "INSERT INTO search_document_fts(search_document_fts, rowid, terms) VALUES ('delete', old.id, old.terms); "
+    "INSERT INTO search_document_fts(rowid, terms) VALUES (new.id, new.terms); END",
+)
+
+
+def upgrade():
+    op.create_table('search_document',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('message_id', sa.Integer(), nullable=True),
+    sa.Column('article_id', sa.Integer(), nullable=True),
+    sa.Column('terms', sa.Text(), nullable=False),
+    sa.ForeignKeyConstraint(['article_id'], ['article.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['message_id'], ['message.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('article_id'),
+    sa.UniqueConstraint('message_id')
+    )
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.create_index(
+            'ix_search_document_terms', 'search_document', [sa.text("to_tsvector('simple', terms)")],
+            postgresql_using='gin',
+        )
+    elif dialect == 'sqlite':
+        for statement in SQLITE_FTS:
+            op.execute(statement)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.drop_index('ix_search_document_terms', table_name='search_document')
+    elif dialect == 'sqlite':
+        op.execute("DROP TABLE IF EXISTS search_document_fts")
+    op.drop_table('search_document')
@@ -0,0 +1,55 @@
+"""cascade article links
+
+Revision ID: 685f1a59d1e5
+Revises: 91c9c99ec6ac
+Create Date: 2026-10-18 09:59:54.483139
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '685f1a59d1e5'
+down_revision = '91c9c99ec6ac'
+branch_labels = None
+depends_on = None
+
+
+def _article_message(ondelete):
+    metadata = sa.MetaData()
+    sa.Table('article', metadata, sa.Column('id', sa.Integer(), primary_key=True))
+    sa.Table('message', metadata, sa.Column('id', sa.Integer(), primary_key=True))
+    return sa.Table('article_message', metadata,
+        sa.Column('article_id', sa.Integer(), sa.ForeignKey('article.id', ondelete=ondelete), primary_key=True),
+        sa.Column('message_id', sa.Integer(), sa.ForeignKey('message.id', ondelete=ondelete), primary_key=True),
+    )
+
+
+def _set_ondelete(ondelete):
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        # SQLiteは外部キーを変更できない（名前も無い）ため、テーブルを作り直して行を移す
+        with op.batch_alter_table('article_message', copy_from=_article_message(ondelete), recreate='always'):
+            pass
+        return
+    names = {
+        tuple(fk['constrained_columns']): fk['name']
+        for fk in sa.inspect(bind).get_foreign_keys('article_message')
+    }
+    for column, referent in (('article_id', 'article'), ('message_id', 'message')):
+        op.drop_constraint(names[(column,)], 'article_message', type_='foreignkey')
+        op.create_foreign_key(
+            f'article_message_{column}_fkey', 'article_message', referent, [column], ['id'], ondelete=ondelete,
+        )
+
+
+def upgrade():
+    # メッセージ・記事の削除時にDB側で関連付けも削除する
+    _set_ondelete('CASCADE')
+    op.create_index('ix_article_message_message_id', 'article_message', ['message_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_article_message_message_id', table_name='article_message')
+    _set_ondelete(None)
@@ -0,0 +1,43 @@
+"""article fingerprints and lsh bands
+
+Revision ID: 91c9c99ec6ac
+Revises: 5c9a514c4d33
+Create Date: 2026-10-18 09:59:53.094876
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '91c9c99ec6ac'
+down_revision = '5c9a514c4d33'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('article', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('fingerprint', sa.LargeBinary(), nullable=True))
+        batch_op.add_column(sa.Column('canonical_id', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_article_canonical_id'), ['canonical_id'], unique=False)
+        batch_op.create_foreign_key(
+            'article_canonical_id_fkey', 'article', ['canonical_id'], ['id'], ondelete='SET NULL',
+        )
+
+    op.create_table('article_lsh_band',
+    sa.Column('bucket', sa.String(length=20), nullable=False),
+    sa.Column('article_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['article_id'], ['article.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('bucket', 'article_id')
+    )
+
+
+def downgrade():
+    op.drop_table('article_lsh_band')
+
+    with op.batch_alter_table('article', schema=None) as batch_op:
+        batch_op.drop_constraint('article_canonical_id_fkey', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_article_canonical_id'))
+        batch_op.drop_column('canonical_id')
+        batch_op.drop_column('fingerprint')
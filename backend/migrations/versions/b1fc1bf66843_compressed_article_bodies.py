@@ -0,0 +1,34 @@
+"""compressed article bodies
+
+Revision ID: b1fc1bf66843
+Revises: 04b6cd0871ec
+Create Date: 2026-10-18 09:59:57.207568
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b1fc1bf66843'
+down_revision = '04b6cd0871ec'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 本文は圧縮してbodyに保存する。既存の行のcontentはflask --app app compress-articlesでbodyに移す
+    with op.batch_alter_table('article', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('body', sa.LargeBinary(), nullable=True))
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=40), nullable=True))
+        batch_op.add_column(sa.Column('content_size', sa.Integer(), nullable=True))
+        batch_op.alter_column('content', existing_type=sa.Text(), nullable=True)
+
+
+def downgrade():
+    # compress-articlesで移した行はcontentが空のため、先に本文を戻しておく必要がある
+    with op.batch_alter_table('article', schema=None) as batch_op:
+        batch_op.alter_column('content', existing_type=sa.Text(), nullable=False)
+        batch_op.drop_column('content_size')
+        batch_op.drop_column('content_hash')
+        batch_op.drop_column('body')
@@ -0,0 +1,48 @@
+"""chat jobs
+
+Revision ID: c5d8bdac6959
+Revises: 0ce7338655fc
+Create Date: 2026-10-18 09:59:50.303781
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d8bdac6959'
+down_revision = '0ce7338655fc'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('chat_job',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('project_id', sa.Integer(), nullable=False),
+    sa.Column('prompt', sa.Text(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('cancel_requested', sa.Boolean(), nullable=False),
+    sa.Column('result', sa.JSON(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['project_id'], ['project.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('chat_job', schema=None) as batch_op:
+        batch_op.create_index('ix_chat_job_status_next_attempt', ['status', 'next_attempt_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_chat_job_user_id'), ['user_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('chat_job', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_chat_job_user_id'))
+        batch_op.drop_index('ix_chat_job_status_next_attempt')
+
+    op.drop_table('chat_job')
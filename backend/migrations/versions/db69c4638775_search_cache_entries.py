@@ -0,0 +1,37 @@
+"""search cache entries
+
+Revision ID: db69c4638775
+Revises: 951cc213ea8e
+Create Date: 2026-10-18 09:59:44.200404
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'db69c4638775'
+down_revision = '951cc213ea8e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('search_cache_entry',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('cache_key', sa.String(length=64), nullable=False),
+    sa.Column('value', sa.Text(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('kind', 'cache_key', name='uix_search_cache_kind_key')
+    )
+    with op.batch_alter_table('search_cache_entry', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_search_cache_entry_expires_at'), ['expires_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('search_cache_entry', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_search_cache_entry_expires_at'))
+
+    op.drop_table('search_cache_entry')
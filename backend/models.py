@@ -1,13 +1,30 @@
+import sqlite3
+from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event
+from sqlalchemy.engine import Engine
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+from functools import lru_cache
 
 db = SQLAlchemy()
 
-# アソシエーションテーブルの定義
+
+# SQLiteは外部キー制約（ON DELETE CASCADEを含む）を接続ごとに有効にする必要がある
+@event.listens_for(Engine, 'connect')
+def _enable_sqlite_foreign_keys(dbapi_connection, _connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+
+# アソシエーションテーブルの定義（メッセージ・記事の削除時にDB側で関連付けも削除する）
 article_message = db.Table('article_message',
-    db.Column('article_id', db.Integer, db.ForeignKey('article.id'), primary_key=True),
-    db.Column('message_id', db.Integer, db.ForeignKey('message.id'), primary_key=True)
+    db.Column('article_id', db.Integer, db.ForeignKey('article.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('message_id', db.Integer, db.ForeignKey('message.id', ondelete='CASCADE'), primary_key=True),
+    # メッセージの削除時（ON DELETE CASCADE）に関連付けを探す用
+    db.Index('ix_article_message_message_id', 'message_id'),
 )
 
 class User(db.Model):
@@ -19,11 +36,20 @@ class User(db.Model):
     projects = db.relationship('Project', backref='user', lazy=True)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, method=current_app.config['PASSWORD_HASH_METHOD'])
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+    def needs_rehash(self):
+        """保存済みのハッシュがアプリの設定（PASSWORD_HASH_METHOD）と異なる方式・コストで作られているか。"""
+        return self.password_hash.split('$', 1)[0] != _password_hash_prefix(current_app.config['PASSWORD_HASH_METHOD'])
+
+@lru_cache(maxsize=None)
+def _password_hash_prefix(method):
+    # "scrypt"のような省略形を、ハッシュに記録される "scrypt:32768:8:1" の形に展開する
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
 class Project(db.Model):
     __tablename__ = 'project'
 
@@ -48,15 +74,133 @@ class Message(db.Model):
     # 多対多のリレーションシップ
     articles = db.relationship('Article', secondary=article_message, backref=db.backref('messages', lazy='dynamic'))
 
+    __table_args__ = (
+        # チャット履歴の取得（プロジェクト内の作成日時順）用
+        db.Index('ix_message_project_created', 'project_id', 'created_at'),
+    )
+
 class Article(db.Model):
     __tablename__ = 'article'
 
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(255), nullable=False)
     url = db.Column(db.String(500), nullable=False, unique=True)  # URLで一意性を確保
-    content = db.Column(db.Text, nullable=False)
+    # 本文は圧縮して保存し（services/compression.py）、一覧などで記事を読み込む際は読み込まない
+    body = db.deferred(db.Column(db.LargeBinary))
+    content_hash = db.Column(db.String(40))  # 本文のSHA-1
+    content_size = db.Column(db.Integer)  # 圧縮前の本文のバイト数（UTF-8）
+    legacy_content = db.deferred(db.Column('content', db.Text))  # 圧縮前の本文（compress-articlesでbodyに移行する）
     fetched_at = db.Column(db.DateTime, default=datetime.now)
+    fingerprint = db.deferred(db.Column(db.LargeBinary))  # 本文のMinHash署名（services/dedup.py）
+    canonical_id = db.Column(db.Integer, db.ForeignKey('article.id', ondelete='SET NULL'), index=True)  # 同内容の正規の記事
 
     __table_args__ = (
         db.UniqueConstraint('title', 'url', name='uix_title_url'),
-    )
\ No newline at end of file
+    )
+
+class ArticleLshBand(db.Model):
+    """正規の記事のMinHash署名をバンドに分割したバケット（類似記事の候補検索用）。"""
+    __tablename__ = 'article_lsh_band'
+
+    bucket = db.Column(db.String(20), primary_key=True)  # "バンド番号:ハッシュ"
+    article_id = db.Column(db.Integer, db.ForeignKey('article.id', ondelete='CASCADE'), primary_key=True)
+
+class SearchCacheEntry(db.Model):
+    __tablename__ = 'search_cache_entry'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # 'query' または 'results'
+    cache_key = db.Column(db.String(64), nullable=False)
+    value = db.Column(db.Text, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('kind', 'cache_key', name='uix_search_cache_kind_key'),
+    )
+
+
+class RateLimitBucket(db.Model):
+    __tablename__ = 'rate_limit_bucket'
+
+    # 複数ワーカー間で共有するトークンバケット（services/rate_limit.py、RATE_LIMIT_DB_TIER=true）
+    key = db.Column(db.String(100), primary_key=True)  # 'user:1'、'openai' など
+    tokens = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.Float, nullable=False)  # UNIX時刻（秒）
+
+
+class ProjectSummary(db.Model):
+    __tablename__ = 'project_summary'
+
+    id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id', ondelete='CASCADE'), nullable=False, unique=True)
+    summary = db.Column(db.Text, nullable=False, default='')
+    last_message_id = db.Column(db.Integer, nullable=False, default=0)  # 要約に含めた最後のメッセージID
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class ArticleChunkIndex(db.Model):
+    __tablename__ = 'article_chunk_index'
+
+    article_id = db.Column(db.Integer, db.ForeignKey('article.id', ondelete='CASCADE'), primary_key=True)
+    content_hash = db.Column(db.String(40), nullable=False)  # 本文が更新された場合に作り直すためのハッシュ
+    chunks = db.Column(db.JSON, nullable=False)
+    terms = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
+
+class ChatJob(db.Model):
+    __tablename__ = 'chat_job'
+
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id', ondelete='CASCADE'), nullable=False)
+    prompt = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued/running/succeeded/failed/cancelled
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.now)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_chat_job_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+
+class SearchDocument(db.Model):
+    """
+    全文検索の索引対象（メッセージまたは記事）。termsはtokenizer.tokenizeのトークンを空白区切りにしたもの。
+    PostgreSQLではtermsのtsvectorにGIN索引を張り、SQLiteではFTS5の仮想テーブルをトリガーで同期する。
+    """
+    __tablename__ = 'search_document'
+
+    id = db.Column(db.Integer, primary_key=True)
+    message_id = db.Column(db.Integer, db.ForeignKey('message.id', ondelete='CASCADE'), unique=True)
+    article_id = db.Column(db.Integer, db.ForeignKey('article.id', ondelete='CASCADE'), unique=True)
+    terms = db.Column(db.Text, nullable=False)
+
+    __table_args__ = (
+        db.Index(
+            'ix_search_document_terms',
+            db.text("to_tsvector('simple', terms)"),
+            postgresql_using='gin',
+        ).ddl_if(dialect='postgresql'),
+    )
+
+
+# SQLite用の全文検索テーブル（search_documentを外部コンテンツとし、挿入・削除をトリガーで反映）
+for _statement in (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_document_fts "
+    "USING fts5(terms, content='search_document', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS search_document_ai AFTER INSERT ON search_document BEGIN "
+    "INSERT INTO search_document_fts(rowid, terms) VALUES (new.id, new.terms); END",
+    "CREATE TRIGGER IF NOT EXISTS search_document_ad AFTER DELETE ON search_document BEGIN "
+    "INSERT INTO search_document_fts(search_document_fts, rowid, terms) VALUES ('delete', old.id, old.terms); END",
+    "CREATE TRIGGER IF NOT EXISTS search_document_au AFTER UPDATE ON search_document BEGIN "
+    "INSERT INTO search_document_fts(search_document_fts, rowid, terms) VALUES ('delete', old.id, old.terms); "
+    "INSERT INTO search_document_fts(rowid, terms) VALUES (new.id, new.terms); END",
+):
+    event.listen(SearchDocument.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
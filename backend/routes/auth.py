@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
 from models import db, User
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, unset_jwt_cookies
 
 auth_bp = Blueprint('auth', __name__)
@@ -13,14 +14,23 @@ def register():
     email = data.get('email')
     password = data.get('password')
 
-    if User.query.filter_by(email=email).first() or User.query.filter_by(username=username).first():
+    # メールアドレスとユーザー名の重複を1回のクエリで確認
+    exists = db.session.query(
+        User.query.filter(or_(User.email == email, User.username == username)).exists()
+    ).scalar()
+    if exists:
         return jsonify({"message": "ユーザー名またはメールアドレスは既に登録されています"}), 400
 
     new_user = User(username=username, email=email)
     new_user.set_password(password)
 
     db.session.add(new_user)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # 確認後に同時に登録された場合
+        db.session.rollback()
+        return jsonify({"message": "ユーザー名またはメールアドレスは既に登録されています"}), 400
 
     return jsonify({"message": "ユーザー登録が完了しました"}), 201
 
@@ -35,6 +45,11 @@ def login():
     if not user or not user.check_password(password):
         return jsonify({"message": "メールアドレスまたはパスワードが間違っています"}), 401
 
+    # ハッシュの設定が変わった場合は、平文のパスワードが分かるログイン時に新しい設定で作り直す
+    if user.needs_rehash():
+        user.set_password(password)
+        db.session.commit()
+
     access_token = create_access_token(identity={'id': user.id, 'username': user.username})
     return jsonify(access_token=access_token), 200
 
@@ -1,23 +1,78 @@
 # backend/routes/chat.py
-from flask import Blueprint, request, jsonify
+import json
+from contextlib import closing
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, Message, Project
+from sqlalchemy import func, or_, and_
+from sqlalchemy.orm import selectinload
+from models import db, Article, Message, ChatJob
+from services.job_queue import job_queue, JobQueueFull
+from services.persistence import index_messages
+from services.ownership import project_ownership
+from services.rate_limit import rate_limiter, RateLimited
+from config import Config
 from services.openai_service import get_ai_response_with_search as get_ai_response
+from services.openai_service import stream_ai_response_with_search as stream_ai_response
 from datetime import datetime
 
 chat_bp = Blueprint('chat', __name__)
 
-# チャット履歴の取得
+TOO_MANY_REQUESTS = "リクエストが多すぎます。しばらくしてから再度お試しください"
+QUEUE_FULL = "処理中の" + TOO_MANY_REQUESTS
+
+def too_many_requests(message, retry_after):
+    # レート制限による拒否（Retry-Afterヘッダーで再試行までの秒数を返す）
+    response = jsonify({"message": message})
+    response.headers['Retry-After'] = retry_after
+    return response, 429
+
+# チャット履歴の取得（before_id/limitによるカーソル型ページング、新しい順にlimit件を古い順で返す）
 @chat_bp.route('/<int:project_id>', methods=['GET'])
 @jwt_required()
 def get_chat_history(project_id):
     user = get_jwt_identity()
-    project = Project.query.filter_by(id=project_id, user_id=user['id']).first()
+    project = project_ownership.get(user['id'], project_id)
     
     if not project:
         return jsonify({"message": "プロジェクトが見つかりません"}), 404
 
-    messages = Message.query.filter_by(project_id=project_id).order_by(Message.created_at).all()
+    limit = request.args.get('limit', Config.CHAT_HISTORY_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, Config.CHAT_HISTORY_MAX_PAGE_SIZE))
+    before_id = request.args.get('before_id', type=int)
+
+    # カーソルのメッセージが無い（他のプロジェクトのメッセージ・削除済み）場合に最新のページを返すと、
+    # さかのぼって読み込んでいるクライアントに同じメッセージが重複して表示されるため400を返す
+    cursor = None
+    if before_id is not None:
+        cursor = db.session.query(Message.created_at).filter_by(id=before_id, project_id=project_id).scalar()
+        if cursor is None:
+            return jsonify({"message": "before_idのメッセージが見つかりません"}), 400
+
+    # 最新メッセージIDと件数から履歴の版を判定し、変化がなければ304を返す
+    latest_id, message_count = db.session.query(
+        func.max(Message.id), func.count(Message.id)
+    ).filter(Message.project_id == project_id).one()
+    etag = f"{project_id}-{latest_id or 0}-{message_count}-{'' if before_id is None else before_id}-{limit}"
+    if etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    # 記事はタイトルとURLだけを読み込む（本文・署名は読み込まない）
+    query = Message.query.options(
+        selectinload(Message.articles).load_only(Article.title, Article.url)
+    ).filter(Message.project_id == project_id)
+    if cursor is not None:
+        query = query.filter(or_(
+            Message.created_at < cursor,
+            and_(Message.created_at == cursor, Message.id < before_id),
+        ))
+
+    # 1件多く取得して次ページの有無を判定する
+    messages = query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit + 1).all()
+    has_more = len(messages) > limit
+    messages = list(reversed(messages[:limit]))
+
     chat_history = [{
         "id": message.id,
         "sender": message.sender,
@@ -26,7 +81,11 @@ def get_chat_history(project_id):
         "articles": [{"title": article.title, "url": article.url} for article in message.articles]
     } for message in messages]
     
-    return jsonify(chat_history), 200
+    response = jsonify(chat_history)
+    response.set_etag(etag)
+    if has_more:
+        response.headers['X-Next-Before-Id'] = str(messages[0].id)
+    return response, 200
 
 # ユーザーからのプロンプト送信
 @chat_bp.route('/<int:project_id>', methods=['POST'])
@@ -36,7 +95,7 @@ def send_prompt(project_id):
     data = request.get_json()
     prompt = data.get('content')
 
-    project = Project.query.filter_by(id=project_id, user_id=user['id']).first()
+    project = project_ownership.get(user['id'], project_id)
     
     if not project:
         return jsonify({"message": "プロジェクトが見つかりません"}), 404
@@ -44,16 +103,118 @@ def send_prompt(project_id):
     if not prompt:
         return jsonify({"message": "プロンプトを入力してください"}), 400
 
-    # ユーザーのメッセージを保存
-    user_message = Message(project_id=project_id, sender='user', content=prompt, created_at=datetime.utcnow())
-    db.session.add(user_message)
-    db.session.commit()
+    # ユーザーごとのレート制限（USER_RATE_LIMIT_PER_MINUTE）
+    try:
+        rate_limiter.check('user', user['id'])
+    except RateLimited as e:
+        return too_many_requests(TOO_MANY_REQUESTS, e.retry_after_header)
+
+    # 非同期モードではジョブを登録してすぐに返す（結果は /jobs/<job_id> で取得）
+    if data.get('async') or request.args.get('async'):
+        try:
+            payload, status = enqueue_prompt(user['id'], project_id, prompt)
+        except JobQueueFull as e:
+            return too_many_requests(QUEUE_FULL, e.retry_after_header)
+        return jsonify(payload), status
+
+    # OpenAI APIを呼び出してレスポンスと記事を取得（ユーザーのメッセージも応答と一緒に保存）
+    ai_data = get_ai_response(project, prompt, save_user_message=True)
 
-    # OpenAI APIを呼び出してレスポンスと記事を取得
-    ai_data = get_ai_response(project, prompt)
+    # 上流（OpenAI）のレート制限に達した場合
+    if ai_data.get("retry_after"):
+        return too_many_requests(ai_data["ai_response"], ai_data["retry_after"])
 
-    return jsonify({
+    response = jsonify({
         "message": "メッセージが送信されました",
         "ai_response": ai_data.get("ai_response"),
         "articles": ai_data.get("articles")
-    }), 201
+    })
+    # 段階ごとの所要時間をServer-Timingヘッダーで返す（ベンチマーク・調査用）
+    if ai_data.get("timings") is not None:
+        response.headers['Server-Timing'] = ai_data["timings"].server_timing(ai_data.get("db"))
+    return response, 201
+
+def enqueue_prompt(user_id, project_id, prompt):
+    """
+    ユーザーのメッセージを保存してAI応答ジョブを登録する。(レスポンスの内容, ステータスコード) を返す。
+    メッセージとジョブは同じトランザクションで保存し、キューが一杯の場合はメッセージも保存せずにJobQueueFullを送出する。
+    ASGIモード（asgi.py）のチャット送信からも使う。
+    """
+    user_message = Message(project_id=project_id, sender='user', content=prompt, created_at=datetime.utcnow())
+    db.session.add(user_message)
+    db.session.flush()
+    index_messages([user_message])
+
+    job = job_queue.enqueue(user_id, project_id, prompt)
+    return {"message": "メッセージが送信されました", "job_id": job.id, "status": job.status}, 202
+
+def _job_to_dict(job):
+    return {
+        "job_id": job.id,
+        "project_id": job.project_id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "ai_response": (job.result or {}).get("ai_response"),
+        "articles": (job.result or {}).get("articles"),
+        "error": job.error if job.status == 'failed' else None,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+    }
+
+# AI応答ジョブの状態と結果の取得
+@chat_bp.route('/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_job(job_id):
+    user = get_jwt_identity()
+    job = ChatJob.query.filter_by(id=job_id, user_id=user['id']).first()
+
+    if not job:
+        return jsonify({"message": "ジョブが見つかりません"}), 404
+
+    return jsonify(_job_to_dict(job)), 200
+
+# AI応答ジョブのキャンセル
+@chat_bp.route('/jobs/<job_id>', methods=['DELETE'])
+@jwt_required()
+def cancel_job(job_id):
+    user = get_jwt_identity()
+    job = ChatJob.query.filter_by(id=job_id, user_id=user['id']).first()
+
+    if not job:
+        return jsonify({"message": "ジョブが見つかりません"}), 404
+
+    job_queue.cancel(job)
+    return jsonify(_job_to_dict(job)), 200
+
+# ユーザーからのプロンプト送信（Server-Sent Eventsで進捗と応答を逐次返す）
+@chat_bp.route('/<int:project_id>/stream', methods=['POST'])
+@jwt_required()
+def stream_prompt(project_id):
+    user = get_jwt_identity()
+    data = request.get_json()
+    prompt = data.get('content')
+
+    project = project_ownership.get(user['id'], project_id)
+
+    if not project:
+        return jsonify({"message": "プロジェクトが見つかりません"}), 404
+
+    if not prompt:
+        return jsonify({"message": "プロンプトを入力してください"}), 400
+
+    try:
+        rate_limiter.check('user', user['id'])
+    except RateLimited as e:
+        return too_many_requests(TOO_MANY_REQUESTS, e.retry_after_header)
+
+    def generate():
+        # クライアント切断時はclosingにより上流のストリームも閉じられる
+        with closing(stream_ai_response(project, prompt, save_user_message=True)) as events:
+            for event, payload in events:
+                yield f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
@@ -0,0 +1,11 @@
+# backend/routes/metrics.py
+from flask import Blueprint, Response
+from services.metrics import render
+
+metrics_bp = Blueprint('metrics', __name__)
+
+# Prometheus形式のメトリクス
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    body, content_type = render()
+    return Response(body, content_type=content_type)
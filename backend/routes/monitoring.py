@@ -0,0 +1,31 @@
+# backend/routes/monitoring.py
+from flask import Blueprint, jsonify
+from services.article_cache import article_cache
+from services.browser_pool import browser_pool
+from services.search_cache import search_cache
+from services.response_cache import response_cache
+from services.registry import services
+from services.ownership import project_ownership
+from services.cleanup import article_collector
+from services.rate_limit import rate_limiter, upstream_governor
+from services.hedging import hedge_policy
+from services.compression import article_codec
+
+monitoring_bp = Blueprint('monitoring', __name__)
+
+# キャッシュやプールの統計情報の取得
+@monitoring_bp.route('/stats', methods=['GET'])
+def get_stats():
+    return jsonify({
+        "article_cache": article_cache.stats(),
+        "browser_pool": browser_pool.stats,
+        "search_cache": search_cache.stats(),
+        "response_cache": response_cache.stats(),
+        "services": services.stats(),
+        "project_ownership": project_ownership.stats(),
+        "article_gc": article_collector.stats(),
+        "rate_limit": rate_limiter.stats(),
+        "upstream_concurrency": upstream_governor.stats(),
+        "article_fetch_hedge": hedge_policy.stats(),
+        "article_compression": article_codec.stats(),
+    }), 200
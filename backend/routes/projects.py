@@ -1,7 +1,9 @@
 # backend/routes/projects.py
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import db, Project
+from services.ownership import project_ownership
+from services.cleanup import delete_project as delete_project_rows
 
 projects_bp = Blueprint('projects', __name__)
 
@@ -19,6 +21,7 @@ def create_project():
     new_project = Project(user_id=user['id'], name=name)
     db.session.add(new_project)
     db.session.commit()
+    project_ownership.invalidate(user['id'])
 
     return jsonify({"message": "プロジェクトが作成されました", "project": {"id": new_project.id, "name": new_project.name}}), 201
 
@@ -57,12 +60,13 @@ def update_project(project_id):
 @jwt_required()
 def delete_project(project_id):
     user = get_jwt_identity()
-    project = Project.query.filter_by(id=project_id, user_id=user['id']).first()
+    owned = db.session.query(Project.id).filter_by(id=project_id, user_id=user['id']).scalar()
 
-    if not project:
+    if not owned:
         return jsonify({"message": "プロジェクトが見つかりません"}), 404
 
-    db.session.delete(project)
-    db.session.commit()
+    # メッセージを読み込まずにSQLで一括削除する（記事の削除はArticleCollectorが行う）
+    delete_project_rows(project_id, current_app.config['PROJECT_DELETE_BATCH_SIZE'])
+    project_ownership.invalidate(user['id'])
 
     return jsonify({"message": "プロジェクトが削除されました"}), 200
@@ -0,0 +1,30 @@
+# backend/routes/search.py
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from config import Config
+from services.search_index import search
+
+search_bp = Blueprint('search', __name__)
+
+SEARCH_TYPES = ('message', 'article')
+
+# チャット履歴と参照記事の全文検索（関連度順、limit/offsetによるページング）
+@search_bp.route('/', methods=['GET'])
+@jwt_required()
+def search_history():
+    user = get_jwt_identity()
+    query = (request.args.get('q') or '').strip()
+    if not query:
+        return jsonify({"message": "検索語を入力してください"}), 400
+
+    kind = request.args.get('type')
+    if kind is not None and kind not in SEARCH_TYPES:
+        return jsonify({"message": "typeにはmessageまたはarticleを指定してください"}), 400
+
+    limit = request.args.get('limit', Config.SEARCH_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, Config.SEARCH_MAX_PAGE_SIZE))
+    offset = max(0, request.args.get('offset', 0, type=int))
+    project_id = request.args.get('project_id', type=int)
+
+    results, next_offset = search(user['id'], query, kind=kind, project_id=project_id, limit=limit, offset=offset)
+    return jsonify({"results": results, "next_offset": next_offset}), 200
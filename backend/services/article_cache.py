@@ -0,0 +1,129 @@
+# backend/services/article_cache.py
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy.orm import load_only
+from models import db, Article as DBArticle
+from .cache import TTLCache
+from .compression import article_codec, content_hash
+
+
+class ArticleCache:
+    """
+    URLをキーとした記事本文のリードスルーキャッシュ。
+    プロセス内LRUを一次キャッシュとし、Articleテーブルを二次キャッシュとして使う。
+    fetched_atがTTLを超えた記事は古い本文を返しつつ、バックグラウンドで再取得する。
+    """
+
+    def __init__(self, maxsize=512, ttl_seconds=86400, refresh_workers=2):
+        self.configure(maxsize, ttl_seconds, refresh_workers)
+
+    def configure(self, maxsize, ttl_seconds, refresh_workers):
+        if getattr(self, '_refresher', None) is not None:
+            self._refresher.shutdown(wait=False)
+        self._lru = TTLCache(maxsize=maxsize)
+        self._ttl = timedelta(seconds=ttl_seconds)
+        self._refresher = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix='article-refresh')
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def init_app(self, app):
+        self.configure(
+            app.config.get('ARTICLE_CACHE_SIZE', 512),
+            app.config.get('ARTICLE_CACHE_TTL', 86400),
+            app.config.get('ARTICLE_CACHE_REFRESH_WORKERS', 2),
+        )
+
+    def _is_fresh(self, fetched_at):
+        return fetched_at is not None and datetime.now() - fetched_at < self._ttl
+
+    def lookup(self, urls, fetcher):
+        """
+        URLのリストに対してキャッシュ済みの本文を返す（{url: content}）。
+        古いエントリは返した上で、fetcherを使ってバックグラウンドで再取得する。
+        アプリケーションコンテキスト内で呼び出すこと。
+        """
+        found = {}
+        missing = []
+        for url in urls:
+            entry = self._lru.get(url)
+            if entry is None:
+                missing.append(url)
+            else:
+                found[url] = entry
+
+        # LRUにない記事はまとめてDBから読み込む
+        if missing:
+            columns = load_only(DBArticle.url, DBArticle.fetched_at, DBArticle.body, DBArticle.legacy_content)
+            for article in DBArticle.query.options(columns).filter(DBArticle.url.in_(missing)).all():
+                entry = (article_codec.text(article), article.fetched_at)
+                self._lru.set(article.url, entry)
+                found[article.url] = entry
+
+        contents = {}
+        for url in urls:
+            entry = found.get(url)
+            if entry is None:
+                self.misses += 1
+                continue
+            content, fetched_at = entry
+            contents[url] = content
+            if self._is_fresh(fetched_at):
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+                self._schedule_refresh(url, fetcher)
+        return contents
+
+    def store(self, url, content):
+        if content:
+            self._lru.set(url, (content, datetime.now()))
+
+    def _schedule_refresh(self, url, fetcher):
+        with self._lock:
+            if url in self._refreshing:
+                return
+            self._refreshing.add(url)
+        app = current_app._get_current_object()
+        self._refresher.submit(self._refresh, app, url, fetcher)
+
+    def _refresh(self, app, url, fetcher):
+        try:
+            content = fetcher(url)
+            if not content:
+                return
+            fetched_at = datetime.now()
+            with app.app_context():
+                # 本文が変わっていなければ取得日時だけを更新する（圧縮と書き込みを省く）
+                values = {'fetched_at': fetched_at}
+                stored_hash = db.session.query(DBArticle.content_hash).filter_by(url=url).scalar()
+                if stored_hash != content_hash(content):
+                    values.update(article_codec.encode(content), legacy_content=None)
+                DBArticle.query.filter_by(url=url).update(values)
+                db.session.commit()
+            self._lru.set(url, (content, fetched_at))
+            self.refreshes += 1
+            logging.info(f"古い記事キャッシュを更新しました ({url})")
+        except Exception as e:
+            logging.warning(f"記事キャッシュの更新に失敗しました ({url}): {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(url)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "lru": self._lru.stats(),
+        }
+
+
+article_cache = ArticleCache()
@@ -0,0 +1,466 @@
+# backend/services/async_pipeline.py
+"""
+ASGIモード（asgi.py）用の非同期パイプライン。
+検索クエリ生成・検索・記事取得・応答生成をイベントループ上で行い、1プロセスで多数のチャットを同時に扱う。
+SQLAlchemyのDBアクセスはrun_syncでスレッドに渡す（呼び出しごとにアプリコンテキストを作成）。
+HTMLの解析はCPUを使うため、DBアクセスを待たせないよう記事解析用のスレッドプールで行う。
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import anyio
+from .registry import services
+from .article_cache import article_cache
+from .search_cache import search_cache, normalize_prompt
+from .response_cache import response_cache
+from .persistence import query_tracker
+from .timing import StageTimer
+from .hedging import hedge_policy
+from .dedup import minhash
+from .metrics import observe_article_fetch, record_turn, record_usage
+from .rate_limit import RateLimited, upstream_governor
+from .openai_service import (
+    filter_reliable_sources,
+    fetch_article_content,
+    fetch_article_with_browser,
+    parse_article_html,
+    existing_article_ids,
+    assemble_sources,
+    build_chat_messages,
+)
+from .pipeline import (
+    FetchRound,
+    CompletionStream,
+    COMPLETION_MODEL,
+    COMPLETION_OPTIONS,
+    ERROR_MESSAGE,
+    HISTORY_ONLY_RESULTS,
+    RATE_LIMITED_MESSAGE,
+    acquire_speculation_slot,
+    cached_response,
+    error_response,
+    keep_user_message,
+    log_optimizations,
+    rate_limited_response,
+    release_speculation_slot,
+    remember_response,
+    save_turn,
+    turn_result,
+    use_speculation,
+)
+from config import Config
+
+# 記事の解析とSeleniumでの取得用のスレッドプール（同期版の記事取得と同じ並列数）
+_parse_executor = ThreadPoolExecutor(
+    max_workers=Config.ARTICLE_FETCH_WORKERS,
+    thread_name_prefix='article-parse',
+)
+
+
+class SingleFlight:
+    """
+    同じキーの処理が実行中であれば新たに始めず、その結果を待つ。
+    多数のチャットが同時に同じ検索や記事の取得を行う場合に、キャッシュが温まるまでの重複した呼び出しを省く。
+    待っている側がキャンセルされても、実行中の処理は他の待ち手のために続ける。
+    """
+
+    def __init__(self):
+        self._tasks = {}
+
+    async def run(self, key, factory):
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._tasks[key] = task
+            task.add_done_callback(lambda _task: self._tasks.pop(key, None))
+        return await asyncio.shield(task)
+
+
+_queries = SingleFlight()
+_searches = SingleFlight()
+_articles = SingleFlight()
+
+
+def _call_in_app_context(app, func, args, db_stats):
+    with app.app_context():
+        if db_stats is None:
+            return func(*args)
+        with query_tracker.collect(db_stats):
+            return func(*args)
+
+
+async def run_sync(app, func, *args, db_stats=None):
+    """
+    同期の処理をスレッドで実行して結果を待つ。
+    アプリコンテキスト（とDBセッション）は呼び出しごとに破棄されるため、ORMのオブジェクトではなく値を返す関数を渡す。
+    db_statsを渡した場合は、そのスレッドで実行したクエリを集計に加える。
+    """
+    return await asyncio.to_thread(_call_in_app_context, app, func, args, db_stats)
+
+
+def run_detached(app, func, *args):
+    """結果を待たずにスレッドで実行する（キャンセル中の後片付け用）。"""
+    asyncio.get_running_loop().run_in_executor(None, _call_in_app_context, app, func, args, None)
+
+
+async def _search_cache_call(app, func, *args, db_stats=None):
+    # DB層を使わない場合はプロセス内LRUのみのため、スレッドに渡さずに呼ぶ
+    if not search_cache.db_tier:
+        return func(*args)
+    return await run_sync(app, func, *args, db_stats=db_stats)
+
+
+async def generate_search_query_async(app, user_prompt, db_stats=None):
+    cached_query = await _search_cache_call(app, search_cache.get_query, user_prompt, db_stats=db_stats)
+    if cached_query:
+        logging.info(f"キャッシュ済みの検索クエリを使用します: {cached_query}")
+        return cached_query
+
+    search_query = await _queries.run(
+        normalize_prompt(user_prompt),
+        lambda: upstream_governor.acall("openai", services.async_query_chain.arun, user_prompt=user_prompt),
+    )
+    logging.info(f"生成された検索クエリ: {search_query}")
+    await _search_cache_call(app, search_cache.set_query, user_prompt, search_query, db_stats=db_stats)
+    return search_query
+
+
+async def perform_search_async(app, search_query, db_stats=None):
+    cached_results = await _search_cache_call(app, search_cache.get_results, search_query, db_stats=db_stats)
+    if cached_results is not None:
+        logging.info(f"キャッシュ済みの検索結果を使用します: {search_query}")
+        return cached_results
+
+    try:
+        search_results = await _searches.run(
+            search_query, lambda: upstream_governor.acall("cse", services.search_async, search_query, num=5),
+        )
+        logging.debug("検索結果: %s", search_results)
+        await _search_cache_call(app, search_cache.set_results, search_query, search_results, db_stats=db_stats)
+        return search_results
+
+    except Exception as e:
+        logging.error(f"検索中にエラーが発生しました: {e}")
+        return []
+
+
+async def fetch_article_content_async(url, timeout=None):
+    timeout = timeout or Config.ARTICLE_FETCH_TIMEOUT
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    try:
+        response = await services.fetch_page_async(url, timeout)
+        # 文字コードの推定とnewspaper3kでの解析はCPUを使うため、イベントループを塞がないようスレッドで行う
+        text = await loop.run_in_executor(_parse_executor, lambda: parse_article_html(url, response.text))
+
+        if len(text.strip()) < 200:
+            raise Exception("記事の内容が短すぎます。Seleniumを使用します。")
+
+        observe_article_fetch('newspaper', 'success', time.perf_counter() - started)
+        return text
+
+    except Exception as e:
+        observe_article_fetch('newspaper', 'failed', time.perf_counter() - started)
+        logging.warning(f"newspaper3kでの記事取得に失敗しました ({url}): {e}")
+        # Seleniumの操作はブロッキングのため、ブラウザの借用から解析までスレッドで行う
+        return await loop.run_in_executor(_parse_executor, fetch_article_with_browser, url, timeout)
+
+
+async def _timed_fetch_async(url, timeout, hedge=False):
+    started = time.monotonic()
+    if hedge:
+        # ヘッジは同じURLの取得の合流（SingleFlight）を通さず、別のリクエストとして取得する
+        content = await fetch_article_content_async(url, timeout=timeout)
+    else:
+        content = await _articles.run(url, lambda: fetch_article_content_async(url, timeout=timeout))
+    elapsed = time.monotonic() - started
+    hedge_policy.observe(elapsed)
+    # 重複判定の署名をスレッドで計算しておく（本文のハッシュごとにキャッシュされる）
+    await asyncio.to_thread(minhash, content)
+    return content, elapsed
+
+
+# 待たずに返した後も続ける記事取得のタスク（完了まで参照を保持する）
+_background_fetches = set()
+
+
+def _store_when_done(task, url):
+    # 終わり次第記事キャッシュに入れ、次のターンで使う
+    _background_fetches.add(task)
+
+    def callback(task):
+        _background_fetches.discard(task)
+        if not task.cancelled() and task.exception() is None:
+            article_cache.store(url, task.result()[0])
+
+    task.add_done_callback(callback)
+
+
+async def fetch_articles_concurrently_async(app, search_results, db_stats=None, timer=None, budget=None):
+    """
+    fetch_articles_concurrentlyの非同期版。締め切りまでに取得できなかった記事はNoneとなる。
+    十分な件数での打ち切りとヘッジの判定も同じFetchRoundで行う（ヘッジのタスクはイベントループ上で実行する）。
+    """
+    loop = asyncio.get_running_loop()
+    links = [result.get('link', '') for result in search_results]
+    fetch = FetchRound(links, loop.time(), budget, timer)
+
+    # キャッシュ済みの記事はネットワークにアクセスしない（古い記事の再取得はバックグラウンドのスレッドで行われる）
+    cached = await run_sync(
+        app, article_cache.lookup, [link for link in links if link], fetch_article_content, db_stats=db_stats,
+    )
+    for index, link in enumerate(links):
+        if link in cached:
+            fetch.use_cached(index, cached[link])
+        elif link:
+            fetch.add(asyncio.create_task(_timed_fetch_async(link, Config.ARTICLE_FETCH_TIMEOUT)), index)
+    if not fetch.handles:
+        return fetch.contents
+
+    # キャッシュ済みの記事の署名はスレッドで計算する
+    await asyncio.to_thread(fetch.distinct.update, [content for content in fetch.contents if content])
+
+    completed = False
+    try:
+        while True:
+            step = fetch.next_wait(loop.time())
+            if step is None:
+                break
+            timeout, active = step
+            done, _ = await asyncio.wait(active, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                fetch.complete(task)
+            for index in fetch.due_hedges(loop.time()):
+                task = asyncio.create_task(_timed_fetch_async(links[index], Config.ARTICLE_FETCH_TIMEOUT, hedge=True))
+                fetch.add_hedge(task, index)
+        completed = True
+    finally:
+        # 残りの取得は終わり次第キャッシュに入れる。キャンセルされたターンの取得と、不要になったヘッジは打ち切る
+        for task, url, needed in fetch.leftovers():
+            if completed and needed:
+                _store_when_done(task, url)
+            else:
+                task.cancel()
+
+    return fetch.finish()
+
+
+async def collect_articles_async(app, search_query, timer, db_stats=None, fetch_budget=None):
+    """collect_articlesの非同期版。"""
+    with timer.stage("search"):
+        search_results = await perform_search_async(app, search_query, db_stats)
+
+    filtered_results = filter_reliable_sources(search_results)
+    if not filtered_results:
+        logging.warning("検索結果が見つかりませんでした。")
+        return [], "検索結果が見つかりませんでした。", []
+
+    # 既存の記事IDの取得は記事の取得と独立しているため並行して行う
+    links = [result.get('link', '') for result in filtered_results]
+    with timer.stage("fetch"):
+        contents, article_ids = await asyncio.gather(
+            fetch_articles_concurrently_async(app, filtered_results, db_stats, timer, fetch_budget),
+            run_sync(app, existing_article_ids, links, db_stats=db_stats),
+        )
+
+    return await asyncio.to_thread(assemble_sources, filtered_results, contents, article_ids, timer)
+
+
+async def create_completion_async(messages):
+    """create_completionの非同期版。"""
+    response = await upstream_governor.acall(
+        "openai",
+        services.async_openai.chat.completions.create,
+        messages=messages,
+        **COMPLETION_OPTIONS,
+    )
+    record_usage(COMPLETION_MODEL, getattr(response, "usage", None))
+    return response
+
+
+async def run_ai_pipeline_async(app, project, user_prompt, save_user_message=False, user_created_at=None):
+    """
+    run_ai_pipelineの非同期版。例外はそのまま送出する。
+    応答の先行生成（PIPELINE_SPECULATIVE_COMPLETION）はタスクとして行い、不要になった場合は上流へのリクエストごと打ち切る。
+    """
+    timer = StageTimer()
+    db_stats = {"queries": 0, "seconds": 0.0}
+
+    speculative = None
+    fetch_budget = None
+    summary_update = None
+    if Config.PIPELINE_SPECULATIVE_COMPLETION and acquire_speculation_slot():
+        try:
+            with timer.stage("context"):
+                history_messages, summary_update = await run_sync(
+                    app, build_chat_messages, project, user_prompt, [], HISTORY_ONLY_RESULTS, db_stats=db_stats,
+                )
+            speculative = asyncio.create_task(create_completion_async(history_messages))
+        except BaseException:
+            release_speculation_slot()
+            raise
+        speculative.add_done_callback(release_speculation_slot)
+        fetch_budget = Config.PIPELINE_SPECULATIVE_FETCH_BUDGET
+
+    try:
+        with timer.stage("query"):
+            search_query = await generate_search_query_async(app, user_prompt, db_stats)
+
+        sources, formatted_search_results, articles_list = await collect_articles_async(
+            app, search_query, timer, db_stats, fetch_budget,
+        )
+
+        if speculative is not None and use_speculation(sources, timer):
+            with timer.stage("completion"):
+                response = await speculative
+        else:
+            if speculative is not None:
+                speculative.cancel()
+            with timer.stage("context"):
+                messages, summary_update = await run_sync(
+                    app, build_chat_messages, project, user_prompt, sources, formatted_search_results, summary_update,
+                    db_stats=db_stats,
+                )
+
+            with timer.stage("completion"):
+                response = await create_completion_async(messages)
+    finally:
+        if speculative is not None:
+            if not speculative.done():
+                speculative.cancel()
+            elif not speculative.cancelled():
+                # 使わなかった先行生成のエラーは無視する（未取得の例外として警告させない）
+                speculative.exception()
+
+    ai_response = response.choices[0].message.content.strip()
+
+    with timer.stage("persist"):
+        message_id = await run_sync(
+            app, save_turn, project.id, ai_response, sources,
+            user_prompt if save_user_message else None, user_created_at, summary_update,
+            db_stats=db_stats,
+        )
+    query_tracker.report(f"チャットターン (project {project.id})", db_stats)
+
+    return turn_result(project, message_id, ai_response, articles_list, timer, db_stats)
+
+
+async def get_ai_response_async(app, project, user_prompt, save_user_message=False):
+    """get_ai_response_with_searchの非同期版。"""
+    user_created_at = datetime.utcnow()
+    try:
+        context_key = None
+        if response_cache.enabled:
+            cached, context_key = await run_sync(
+                app, cached_response, project, user_prompt, save_user_message, user_created_at,
+            )
+            if cached is not None:
+                record_turn("async", "cache_hit", cached["db"])
+                return cached
+
+        result = await run_ai_pipeline_async(
+            app, project, user_prompt, save_user_message=save_user_message, user_created_at=user_created_at,
+        )
+        record_turn("async", "success", result["db"])
+        remember_response(context_key, user_prompt, result)
+        return result
+
+    except RateLimited as e:
+        logging.warning(f"レート制限により応答を生成できませんでした: {e}")
+        record_turn("async", "rate_limited")
+        if save_user_message:
+            await run_sync(app, keep_user_message, project, user_prompt, user_created_at)
+        return rate_limited_response(e)
+
+    except Exception as e:
+        logging.error(f"Error: {e}")
+        record_turn("async", "error")
+        if save_user_message:
+            await run_sync(app, keep_user_message, project, user_prompt, user_created_at)
+        return error_response()
+
+
+async def stream_ai_response_async(app, project, user_prompt, save_user_message=False):
+    """
+    stream_ai_response_with_searchの非同期版。(イベント名, データ) のタプルを順に生成する。
+    クライアントの切断でキャンセルされた場合は上流のストリームを閉じ、AIのメッセージは保存しない。
+    """
+    user_created_at = datetime.utcnow()
+    timer = StageTimer()
+    db_stats = {"queries": 0, "seconds": 0.0}
+    try:
+        with timer.stage("query"):
+            search_query = await generate_search_query_async(app, user_prompt, db_stats)
+        yield "query", {"search_query": search_query}
+
+        sources, formatted_search_results, articles_list = await collect_articles_async(
+            app, search_query, timer, db_stats,
+        )
+        yield "articles", {"articles": articles_list}
+
+        with timer.stage("context"):
+            messages, summary_update = await run_sync(
+                app, build_chat_messages, project, user_prompt, sources, formatted_search_results, db_stats=db_stats,
+            )
+
+        # 同時呼び出し数の枠はストリームを開始する呼び出しの間だけ使い、クライアントへの送信中は使わない
+        with timer.stage("completion_stream"):
+            stream = await upstream_governor.acall(
+                "openai",
+                services.async_openai.chat.completions.create,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                **COMPLETION_OPTIONS,
+            )
+            collected = CompletionStream()
+            try:
+                async for chunk in stream:
+                    delta = collected.add(chunk)
+                    if delta:
+                        yield "delta", {"content": delta}
+            finally:
+                # 切断でキャンセルされた場合も、HTTP接続を閉じて上流の生成を中断するまでは待つ
+                with anyio.CancelScope(shield=True):
+                    await stream.close()
+
+        ai_response = collected.finish()
+        with timer.stage("persist"):
+            message_id = await run_sync(
+                app, save_turn, project.id, ai_response, sources,
+                user_prompt if save_user_message else None, user_created_at, summary_update,
+                db_stats=db_stats,
+            )
+        query_tracker.report(f"チャットターン (project {project.id})", db_stats)
+        record_turn("async_stream", "success", db_stats)
+        log_optimizations(project, timer)
+
+        yield "done", {
+            "message_id": message_id,
+            "ai_response": ai_response,
+            "articles": articles_list
+        }
+
+    except (GeneratorExit, asyncio.CancelledError):
+        logging.info(f"クライアントが切断したためストリーミングを中断しました (project {project.id})")
+        record_turn("async_stream", "disconnected")
+        if save_user_message:
+            run_detached(app, keep_user_message, project, user_prompt, user_created_at)
+        raise
+    except RateLimited as e:
+        logging.warning(f"レート制限により応答を生成できませんでした: {e}")
+        record_turn("async_stream", "rate_limited")
+        if save_user_message:
+            await run_sync(app, keep_user_message, project, user_prompt, user_created_at)
+        yield "error", {
+            "message": RATE_LIMITED_MESSAGE,
+            "retry_after": e.retry_after_header,
+        }
+    except Exception as e:
+        logging.error(f"Error: {e}")
+        record_turn("async_stream", "error")
+        if save_user_message:
+            await run_sync(app, keep_user_message, project, user_prompt, user_created_at)
+        yield "error", {"message": ERROR_MESSAGE}
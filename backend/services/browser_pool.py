@@ -0,0 +1,177 @@
+# backend/services/browser_pool.py
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+
+
+class BrowserPoolTimeout(Exception):
+    """空きセッションを待っている間にタイムアウトした場合の例外。"""
+
+
+class StubDriver:
+    """
+    オフライン検証用のダミーWebDriver。
+    URLごとのHTMLを返し、ブラウザを起動せずにプールの動作を確認できる。
+    """
+
+    def __init__(self, pages=None, default_html="<html><body></body></html>"):
+        self.pages = pages or {}
+        self.default_html = default_html
+        self.page_source = ""
+        self.visited = []
+        self.closed = False
+
+    def set_page_load_timeout(self, timeout):
+        self.page_load_timeout = timeout
+
+    def get(self, url):
+        if self.closed:
+            raise RuntimeError("StubDriverは終了しています")
+        self.visited.append(url)
+        self.page_source = self.pages.get(url, self.default_html)
+
+    def find_element(self, by=None, value=None):
+        # WebDriverWaitのpresence_of_element_locatedを満たすため要素を返す
+        return object()
+
+    def quit(self):
+        self.closed = True
+
+
+def chrome_driver_factory():
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+
+    # ヘッドレスモードの設定
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+
+    return webdriver.Chrome(options=chrome_options)
+
+
+def stub_driver_factory():
+    return StubDriver()
+
+
+DRIVER_FACTORIES = {
+    'chrome': chrome_driver_factory,
+    'stub': stub_driver_factory,
+}
+
+
+class _Session:
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+
+
+class BrowserPool:
+    """
+    長寿命のヘッドレスブラウザセッションを管理するプール。
+    取得ごとにセッションを貸し出し、一定ページ数の処理後または異常時に作り直す。
+    """
+
+    def __init__(self, driver_factory=chrome_driver_factory, max_sessions=2,
+                 max_pages_per_session=50, lease_timeout=30):
+        self._lock = threading.Lock()
+        self._atexit_registered = False
+        self.configure(driver_factory, max_sessions, max_pages_per_session, lease_timeout)
+
+    def configure(self, driver_factory, max_sessions, max_pages_per_session, lease_timeout):
+        self._driver_factory = driver_factory
+        self._max_pages = max_pages_per_session
+        self._lease_timeout = lease_timeout
+        self._slots = threading.BoundedSemaphore(max_sessions)
+        with self._lock:
+            self._idle = []
+            self._closed = False
+            self.stats = {"created": 0, "recycled": 0, "crashed": 0, "leases": 0}
+
+    def init_app(self, app):
+        factory_name = app.config.get('BROWSER_DRIVER', 'chrome')
+        self.configure(
+            DRIVER_FACTORIES[factory_name],
+            app.config.get('BROWSER_POOL_SIZE', 2),
+            app.config.get('BROWSER_MAX_PAGES_PER_SESSION', 50),
+            app.config.get('BROWSER_LEASE_TIMEOUT', 30),
+        )
+        # プロセス終了時にブラウザを確実に終了させる（init_appが複数回呼ばれても登録は一度だけ）
+        with self._lock:
+            if self._atexit_registered:
+                return
+            self._atexit_registered = True
+        atexit.register(self.shutdown)
+
+    def _count(self, name):
+        # 統計は複数のスレッドから更新されるため、すべてロック内で加算する
+        with self._lock:
+            self.stats[name] += 1
+
+    @contextmanager
+    def lease(self):
+        """
+        WebDriverを貸し出すコンテキストマネージャ。
+        ブロック内で例外が発生したセッションは破棄される。
+        """
+        if self._closed:
+            raise RuntimeError("ブラウザプールは終了しています")
+        if not self._slots.acquire(timeout=self._lease_timeout):
+            raise BrowserPoolTimeout("ブラウザセッションの空きを待機中にタイムアウトしました")
+
+        session = None
+        try:
+            session = self._checkout()
+            yield session.driver
+            session.pages += 1
+        except Exception:
+            if session is not None:
+                self._count("crashed")
+                self._quit(session)
+                session = None
+            raise
+        finally:
+            if session is not None:
+                self._checkin(session)
+            self._slots.release()
+
+    def _checkout(self):
+        with self._lock:
+            self.stats["leases"] += 1
+            if self._idle:
+                return self._idle.pop()
+        session = _Session(self._driver_factory())
+        self._count("created")
+        logging.info("ヘッドレスブラウザのセッションを起動しました。")
+        return session
+
+    def _checkin(self, session):
+        if session.pages >= self._max_pages:
+            self._count("recycled")
+            self._quit(session)
+            return
+        with self._lock:
+            if not self._closed:
+                self._idle.append(session)
+                return
+        self._quit(session)
+
+    def _quit(self, session):
+        try:
+            session.driver.quit()
+        except Exception as e:
+            logging.warning(f"ブラウザセッションの終了に失敗しました: {e}")
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for session in idle:
+            self._quit(session)
+        if idle:
+            logging.info(f"ブラウザセッションを{len(idle)}件終了しました。")
+
+
+browser_pool = BrowserPool()
@@ -0,0 +1,125 @@
+# backend/services/chunk_ranker.py
+import re
+from collections import Counter
+import numpy as np
+from models import db, ArticleChunkIndex
+from config import Config
+from .cache import TTLCache
+from .compression import content_hash
+from .context_builder import count_tokens
+from .tokenizer import tokenize
+
+# BM25のパラメータ
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# 文の区切り（日本語の句点、英語のピリオド、改行）
+_SENTENCE_PATTERN = re.compile(r'[^。！？!?\n]+[。！？!?]?|\n+')
+
+# URLごとのチャンク索引（本文のハッシュが一致する場合のみ再利用）
+_index_cache = TTLCache(maxsize=1024)
+
+
+def split_into_chunks(text, max_tokens=None):
+    """記事本文を文単位でまとめ、max_tokens程度のチャンクに分割する。"""
+    max_tokens = max_tokens or Config.CHUNK_MAX_TOKENS
+    chunks = []
+    current = []
+    current_tokens = 0
+    for sentence in _SENTENCE_PATTERN.findall(text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        tokens = count_tokens(sentence)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("".join(current))
+            current, current_tokens = [], 0
+        current.append(sentence)
+        current_tokens += tokens
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+
+def _build_index(text):
+    chunks = split_into_chunks(text)
+    return {"chunks": chunks, "terms": [tokenize(chunk) for chunk in chunks]}
+
+
+def get_chunk_index(url, article_id, text):
+    """
+    記事のチャンク索引を返す。プロセス内キャッシュ、ArticleChunkIndexテーブルの順に探し、
+    無い場合（または本文が更新された場合）は作成する。
+    (索引, 保存が必要か) を返す。保存はターンの永続化時にまとめて行う。
+    """
+    digest = content_hash(text)
+    cached = _index_cache.get(url)
+    if cached and cached["hash"] == digest:
+        return cached, False
+
+    row = db.session.get(ArticleChunkIndex, article_id) if article_id else None
+    if row is not None and row.content_hash == digest:
+        index = {"hash": digest, "chunks": row.chunks, "terms": row.terms}
+        needs_save = False
+    else:
+        index = {"hash": digest, **_build_index(text)}
+        needs_save = True
+
+    _index_cache.set(url, index)
+    return index, needs_save
+
+
+def bm25_scores(query_terms, documents):
+    """
+    BM25でクエリに対する各文書（トークン列）のスコアを計算する。
+    クエリ語×文書の出現頻度行列を作り、スコア計算はNumPyでまとめて行う。
+    """
+    if not documents:
+        return np.zeros(0)
+    vocabulary = list(dict.fromkeys(query_terms))
+    if not vocabulary:
+        return np.zeros(len(documents))
+
+    counts = [Counter(terms) for terms in documents]
+    tf = np.array([[count[term] for term in vocabulary] for count in counts], dtype=np.float64)
+    lengths = np.array([len(terms) for terms in documents], dtype=np.float64)
+
+    n_docs = len(documents)
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log((n_docs - df + 0.5) / (df + 0.5) + 1.0)
+
+    avgdl = lengths.mean() or 1.0
+    norm = BM25_K1 * (1.0 - BM25_B + BM25_B * lengths / avgdl)
+    weights = tf * (BM25_K1 + 1.0) / (tf + norm[:, None])
+    return weights @ idf
+
+
+def select_relevant_chunks(user_prompt, sources, top_k=None):
+    """
+    取得した記事をチャンクに分割し、プロンプトとの関連度でランク付けする。
+    上位top_k件のチャンクを各sourceの"chunks"に (スコア, 位置, 本文) として格納する。
+    """
+    top_k = top_k or Config.CHUNK_TOP_K
+    candidates = []
+    for source_index, source in enumerate(sources):
+        source["chunks"] = []
+        if not source.get("content"):
+            continue
+        index, needs_save = get_chunk_index(source["url"], source.get("article_id"), source["content"])
+        if needs_save:
+            source["chunk_index"] = index
+        for position, (chunk, terms) in enumerate(zip(index["chunks"], index["terms"])):
+            candidates.append((source_index, position, chunk, terms))
+
+    if not candidates:
+        return sources
+
+    scores = bm25_scores(tokenize(user_prompt), [candidate[3] for candidate in candidates])
+    # 同点の場合は記事内の先頭に近いチャンクを優先する
+    positions = np.array([candidate[1] for candidate in candidates])
+    order = np.lexsort((positions, -scores))[:top_k]
+
+    for i in order:
+        source_index, position, chunk, _ = candidates[i]
+        sources[source_index]["chunks"].append((float(scores[i]), position, chunk))
+    return sources
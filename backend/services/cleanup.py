@@ -0,0 +1,125 @@
+# backend/services/cleanup.py
+import atexit
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import delete, exists, select
+from models import db, Article, Message, Project, article_message
+
+
+def delete_project(project_id, batch_size=1000):
+    """
+    プロジェクトを集合演算のSQLで削除する（メッセージや記事をORMに読み込まない）。
+    メッセージはbatch_size件ずつ削除・コミットし、履歴の長さに関わらずメモリとロックの保持時間を一定に保つ。
+    記事との関連付け・全文検索の索引・要約・ジョブはON DELETE CASCADEでDB側が削除する。
+    どのメッセージからも参照されなくなった記事はArticleCollectorが後で削除する。
+    削除したプロジェクトの件数（0または1）を返す。
+    """
+    while True:
+        batch = select(Message.id).where(Message.project_id == project_id).limit(batch_size)
+        deleted = db.session.execute(
+            delete(Message).where(Message.id.in_(batch.scalar_subquery())),
+            execution_options={'synchronize_session': False},
+        ).rowcount
+        db.session.commit()
+        if deleted < batch_size:
+            break
+
+    deleted = db.session.execute(
+        delete(Project).where(Project.id == project_id),
+        execution_options={'synchronize_session': False},
+    ).rowcount
+    db.session.commit()
+    return deleted
+
+
+def _orphaned():
+    # どのメッセージとも関連付けられていない記事
+    return ~exists().where(article_message.c.article_id == Article.id)
+
+
+class ArticleCollector:
+    """
+    どのメッセージからも参照されなくなった記事（プロジェクトの削除後など）を削除するバックグラウンドのスレッド。
+    ARTICLE_GC_INTERVAL秒ごとにARTICLE_GC_BATCH_SIZE件ずつ削除する。
+    LSHの索引・チャンク索引・全文検索の索引はON DELETE CASCADEで記事と一緒に削除される。
+    最近取得・更新された記事（ARTICLE_GC_GRACE秒以内）は進行中のターンから関連付けられる可能性があるため対象外にする。
+    スレッドはstart()で起動する（リクエストを処理するプロセスでのみ。app.start_background_workers）。
+    """
+
+    def __init__(self):
+        self._app = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self.runs = 0
+        self.deleted = 0
+        self.last_run = None
+
+    def init_app(self, app):
+        self._app = app
+        self.interval = app.config.get('ARTICLE_GC_INTERVAL', 3600)
+        self.batch_size = app.config.get('ARTICLE_GC_BATCH_SIZE', 500)
+        self.grace = timedelta(seconds=app.config.get('ARTICLE_GC_GRACE', 3600))
+
+    def start(self):
+        """削除のスレッドを起動する（ARTICLE_GC_INTERVAL=0の場合と2回目以降は何もしない）。"""
+        if self._thread is not None or self.interval <= 0:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='article-gc', daemon=True)
+                self._thread.start()
+                atexit.register(self.shutdown)
+
+    def collect(self):
+        """孤立した記事をbatch_size件ずつ、無くなるまで削除する。削除した件数を返す。"""
+        cutoff = datetime.now() - self.grace
+        total = 0
+        while not self._stop.is_set():
+            ids = db.session.scalars(
+                select(Article.id).where(_orphaned(), Article.fetched_at < cutoff)
+                .order_by(Article.id).limit(self.batch_size)
+            ).all()
+            if not ids:
+                break
+            # 選んでから削除するまでの間に関連付けられた記事は残す
+            deleted = db.session.execute(
+                delete(Article).where(Article.id.in_(ids), _orphaned()),
+                execution_options={'synchronize_session': False},
+            ).rowcount
+            db.session.commit()
+            total += deleted
+            if len(ids) < self.batch_size:
+                break
+
+        with self._lock:
+            self.runs += 1
+            self.deleted += total
+            self.last_run = datetime.now()
+        if total:
+            logging.info(f"参照されていない記事を{total}件削除しました。")
+        return total
+
+    def shutdown(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                with self._app.app_context():
+                    self.collect()
+            except Exception as e:
+                logging.error(f"記事の削除でエラーが発生しました: {e}")
+
+    def stats(self):
+        return {
+            "runs": self.runs,
+            "deleted": self.deleted,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+            "interval": self.interval if self._app is not None else None,
+        }
+
+
+article_collector = ArticleCollector()
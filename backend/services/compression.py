@@ -0,0 +1,76 @@
+# backend/services/compression.py
+import hashlib
+import logging
+import zlib
+
+# 圧縮後のデータの先頭1バイトで方式を区別する（方式を変えても既存の行はそのまま読める）
+_ZLIB = b'z'
+_ZSTD = b's'
+
+
+def content_hash(text):
+    """本文のハッシュ（記事のcontent_hash、チャンク索引の再利用の判定に使う）。"""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class ArticleCodec:
+    """
+    記事の本文の圧縮と展開。ARTICLE_COMPRESSION='zstd'（zstandardパッケージが必要）または'zlib'。
+    zstandardがインストールされていない場合はzlibで圧縮する。
+    """
+
+    def __init__(self):
+        self.method = 'zlib'
+        self.level = 6
+        self._zstd = None
+
+    def init_app(self, app):
+        method = app.config.get('ARTICLE_COMPRESSION', 'zstd')
+        level = app.config.get('ARTICLE_COMPRESSION_LEVEL')
+        if method == 'zstd':
+            try:
+                import zstandard
+                self._zstd = zstandard
+            except ImportError:
+                logging.warning("zstandardがインストールされていないため、記事の本文はzlibで圧縮します。")
+                method = 'zlib'
+        self.method = method
+        self.level = level if level is not None else (3 if method == 'zstd' else 6)
+
+    def compress(self, text):
+        data = text.encode('utf-8')
+        if self.method == 'zstd':
+            return _ZSTD + self._zstd.ZstdCompressor(level=self.level).compress(data)
+        return _ZLIB + zlib.compress(data, self.level)
+
+    def decompress(self, blob):
+        blob = bytes(blob)
+        prefix, data = blob[:1], blob[1:]
+        if prefix == _ZLIB:
+            return zlib.decompress(data).decode('utf-8')
+        if prefix == _ZSTD:
+            if self._zstd is None:
+                import zstandard
+                self._zstd = zstandard
+            return self._zstd.ZstdDecompressor().decompress(data).decode('utf-8')
+        raise ValueError(f"不明な圧縮方式です: {prefix!r}")
+
+    def encode(self, text):
+        """本文を記事の列の値（body、content_hash、content_size）にする。"""
+        return {
+            'body': self.compress(text),
+            'content_hash': content_hash(text),
+            'content_size': len(text.encode('utf-8')),
+        }
+
+    def text(self, article):
+        """記事の本文。bodyとlegacy_contentを読み込んだ記事（load_only等）を渡す。"""
+        if article.body is not None:
+            return self.decompress(article.body)
+        return article.legacy_content
+
+    def stats(self):
+        return {"method": self.method, "level": self.level}
+
+
+article_codec = ArticleCodec()
@@ -0,0 +1,192 @@
+# backend/services/context_builder.py
+import logging
+import math
+from models import Message, ProjectSummary
+from config import Config
+from .metrics import record_usage
+from .rate_limit import upstream_governor
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    # tiktokenの読み込みと語彙の構築は重いため、最初にトークン数を数える時に行う
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            # tiktokenが無い環境では文字種ごとの概算で数える
+            _encoding = None
+        _encoding_loaded = True
+    return _encoding
+
+
+def _char_cost(ch):
+    # 英数字・記号はおよそ4文字で1トークン、日本語などはおよそ1文字1トークン
+    return 0.25 if ord(ch) < 128 else 1.0
+
+
+def count_tokens(text):
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return math.ceil(sum(_char_cost(ch) for ch in text))
+
+
+def _message_role(message):
+    return "user" if message.sender == "user" else "assistant"
+
+
+def _format_messages(messages):
+    return "\n".join(f"{_message_role(m)}: {m.content}" for m in messages)
+
+
+summary_prompt = """
+以下は、あるプロジェクトにおけるユーザーとAIアシスタントの会話の要約と、その後の新しいやり取りです。
+新しいやり取りの内容を反映して、要約を更新してください。
+ユーザーのニーズ、推奨したサービス、決定事項を中心に、日本語で簡潔にまとめること。
+
+これまでの要約:
+{summary}
+
+新しいやり取り:
+{messages}
+"""
+
+
+def _summarize(client, previous_summary, messages):
+    response = upstream_governor.call(
+        "openai",
+        client.chat.completions.create,
+        model=Config.CONTEXT_SUMMARY_MODEL,
+        messages=[{"role": "user", "content": summary_prompt.format(
+            summary=previous_summary or "（なし）",
+            messages=_format_messages(messages),
+        )}],
+        temperature=0.2,
+        max_tokens=Config.CONTEXT_SUMMARY_MAX_TOKENS,
+    )
+    record_usage(Config.CONTEXT_SUMMARY_MODEL, getattr(response, "usage", None))
+    return response.choices[0].message.content.strip()
+
+
+def _load_history(project, user_prompt, client_factory, history_budget, summary_update=None):
+    """
+    要約済みでない会話を読み込み、予算を超える古いやり取りをローリング要約に畳み込む。
+    更新した要約はここでは保存せず、(要約, 直近のメッセージ, 要約の更新) を返す（persist_turnがターンと一緒に保存する）。
+    summary_updateには同じターンで先に作成した未保存の要約の更新を渡す（要約し直さない）。
+    """
+    if summary_update is not None:
+        previous, last_id = summary_update["summary"], summary_update["last_message_id"]
+    else:
+        summary = ProjectSummary.query.filter_by(project_id=project.id).first()
+        previous, last_id = (summary.summary, summary.last_message_id) if summary else ("", 0)
+
+    recent = Message.query.filter(
+        Message.project_id == project.id,
+        Message.id > last_id,
+    ).order_by(Message.id).all()
+
+    # ルート側で保存済みの今回のプロンプトは最後に別途追加するため除外する
+    if recent and recent[-1].sender == 'user' and recent[-1].content == user_prompt:
+        recent = recent[:-1]
+
+    # 件数上限と予算の両方に収まるまで、古いメッセージを要約対象に回す
+    keep = len(recent)
+    used = 0
+    for index in range(len(recent) - 1, -1, -1):
+        cost = count_tokens(recent[index].content)
+        if len(recent) - index > Config.CONTEXT_RECENT_MESSAGES or used + cost > history_budget:
+            break
+        used += cost
+        keep = index
+    to_summarize, recent = recent[:keep], recent[keep:]
+
+    if to_summarize:
+        try:
+            previous = _summarize(client_factory(), previous, to_summarize)
+            summary_update = {
+                "project_id": project.id,
+                "summary": previous,
+                "last_message_id": to_summarize[-1].id,
+            }
+            logging.info(f"プロジェクト{project.id}の会話要約を更新しました（{len(to_summarize)}件を追加）")
+        except Exception as e:
+            logging.warning(f"会話要約の更新に失敗しました。古いメッセージは省略します: {e}")
+
+    return previous, recent, summary_update
+
+
+def _fit_articles(sources, budget):
+    """
+    関連度の高いチャンクから予算に収まる分だけ採用し、記事ごとにまとめた文字列のリストを返す。
+    チャンクはselect_relevant_chunksで各sourceの"chunks"に格納されたものを使う。
+    他の記事の重複（collapse_duplicatesでduplicate_ofが付いたもの）は含めない。
+    """
+    ranked = sorted(
+        ((score, source_index, position, text)
+         for source_index, source in enumerate(sources)
+         for score, position, text in source.get("chunks", [])),
+        key=lambda chunk: -chunk[0],
+    )
+
+    selected = {}
+    used = 0
+    for score, source_index, position, text in ranked:
+        cost = count_tokens(text)
+        if used + cost > budget:
+            continue
+        used += cost
+        selected.setdefault(source_index, []).append((position, text))
+
+    sections = []
+    for source_index, source in enumerate(sources):
+        title, link = source["title"], source["url"]
+        if source.get("duplicate_of"):
+            continue
+        if not source.get("content"):
+            sections.append(f"### {title}\nリンク: {link}\n記事内容の取得に失敗しました。")
+        elif source_index in selected:
+            # 記事内の順序に並べ直して抜粋として渡す
+            excerpt = "\n…\n".join(text for _, text in sorted(selected[source_index]))
+            sections.append(f"### {title}\n{excerpt}\nリンク: {link}")
+    return sections
+
+
+def build_context(project, user_prompt, sources, formatted_search_results, system_prompt, client_factory,
+                  summary_update=None):
+    """
+    トークン予算内に収まるようにチャット補完用のメッセージを組み立てる。
+    システムプロンプトと今回のプロンプトを必ず含め、残りを記事抜粋と会話履歴に配分する。
+    会話履歴は直近のやり取りをそのまま残し、それ以前はプロジェクトごとのローリング要約に置き換える。
+    (メッセージ, 要約の更新またはNone) を返す。要約の更新はpersist_turnに渡してターンと一緒にコミットする。
+    """
+    budget = Config.CONTEXT_TOKEN_BUDGET
+    remaining = budget - count_tokens(system_prompt) - count_tokens(user_prompt)
+
+    # 記事の抜粋
+    article_budget = max(0, min(Config.CONTEXT_ARTICLE_TOKEN_BUDGET, remaining // 2))
+    if sources:
+        sections = _fit_articles(sources, article_budget)
+        search_message = "最新の検索結果と記事内容:\n" + "\n\n".join(sections)
+    else:
+        search_message = f"最新の検索結果:\n{formatted_search_results}"
+    remaining -= count_tokens(search_message)
+
+    # 会話履歴（要約の分を差し引いた残りを直近のメッセージに使う）
+    history_budget = max(0, remaining - Config.CONTEXT_SUMMARY_MAX_TOKENS)
+    summary, recent, summary_update = _load_history(project, user_prompt, client_factory, history_budget, summary_update)
+
+    messages = [{"role": "system", "content": system_prompt}]
+    if summary:
+        messages.append({"role": "system", "content": f"これまでの会話の要約:\n{summary}"})
+    for message in recent:
+        messages.append({"role": _message_role(message), "content": message.content})
+    messages.append({"role": "system", "content": search_message})
+    messages.append({"role": "user", "content": user_prompt})
+    return messages, summary_update
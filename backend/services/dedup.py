@@ -0,0 +1,173 @@
+# backend/services/dedup.py
+"""
+記事本文のMinHashによる重複判定。
+同じ内容の記事（転載されたプレスリリースなど）を、1ターン内ではまとめて1件にし、
+保存時にはLSH（バンド分割）で既存の記事から候補を探して正規の記事（canonical_id）を指す。
+"""
+import hashlib
+import zlib
+import numpy as np
+from config import Config
+from models import db, Article as DBArticle, ArticleLshBand
+from .cache import TTLCache
+from .tokenizer import tokenize
+
+NUM_PERM = 128
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERM // LSH_BANDS
+SHINGLE_SIZE = 3
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+# 長い記事でもメモリを使いすぎないよう、シングルはこの件数ずつ処理する
+_BLOCK_SIZE = 4096
+
+_rng = np.random.default_rng(20241001)
+_PERM_A = _rng.integers(1, (1 << 61) - 1, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, (1 << 61) - 1, size=NUM_PERM, dtype=np.uint64)
+
+# 本文のハッシュごとの署名（同じ記事を毎ターン計算し直さない）
+_signature_cache = TTLCache(maxsize=2048)
+
+
+def _shingle_hashes(text):
+    tokens = tokenize(text)
+    if len(tokens) < SHINGLE_SIZE:
+        shingles = tokens
+    else:
+        shingles = [" ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)]
+    return np.fromiter({zlib.crc32(s.encode('utf-8')) for s in shingles}, dtype=np.uint64)
+
+
+def minhash(text):
+    """本文のMinHash署名（NUM_PERM個のuint32）を返す。本文が空の場合はNone。"""
+    if not text:
+        return None
+    key = hashlib.sha1(text.encode('utf-8')).hexdigest()
+    cached = _signature_cache.get(key)
+    if cached is not None:
+        return cached
+
+    hashes = _shingle_hashes(text)
+    if hashes.size == 0:
+        return None
+    signature = np.full(NUM_PERM, _MAX_HASH, dtype=np.uint64)
+    for start in range(0, hashes.size, _BLOCK_SIZE):
+        block = hashes[start:start + _BLOCK_SIZE]
+        permuted = (_PERM_A[:, None] * block[None, :] + _PERM_B[:, None]) % _MERSENNE_PRIME & _MAX_HASH
+        np.minimum(signature, permuted.min(axis=1), out=signature)
+    signature = signature.astype(np.uint32)
+    _signature_cache.set(key, signature)
+    return signature
+
+
+def similarity(a, b):
+    """2つの署名から推定したJaccard係数。"""
+    if a is None or b is None:
+        return 0.0
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+
+def to_bytes(signature):
+    return signature.astype('<u4').tobytes()
+
+
+def from_bytes(data):
+    return np.frombuffer(data, dtype='<u4') if data else None
+
+
+def band_keys(signature):
+    """LSHのバケットキー（バンドごとに1つ）を返す。"""
+    keys = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS].astype('<u4').tobytes()
+        keys.append(f"{band:02d}:{hashlib.blake2b(rows, digest_size=8).hexdigest()}")
+    return keys
+
+
+class DistinctContents:
+    """
+    取得できた本文のうち、互いに重複しない（collapse_duplicatesで1件にまとめられない）ものの件数。
+    記事の取得の途中で、十分な件数が揃ったかの判定に使う。
+    """
+
+    def __init__(self, threshold=None):
+        self.threshold = threshold or Config.ARTICLE_DEDUP_THRESHOLD
+        self._signatures = []
+
+    def add(self, content):
+        signature = minhash(content)
+        if signature is None:
+            return
+        if all(similarity(signature, other) < self.threshold for other in self._signatures):
+            self._signatures.append(signature)
+
+    def update(self, contents):
+        for content in contents:
+            self.add(content)
+
+    def __len__(self):
+        return len(self._signatures)
+
+
+def collapse_duplicates(sources, threshold=None):
+    """
+    1ターン内の記事のうち、先に出現した記事とほぼ同じ内容のものを重複として除く。
+    重複した記事は本文をNoneにし、duplicate_ofに元の記事のURLを入れる。
+    各sourceには署名を"fingerprint"として格納する（保存時に再利用）。
+    """
+    threshold = threshold or Config.ARTICLE_DEDUP_THRESHOLD
+    kept = []
+    for source in sources:
+        if not source.get("content"):
+            continue
+        signature = minhash(source["content"])
+        source["fingerprint"] = signature
+        original = next((other for other in kept if similarity(signature, other["fingerprint"]) >= threshold), None)
+        if original is not None:
+            source["content"] = None
+            source["duplicate_of"] = original["url"]
+        else:
+            kept.append(source)
+    return sources
+
+
+def find_canonical_ids(signatures, threshold=None):
+    """
+    {キー: 署名} のそれぞれについて、LSHの索引から類似する既存の正規記事を探す。
+    {キー: 正規記事のID} を返す（見つからないキーは含まない）。
+    """
+    threshold = threshold or Config.ARTICLE_DEDUP_THRESHOLD
+    keys = {key: band_keys(signature) for key, signature in signatures.items() if signature is not None}
+    all_keys = {bucket for buckets_of in keys.values() for bucket in buckets_of}
+    if not all_keys:
+        return {}
+
+    # 同じバケットに入った記事のみを候補とする（全件比較しない）
+    buckets = {}
+    for bucket, article_id in db.session.query(ArticleLshBand.bucket, ArticleLshBand.article_id).filter(
+        ArticleLshBand.bucket.in_(all_keys)
+    ):
+        buckets.setdefault(bucket, set()).add(article_id)
+    candidate_ids = set().union(*buckets.values()) if buckets else set()
+    if not candidate_ids:
+        return {}
+
+    candidates = {
+        article_id: (from_bytes(fingerprint), canonical_id)
+        for article_id, fingerprint, canonical_id in db.session.query(
+            DBArticle.id, DBArticle.fingerprint, DBArticle.canonical_id
+        ).filter(DBArticle.id.in_(candidate_ids))
+    }
+
+    canonical = {}
+    for key, buckets_of in keys.items():
+        best_id, best_score = None, threshold
+        for article_id in set().union(*(buckets.get(bucket, set()) for bucket in buckets_of)):
+            fingerprint, canonical_id = candidates.get(article_id, (None, None))
+            score = similarity(signatures[key], fingerprint)
+            if score >= best_score:
+                best_id, best_score = canonical_id or article_id, score
+        if best_id is not None:
+            canonical[key] = best_id
+    return canonical
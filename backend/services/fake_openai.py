@@ -0,0 +1,88 @@
+# backend/services/fake_openai.py
+import asyncio
+import time
+from types import SimpleNamespace
+
+
+class FakeStream:
+    """OpenAIのストリーミングレスポンスを模倣するイテレータ。"""
+
+    def __init__(self, pieces, delay=0.0, usage=None):
+        self._pieces = list(pieces)
+        self._delay = delay
+        self._usage = usage
+        self.closed = False
+
+    def __iter__(self):
+        for piece in self._pieces:
+            if self.closed:
+                return
+            if self._delay:
+                time.sleep(self._delay)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))], usage=None)
+        if self._usage is not None and not self.closed:
+            # stream_options={"include_usage": True} の場合の最後のチャンク
+            yield SimpleNamespace(choices=[], usage=self._usage)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeAsyncStream(FakeStream):
+    """OpenAIの非同期ストリーミングレスポンス（AsyncStream）を模倣する。"""
+
+    async def __aiter__(self):
+        for piece in self._pieces:
+            if self.closed:
+                return
+            if self._delay:
+                await asyncio.sleep(self._delay)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))], usage=None)
+        if self._usage is not None and not self.closed:
+            yield SimpleNamespace(choices=[], usage=self._usage)
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeOpenAI:
+    """
+    オフライン検証用のOpenAIクライアント。
+    chat.completions.createのみを実装し、固定の応答を返す（stream=Trueにも対応）。
+    """
+    stream_class = FakeStream
+
+    def __init__(self, reply="これはテスト用の応答です。", chunk_size=8, delay=0.0):
+        self.reply = reply
+        self.chunk_size = chunk_size
+        self.delay = delay
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _respond(self, model, messages, stream, kwargs):
+        self.calls.append({"model": model, "messages": messages, "stream": stream, **kwargs})
+        usage = SimpleNamespace(prompt_tokens=0, completion_tokens=0, total_tokens=0)
+        if stream:
+            pieces = [self.reply[i:i + self.chunk_size] for i in range(0, len(self.reply), self.chunk_size)]
+            include_usage = (kwargs.get("stream_options") or {}).get("include_usage")
+            return self.stream_class(pieces, delay=self.delay, usage=usage if include_usage else None)
+
+        message = SimpleNamespace(role="assistant", content=self.reply)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+    def _create(self, model, messages, stream=False, **kwargs):
+        response = self._respond(model, messages, stream, kwargs)
+        if not stream and self.delay:
+            time.sleep(self.delay)
+        return response
+
+
+class FakeAsyncOpenAI(FakeOpenAI):
+    """FakeOpenAIの非同期版（ASGIモード用）。待機はasyncio.sleepで行う。"""
+    stream_class = FakeAsyncStream
+
+    async def _create(self, model, messages, stream=False, **kwargs):
+        response = self._respond(model, messages, stream, kwargs)
+        if not stream and self.delay:
+            await asyncio.sleep(self.delay)
+        return response
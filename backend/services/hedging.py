@@ -0,0 +1,55 @@
+# backend/services/hedging.py
+import threading
+from collections import deque
+
+
+class HedgePolicy:
+    """
+    記事取得のヘッジの判定。最近の取得時間（成功・失敗を問わず、1件ごと）を記録し、
+    そのパーセンタイル（ARTICLE_FETCH_HEDGE_PERCENTILE）を過ぎても終わらない取得は同じURLをもう1本取得させる。
+    取得には本文の解析（CPU）も含まれ、ヘッジはその分の負荷も増やすため、
+    記録がmin_samples件に満たず分布が分からないうちはヘッジしない。
+    """
+
+    def __init__(self, window=200, min_samples=20):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.min_samples = min_samples
+        self.enabled = True
+        self.percentile = 95.0
+        self.min_delay = 0.5
+        self.max_per_turn = 2
+
+    def init_app(self, app):
+        config = app.config
+        self.enabled = config.get('ARTICLE_FETCH_HEDGE', True)
+        self.percentile = config.get('ARTICLE_FETCH_HEDGE_PERCENTILE', 95.0)
+        self.min_delay = config.get('ARTICLE_FETCH_HEDGE_MIN_DELAY', 0.5)
+        self.max_per_turn = config.get('ARTICLE_FETCH_HEDGE_MAX_PER_TURN', 2)
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def delay(self):
+        """取得を始めてからヘッジするまでの秒数。ヘッジしない場合はNone。"""
+        if not self.enabled or self.max_per_turn <= 0:
+            return None
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < self.min_samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * self.percentile / 100))
+        return max(self.min_delay, samples[index])
+
+    def stats(self):
+        with self._lock:
+            samples = len(self._samples)
+        return {
+            "enabled": self.enabled,
+            "samples": samples,
+            "delay": self.delay(),
+        }
+
+
+hedge_policy = HedgePolicy()
@@ -0,0 +1,255 @@
+# backend/services/job_queue.py
+import atexit
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert, literal, select, update
+from models import db, ChatJob, Project, User
+from .openai_service import run_ai_pipeline, PipelineCancelled
+from .rate_limit import RateLimited
+from .metrics import record_turn
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+def transient_errors():
+    """
+    再試行する一時的なエラー（接続失敗、タイムアウト、レート制限、上流の5xx）。
+    上流への呼び出しごとの再試行（UpstreamGovernor）で解消しなかった場合にジョブごと再試行する。
+    openaiの読み込みを起動時に行わないよう、最初のジョブの実行時に組み立てる。
+    """
+    import openai
+    return (
+        openai.APIConnectionError,
+        openai.RateLimitError,
+        openai.InternalServerError,
+        RateLimited,
+        ConnectionError,
+        TimeoutError,
+    )
+
+
+class JobQueueFull(RateLimited):
+    """ユーザーごとの待機ジョブ数の上限を超えた場合の例外。retry_afterは再試行までの目安の秒数。"""
+
+    def __init__(self, retry_after):
+        super().__init__('job_queue', retry_after)
+
+
+class JobQueue:
+    """
+    AI応答生成のジョブキュー。外部ブローカーを使わず、chat_jobテーブルをキューとして使う。
+    ワーカースレッドがジョブを取り出してパイプラインを実行し、一時的なエラーは指数バックオフで再試行する。
+    ワーカーはstart()で起動する（リクエストを処理するプロセスでのみ。app.start_background_workers）。
+    """
+
+    def __init__(self):
+        self._app = None
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._started = False
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._claim_lock = threading.Lock()
+
+    def init_app(self, app):
+        self._app = app
+        self.workers = app.config.get('JOB_WORKERS', 2)
+        self.max_running_per_user = app.config.get('JOB_MAX_RUNNING_PER_USER', 1)
+        self.max_queued_per_user = app.config.get('JOB_MAX_QUEUED_PER_USER', 5)
+        self.max_attempts = app.config.get('JOB_MAX_ATTEMPTS', 3)
+        self.retry_backoff = app.config.get('JOB_RETRY_BACKOFF', 2.0)
+        self.poll_interval = app.config.get('JOB_POLL_INTERVAL', 1.0)
+        self.stale_after = timedelta(seconds=app.config.get('JOB_STALE_AFTER', 600))
+        self.full_retry_after = app.config.get('JOB_QUEUE_FULL_RETRY_AFTER', 10)
+
+    def start(self):
+        """ワーカースレッドを起動する（2回目以降は何もしない）。"""
+        if self._started:
+            return
+        with self._start_lock:
+            if self._started:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._worker_loop, name=f'chat-job-worker-{index}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            atexit.register(self.shutdown)
+            self._started = True
+
+    def enqueue(self, user_id, project_id, prompt):
+        """
+        ジョブを登録し、呼び出し側がセッションに加えた変更（ユーザーのメッセージなど）と一緒にコミットする。
+        ユーザーの待機・実行中のジョブがJOB_MAX_QUEUED_PER_USER件に達している場合は
+        それらの変更もロールバックしてJobQueueFullを送出する。
+        """
+        # 件数の確認と登録を1文で行い、同時の登録が上限を超えないようにする。
+        # PostgreSQLではユーザーの行をロックして同じユーザーの登録を直列化する（SQLiteは書き込み自体が直列化される）
+        db.session.query(User.id).filter_by(id=user_id).with_for_update().scalar()
+        active = select(func.count(ChatJob.id)).where(
+            ChatJob.user_id == user_id,
+            ChatJob.status.in_([QUEUED, RUNNING]),
+        ).scalar_subquery()
+        job_id = uuid.uuid4().hex
+        now = datetime.now()
+        values = {
+            'id': job_id, 'user_id': user_id, 'project_id': project_id, 'prompt': prompt, 'status': QUEUED,
+            'attempts': 0, 'cancel_requested': False, 'next_attempt_at': now, 'created_at': now,
+        }
+        inserted = db.session.execute(
+            insert(ChatJob).from_select(
+                list(values),
+                select(*(literal(value, ChatJob.__table__.c[key].type) for key, value in values.items()))
+                .where(active < self.max_queued_per_user),
+            )
+        ).rowcount
+        if not inserted:
+            db.session.rollback()
+            raise JobQueueFull(self.full_retry_after)
+
+        db.session.commit()
+        self._wakeup.set()
+        return db.session.get(ChatJob, job_id)
+
+    def cancel(self, job):
+        """
+        待機中のジョブは即座に取り消し、実行中のジョブは次の区切りで中断させる。
+        読み込んだ後にワーカーが取り出した場合に実行中のジョブを取り消し済みにしないよう、DBの状態を条件に更新する。
+        """
+        cancelled = db.session.execute(
+            update(ChatJob).where(ChatJob.id == job.id, ChatJob.status == QUEUED)
+            .values(status=CANCELLED, finished_at=datetime.now()),
+            execution_options={'synchronize_session': False},
+        ).rowcount
+        if not cancelled:
+            db.session.execute(
+                update(ChatJob).where(ChatJob.id == job.id, ChatJob.status == RUNNING).values(cancel_requested=True),
+                execution_options={'synchronize_session': False},
+            )
+        db.session.commit()
+        db.session.refresh(job)
+        return job
+
+    def shutdown(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def process_next(self):
+        """実行可能なジョブを1件取り出して実行し、そのIDを返す（無ければNone）。アプリコンテキスト内で呼ぶ。"""
+        job_id = self._claim()
+        if job_id:
+            self._run(job_id)
+        return job_id
+
+    def _worker_loop(self):
+        while not self._stop.is_set():
+            try:
+                with self._app.app_context():
+                    if self.process_next():
+                        continue
+            except Exception as e:
+                logging.error(f"ジョブワーカーでエラーが発生しました: {e}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _claim(self):
+        """実行可能なジョブを1件取得し、runningに更新してIDを返す。"""
+        now = datetime.now()
+        with self._claim_lock:
+            # 停止したワーカーが残した実行中ジョブを待機状態に戻す。
+            # 試行回数が上限に達したジョブ（ワーカーを停止させ続けるジョブなど）は失敗にする
+            stale = ChatJob.query.filter(
+                ChatJob.status == RUNNING,
+                ChatJob.started_at < now - self.stale_after,
+            )
+            abandoned = stale.filter(ChatJob.attempts >= self.max_attempts).update({
+                'status': FAILED,
+                'error': "ワーカーが応答しないまま再試行の上限に達しました",
+                'finished_at': now,
+            }, synchronize_session=False)
+            for _ in range(abandoned):
+                record_turn("job", "error")
+            if abandoned:
+                logging.error(f"応答のないジョブ{abandoned}件が再試行の上限に達したため失敗にしました")
+            stale.update({'status': QUEUED}, synchronize_session=False)
+            db.session.commit()
+
+            candidates = db.session.query(ChatJob.id, ChatJob.user_id).filter(
+                ChatJob.status == QUEUED,
+                ChatJob.next_attempt_at <= now,
+            ).order_by(ChatJob.created_at).limit(20).all()
+
+            for job_id, user_id in candidates:
+                # ユーザーごとの実行中の件数の確認と取り出しを1文で行う（他のワーカー・プロセスと競合した場合は更新件数が0になる）。
+                # PostgreSQLではユーザーの行をロックして同じユーザーの取り出しを直列化する（SQLiteは書き込み自体が直列化される）
+                db.session.query(User.id).filter_by(id=user_id).with_for_update().scalar()
+                running = select(func.count(ChatJob.id)).where(
+                    ChatJob.user_id == user_id,
+                    ChatJob.status == RUNNING,
+                ).scalar_subquery()
+                claimed = db.session.execute(
+                    update(ChatJob)
+                    .where(ChatJob.id == job_id, ChatJob.status == QUEUED, running < self.max_running_per_user)
+                    .values(status=RUNNING, started_at=now, attempts=ChatJob.attempts + 1),
+                    execution_options={'synchronize_session': False},
+                ).rowcount
+                db.session.commit()
+                if claimed:
+                    return job_id
+            db.session.commit()
+            return None
+
+    def _run(self, job_id):
+        job = db.session.get(ChatJob, job_id)
+        project = db.session.get(Project, job.project_id)
+
+        def cancel_check():
+            return db.session.query(ChatJob.cancel_requested).filter_by(id=job_id).scalar()
+
+        try:
+            if project is None:
+                raise LookupError("プロジェクトが見つかりません")
+            result = run_ai_pipeline(project, job.prompt, cancel_check=cancel_check)
+            job.status = SUCCEEDED
+            job.result = {"ai_response": result["ai_response"], "articles": result["articles"]}
+            job.finished_at = datetime.now()
+            record_turn("job", "success", result["db"])
+            logging.info(f"ジョブ {job_id} が完了しました（試行{job.attempts}回目）")
+        except PipelineCancelled:
+            db.session.rollback()
+            job.status = CANCELLED
+            job.finished_at = datetime.now()
+            record_turn("job", "cancelled")
+            logging.info(f"ジョブ {job_id} をキャンセルしました")
+        except transient_errors() as e:
+            db.session.rollback()
+            job.error = str(e)
+            if job.attempts < self.max_attempts:
+                delay = self.retry_backoff * (2 ** (job.attempts - 1))
+                # レート制限の場合は制限が解けるまで待つ
+                delay = max(delay, getattr(e, 'retry_after', 0))
+                job.status = QUEUED
+                record_turn("job", "retried")
+                job.next_attempt_at = datetime.now() + timedelta(seconds=delay)
+                logging.warning(f"ジョブ {job_id} を{delay:.0f}秒後に再試行します: {e}")
+            else:
+                job.status = FAILED
+                job.finished_at = datetime.now()
+                record_turn("job", "error")
+                logging.error(f"ジョブ {job_id} は再試行の上限に達しました: {e}")
+        except Exception as e:
+            db.session.rollback()
+            job.status = FAILED
+            job.error = str(e)
+            job.finished_at = datetime.now()
+            record_turn("job", "error")
+            logging.error(f"ジョブ {job_id} が失敗しました: {e}")
+        db.session.commit()
+
+
+job_queue = JobQueue()
@@ -0,0 +1,116 @@
+# backend/services/metrics.py
+"""
+Prometheus形式のメトリクス。/metrics で公開する。
+"""
+from prometheus_client import Counter, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+# パイプラインの段階（query, search, fetch, context, completion / completion_stream, persist）ごとの所要時間
+STAGE_SECONDS = Histogram(
+    'chat_stage_duration_seconds',
+    "チャットパイプラインの段階ごとの所要時間",
+    ['stage'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60),
+)
+
+# 記事1件ごとの取得時間（method: newspaper / selenium、outcome: success / empty / failed）
+ARTICLE_FETCH_SECONDS = Histogram(
+    'article_fetch_duration_seconds',
+    "記事1件の取得時間",
+    ['method', 'outcome'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30),
+)
+
+ARTICLE_FETCH_DEADLINE_MISSES = Counter(
+    'article_fetch_deadline_misses_total',
+    "締め切りまでに取得が完了しなかった記事の数",
+)
+
+# ターン単位の結果（mode: sync / stream / job、outcome: success / cache_hit / error / rate_limited / retried / cancelled / disconnected）
+CHAT_TURNS = Counter(
+    'chat_turns_total',
+    "処理したチャットターンの数",
+    ['mode', 'outcome'],
+)
+
+TURN_DB_QUERIES = Histogram(
+    'chat_turn_db_queries',
+    "チャットターン1回あたりのDBクエリ数",
+    buckets=(5, 10, 15, 20, 30, 50, 100, 200),
+)
+
+OPENAI_TOKENS = Counter(
+    'openai_tokens_total',
+    "OpenAI APIで消費したトークン数",
+    ['model', 'kind'],
+)
+
+
+# レート制限で待機・拒否した回数（scope: user / openai / cse）
+RATE_LIMITED = Counter(
+    'rate_limited_total',
+    "レート制限で待機・拒否した呼び出しの数",
+    ['scope'],
+)
+
+# 上流への呼び出しの再試行（reason: 429 / 5xx / connection）
+UPSTREAM_RETRIES = Counter(
+    'upstream_retries_total',
+    "上流への呼び出しを再試行した回数",
+    ['upstream', 'reason'],
+)
+
+
+# ターンで効いたパイプラインの最適化（hedged_fetch / hedge_won / sufficient_set / speculative_completion / speculation_discarded）
+PIPELINE_OPTIMIZATIONS = Counter(
+    'chat_pipeline_optimizations_total',
+    "チャットパイプラインで効いた最適化の回数",
+    ['optimization'],
+)
+
+
+# 応答の先行生成（PIPELINE_SPECULATIVE_COMPLETION）の結果（outcome: used / discarded / skipped）。
+# discardedは使わなかった先行生成で、トークン（openai_tokens_totalに含まれる）と上流の同時呼び出し数の枠を消費している
+SPECULATIVE_COMPLETIONS = Counter(
+    'chat_speculative_completions_total',
+    "応答の先行生成の回数（使った・破棄した・枠が無く行わなかった）",
+    ['outcome'],
+)
+
+
+def observe_stage(stage, seconds):
+    STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+def observe_article_fetch(method, outcome, seconds):
+    ARTICLE_FETCH_SECONDS.labels(method, outcome).observe(seconds)
+
+
+def record_turn(mode, outcome, db_stats=None):
+    CHAT_TURNS.labels(mode, outcome).inc()
+    if db_stats is not None:
+        TURN_DB_QUERIES.observe(db_stats["queries"])
+
+
+def record_optimization(name):
+    PIPELINE_OPTIMIZATIONS.labels(name).inc()
+
+
+def record_speculation(outcome):
+    SPECULATIVE_COMPLETIONS.labels(outcome).inc()
+
+
+def record_usage(model, usage):
+    """
+    レスポンスのusage（prompt_tokens / completion_tokens）を加算する。
+    LangChainのllm_output['token_usage']のような辞書も受け付ける。
+    """
+    if usage is None:
+        return
+    get = usage.get if isinstance(usage, dict) else lambda name, default: getattr(usage, name, default)
+    OPENAI_TOKENS.labels(model, 'prompt').inc(get('prompt_tokens', 0) or 0)
+    OPENAI_TOKENS.labels(model, 'completion').inc(get('completion_tokens', 0) or 0)
+
+
+def render():
+    """(本文, Content-Type) を返す。"""
+    return generate_latest(), CONTENT_TYPE_LATEST
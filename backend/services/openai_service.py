@@ -1,66 +1,74 @@
 # backend/services/openai_service.py
-import os
+import time
 import logging
-from openai import OpenAI as OpenAI_API
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
-from langchain.chains import LLMChain
-from langchain_openai import OpenAI
-from langchain.prompts import PromptTemplate
-from newspaper import Article as NewspaperArticle  # 別名でインポート
-from googleapiclient.discovery import build
 from .template_prompt import template_prompt
-from models import db, Article as DBArticle, Message
-from sqlalchemy.exc import IntegrityError
+from .registry import services
+from .browser_pool import browser_pool
+from .article_cache import article_cache
+from .search_cache import search_cache
+from .context_builder import build_context
+from .chunk_ranker import select_relevant_chunks
+from .dedup import collapse_duplicates, minhash
+from .persistence import query_tracker
+from .response_cache import response_cache
+from .rate_limit import RateLimited, upstream_governor
+from .timing import StageTimer
+from .hedging import hedge_policy
+from .metrics import observe_article_fetch, record_turn, record_usage
+from .pipeline import (
+    FetchRound,
+    CompletionStream,
+    COMPLETION_MODEL,
+    COMPLETION_OPTIONS,
+    ERROR_MESSAGE,
+    HISTORY_ONLY_RESULTS,
+    RATE_LIMITED_MESSAGE,
+    acquire_speculation_slot,
+    cached_response,
+    error_response,
+    keep_user_message,
+    log_optimizations,
+    rate_limited_response,
+    release_speculation_slot,
+    remember_response,
+    save_turn,
+    turn_result,
+    use_speculation,
+)
+from models import db, Article as DBArticle
+from config import Config
 from datetime import datetime
 
 load_dotenv()
 
 # ログの設定
-logging.basicConfig(level=logging.INFO)
-
-# APIキーの取得
-openai_api_key = os.getenv("OPENAI_API_KEY")
-google_api_key = os.getenv("GOOGLE_API_KEY")
-google_cse_id = os.getenv("GOOGLE_CSE_ID")
-
-# OpenAIのLLMクライアント
-llm = OpenAI(api_key=openai_api_key)
-
-# プロンプトテンプレート
-prompt_template = """
-ユーザーの質問: {user_prompt}
-この質問に基づいて、信頼性の高い情報を得るための最適な検索クエリを作成してください。検索クエリは具体的かつ簡潔に。
-検索クエリには絶対に引用符（""や''）を付けず、各キーワードをスペースで区切って作成すること。
-"""
-
-template = PromptTemplate(
-    input_variables=["user_prompt"],
-    template=prompt_template,
-)
-
-# チェーンの作成
-query_chain = LLMChain(
-    llm=llm,
-    prompt=template,
-)
+logging.basicConfig(level=Config.LOG_LEVEL)
 
 def generate_search_query(user_prompt):
-    search_query = query_chain.run(user_prompt=user_prompt)
+    cached_query = search_cache.get_query(user_prompt)
+    if cached_query:
+        logging.info(f"キャッシュ済みの検索クエリを使用します: {cached_query}")
+        return cached_query
+
+    search_query = upstream_governor.call("openai", services.query_chain.run, user_prompt=user_prompt)
     logging.info(f"生成された検索クエリ: {search_query}")
+    search_cache.set_query(user_prompt, search_query)
     return search_query
 
 def perform_search(search_query):
+    cached_results = search_cache.get_results(search_query)
+    if cached_results is not None:
+        logging.info(f"キャッシュ済みの検索結果を使用します: {search_query}")
+        return cached_results
+
     try:
-        # Google Custom Search APIのセットアップ
-        service = build("customsearch", "v1", developerKey=google_api_key)
-        res = service.cse().list(
-            q=search_query,
-            cx=google_cse_id,
-            num=5,
-        ).execute()
-
-        search_results = res.get('items', [])
-        logging.info(f"検索結果: {search_results}")
+        # Google Custom Search APIの呼び出し（共有の接続プールを使用、レート制限・再試行付き）
+        search_results = upstream_governor.call("cse", services.search, search_query, num=5)
+        # 検索結果の全文はDEBUG時のみ出力（INFOでは文字列化のコストも払わない）
+        logging.debug("検索結果: %s", search_results)
+        search_cache.set_results(search_query, search_results)
         return search_results
 
     except Exception as e:
@@ -69,185 +77,407 @@ def perform_search(search_query):
 
 def filter_reliable_sources(search_results):
     # カスタム検索エンジンでドメインを限定しているため、フィルタリングは不要かもしれません
-    logging.info(f"フィルタリングされた検索結果: {search_results}")
+    logging.debug("フィルタリングされた検索結果: %s", search_results)
     return search_results
 
-def fetch_article_content(url):
+def parse_article_html(url, html):
+    # newspaper3k（NLTK・lxmlを含む）は読み込みが重いため、最初の記事取得時に読み込む
+    from newspaper import Article as NewspaperArticle  # 別名でインポート
+
+    article = NewspaperArticle(url)
+    article.download(input_html=html)
+    article.parse()
+    return article.text
+
+def fetch_article_content(url, timeout=None):
+    timeout = timeout or Config.ARTICLE_FETCH_TIMEOUT
+    started = time.perf_counter()
     try:
-        # newspaper3kで記事を取得
-        article = NewspaperArticle(url)
-        article.download()
-        article.parse()
+        # 共有セッションでHTMLを取得し、newspaper3kで記事を解析
+        text = parse_article_html(url, services.fetch_html(url, timeout))
 
         # 記事の本文の長さを確認
-        if len(article.text.strip()) < 200:
+        if len(text.strip()) < 200:
             raise Exception("記事の内容が短すぎます。Seleniumを使用します。")
-        
-        return article.text
+
+        observe_article_fetch('newspaper', 'success', time.perf_counter() - started)
+        return text
 
     except Exception as e:
+        observe_article_fetch('newspaper', 'failed', time.perf_counter() - started)
         logging.warning(f"newspaper3kでの記事取得に失敗しました ({url}): {e}")
-        logging.info("Seleniumを使用して記事を取得します。")
+        return fetch_article_with_browser(url, timeout)
 
-        # Seleniumで記事を取得
-        try:
-            from selenium import webdriver
-            from selenium.webdriver.chrome.options import Options
-            from selenium.webdriver.common.by import By
-            from selenium.webdriver.support.ui import WebDriverWait
-            from selenium.webdriver.support import expected_conditions as EC
+def fetch_article_with_browser(url, timeout):
+    logging.info("Seleniumを使用して記事を取得します。")
+    started = time.perf_counter()
 
-            # ヘッドレスモードの設定
-            chrome_options = Options()
-            chrome_options.add_argument("--headless")
-            chrome_options.add_argument("--no-sandbox")
-            chrome_options.add_argument("--disable-dev-shm-usage")
+    # Seleniumで記事を取得
+    try:
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
 
-            # WebDriverのパスを指定（必要に応じて変更）
-            driver = webdriver.Chrome(options=chrome_options)
+        # プールから常駐ブラウザを借りて取得（起動コストを毎回払わない）
+        with browser_pool.lease() as driver:
+            driver.set_page_load_timeout(timeout)
 
             driver.get(url)
 
             # ページの読み込みを待機（必要に応じて調整）
-            WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.TAG_NAME, 'body')))
+            WebDriverWait(driver, timeout).until(EC.presence_of_element_located((By.TAG_NAME, 'body')))
 
             # ページのHTMLを取得
             html = driver.page_source
 
-            driver.quit()
+        # newspaper3kでHTMLから記事を解析
+        text = parse_article_html(url, html)
 
-            # newspaper3kでHTMLから記事を解析
-            article = NewspaperArticle(url)
-            article.set_html(html)
-            article.parse()
+        observe_article_fetch('selenium', 'success' if text else 'empty', time.perf_counter() - started)
+        return text
 
-            return article.text
+    except Exception as se:
+        observe_article_fetch('selenium', 'failed', time.perf_counter() - started)
+        logging.error(f"Seleniumでの記事取得に失敗しました ({url}): {se}")
+        return ""
 
-        except Exception as se:
-            logging.error(f"Seleniumでの記事取得に失敗しました ({url}): {se}")
-            return ""
+# 記事取得用のスレッドプール（アプリ全体で共有）
+_fetch_executor = ThreadPoolExecutor(
+    max_workers=Config.ARTICLE_FETCH_WORKERS,
+    thread_name_prefix='article-fetch',
+)
 
-def save_article(title, url, content):
+# ヘッジ（同じ記事の2本目の取得）用のスレッドプール（通常の取得で埋まっていてもすぐに始められるよう分ける）
+_hedge_executor = ThreadPoolExecutor(
+    max_workers=Config.ARTICLE_FETCH_HEDGE_WORKERS,
+    thread_name_prefix='article-hedge',
+)
+
+def _timed_fetch(url, timeout):
+    started = time.monotonic()
+    content = fetch_article_content(url, timeout=timeout)
+    elapsed = time.monotonic() - started
+    hedge_policy.observe(elapsed)
+    # 重複判定の署名を取得のスレッドで計算しておく（本文のハッシュごとにキャッシュされる）
+    minhash(content)
+    return content, elapsed
+
+def _store_when_done(url):
+    # 待たずに返した後に終わった取得も記事キャッシュに入れ、次のターンで使う
+    def callback(future):
+        if not future.cancelled() and future.exception() is None:
+            article_cache.store(url, future.result()[0])
+    return callback
+
+def fetch_articles_concurrently(search_results, timer=None, budget=None):
     """
-    記事を保存し、既存の場合は既存のレコードを取得。
+    検索結果の記事を並列に取得し、検索結果と同じ順序で本文のリストを返す。
+    全体の締め切り（budgetを指定した場合はその秒数）までに取得できなかった記事はNoneとなる。
+    本文を取得できた記事が、重複（転載など）を除いてARTICLE_FETCH_SUFFICIENT件に達した時点で残りを待たずに返す。
+    遅い取得はHedgePolicyの判定で同じURLをもう1本取得し、先に終わった方を使う（判定はFetchRound）。
     """
-    try:
-        # 既存のArticleを検索
-        article = DBArticle.query.filter_by(title=title, url=url).first()
-        if not article:
-            # 新規記事を作成
-            article = DBArticle(title=title, url=url, content=content)
-            db.session.add(article)
-            db.session.commit()
-            logging.info(f"新規記事を保存しました: {title}")
+    links = [result.get('link', '') for result in search_results]
+    fetch = FetchRound(links, time.monotonic(), budget, timer)
+
+    # キャッシュ済みの記事はネットワークにアクセスしない
+    cached = article_cache.lookup([link for link in links if link], fetch_article_content)
+    for index, link in enumerate(links):
+        if link in cached:
+            fetch.use_cached(index, cached[link])
+        elif link:
+            fetch.add(_fetch_executor.submit(_timed_fetch, link, Config.ARTICLE_FETCH_TIMEOUT), index)
+    fetch.distinct.update(content for content in fetch.contents if content)
+
+    while True:
+        step = fetch.next_wait(time.monotonic())
+        if step is None:
+            break
+        timeout, active = step
+        done, _ = wait(active, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            fetch.complete(future)
+        for index in fetch.due_hedges(time.monotonic()):
+            fetch.add_hedge(_hedge_executor.submit(_timed_fetch, links[index], Config.ARTICLE_FETCH_TIMEOUT), index)
+
+    # 残りの取得は待たずに返す（実行中の取得は終わり次第キャッシュに入れる）
+    for future, url, needed in fetch.leftovers():
+        if not future.cancel() and needed:
+            future.add_done_callback(_store_when_done(url))
+
+    return fetch.finish()
+
+def get_openai_client():
+    # アプリ起動時に作成した共有クライアント（OPENAI_FAKE=trueの場合はダミー）
+    return services.openai
+
+def existing_article_ids(links):
+    # 既存の記事IDをまとめて取得（チャンク索引の再利用に使う）
+    return dict(db.session.query(DBArticle.url, DBArticle.id).filter(DBArticle.url.in_(links)).all())
+
+def assemble_sources(filtered_results, contents, article_ids, timer):
+    """
+    検索結果と取得した本文から、取得元ごとの記事情報・整形された検索結果・記事一覧を組み立てる。
+    collect_articlesとASGIモードの非同期パイプラインで共有する。
+    """
+    sources = []
+    articles_list = []
+
+    for result, content in zip(filtered_results, contents):
+        title = result.get('title', 'No Title')
+        link = result.get('link', '')
+        if content:
+            sources.append({"title": title, "url": link, "content": content, "article_id": article_ids.get(link)})
         else:
-            logging.info(f"既存の記事を使用します: {title}")
-        return article
-    except IntegrityError:
-        db.session.rollback()
-        logging.warning(f"重複する記事が存在します: {title}, {url}")
-        return DBArticle.query.filter_by(title=title, url=url).first()
-    except Exception as e:
-        db.session.rollback()
-        logging.error(f"記事の保存中にエラーが発生しました: {e}")
-        return None
-
-def associate_article_with_message(article, message):
+            sources.append({"title": title, "url": link, "content": None})
+
+    # 転載などでほぼ同じ内容の記事は1件にまとめる（LLMに同じ本文を何度も渡さない）
+    with timer.stage("dedup"):
+        collapse_duplicates(sources)
+    for source in sources:
+        if source["content"]:
+            articles_list.append({
+                "title": source["title"],
+                "url": source["url"]
+            })
+        elif source.get("duplicate_of"):
+            logging.info(f"重複した記事を除外しました ({source['url']} → {source['duplicate_of']})")
+
+    formatted_search_results = "\n".join([f"{i+1}. {result['title']}: {result['link']}" for i, result in enumerate(filtered_results)])
+    logging.debug("整形された検索結果:\n%s", formatted_search_results)
+
+    return sources, formatted_search_results, articles_list
+
+def collect_articles(search_query, timer=None, fetch_budget=None):
     """
-    ArticleとMessageの関係を構築。
+    検索の実行と記事の取得を行う（記事の保存はpersist_turnでまとめて行う）。
+    fetch_budgetを指定した場合は記事の取得をその秒数で打ち切る。
+    (取得元ごとの記事情報, 整形された検索結果, 記事一覧) を返す。
     """
-    if article and message:
-        if article not in message.articles:
-            message.articles.append(article)
-            db.session.commit()
-            logging.info(f"Article '{article.title}' をMessage ID {message.id} に関連付けました。")
-
-def get_ai_response_with_search(project, user_prompt):
-    try:
-        system_message = {"role": "system", "content": template_prompt}
-
-        conversation_history = []
-        for message in project.messages:
-            role = "user" if message.sender == "user" else "assistant"
-            conversation_history.append({"role": role, "content": message.content})
-
-        # 検索クエリの生成
-        search_query = generate_search_query(user_prompt)
+    timer = timer or StageTimer()
 
-        # 検索の実行
+    # 検索の実行
+    with timer.stage("search"):
         search_results = perform_search(search_query)
 
-        # フィルタリング（必要に応じて）
-        filtered_results = filter_reliable_sources(search_results)
-
-        articles_content = []
-        formatted_search_results = ""
-        articles_list = []
-
-        if not filtered_results:
-            logging.warning("検索結果が見つかりませんでした。")
-            formatted_search_results = "検索結果が見つかりませんでした。"
-        else:
-            for result in filtered_results:
-                title = result.get('title', 'No Title')
-                link = result.get('link', '')
-                content = fetch_article_content(link)
-                if content:
-                    # 記事を保存
-                    article = save_article(title, link, content)
-                    if article:
-                        articles_list.append({
-                            "title": article.title,
-                            "url": article.url
-                        })
-                        articles_content.append(f"### {title}\n{content}\nリンク: {link}")
-                else:
-                    articles_content.append(f"### {title}\nリンク: {link}\n記事内容の取得に失敗しました。")
-
-            formatted_search_results = "\n".join([f"{i+1}. {result['title']}: {result['link']}" for i, result in enumerate(filtered_results)])
-            logging.info(f"整形された検索結果:\n{formatted_search_results}")
-            logging.info(f"記事内容:\n" + "\n\n".join(articles_content))
-
-        # 会話履歴に追加
-        if articles_content:
-            conversation_history.append({"role": "system", "content": f"最新の検索結果と記事内容:\n" + "\n\n".join(articles_content)})
-        else:
-            conversation_history.append({"role": "system", "content": f"最新の検索結果:\n{formatted_search_results}"})
+    # フィルタリング（必要に応じて）
+    filtered_results = filter_reliable_sources(search_results)
+
+    if not filtered_results:
+        logging.warning("検索結果が見つかりませんでした。")
+        return [], "検索結果が見つかりませんでした。", []
+
+    # 記事を並列に取得（締め切りまでに取得できた分のみ使用）
+    with timer.stage("fetch"):
+        contents = fetch_articles_concurrently(filtered_results, timer, fetch_budget)
+
+    article_ids = existing_article_ids([result.get('link', '') for result in filtered_results])
+    return assemble_sources(filtered_results, contents, article_ids, timer)
+
+def build_chat_messages(project, user_prompt, sources, formatted_search_results, summary_update=None):
+    # 記事全文ではなく、プロンプトと関連度の高いチャンクのみを使う
+    select_relevant_chunks(user_prompt, sources)
+
+    # トークン予算内に収まるよう、履歴の要約と記事の抜粋で組み立てる。
+    # (メッセージ, 会話要約の更新) を返す（要約の更新はpersist_turnでターンと一緒に保存する）
+    return build_context(
+        project,
+        user_prompt,
+        sources,
+        formatted_search_results,
+        template_prompt,
+        get_openai_client,
+        summary_update,
+    )
+
+# 会話履歴のみのコンテキストで先行させる応答の生成用（PIPELINE_SPECULATIVE_COMPLETION）
+_speculation_executor = ThreadPoolExecutor(
+    max_workers=Config.PIPELINE_SPECULATIVE_WORKERS,
+    thread_name_prefix='speculative-completion',
+)
+def create_completion(messages):
+    # OpenAI APIの呼び出し（レート制限・再試行付き）
+    response = upstream_governor.call(
+        "openai",
+        get_openai_client().chat.completions.create,
+        messages=messages,
+        **COMPLETION_OPTIONS,
+    )
+    record_usage(COMPLETION_MODEL, getattr(response, "usage", None))
+    return response
+
+class PipelineCancelled(Exception):
+    """キャンセル要求によりパイプラインを中断した場合の例外。"""
+
+def run_ai_pipeline(project, user_prompt, cancel_check=None, save_user_message=False, user_created_at=None):
+    """
+    検索・記事取得・応答生成・保存を行う。例外はそのまま送出する。
+    cancel_checkが真を返した場合は各段階の区切りでPipelineCancelledを送出する。
+    save_user_messageが真の場合はユーザーのメッセージもAIの応答と同じトランザクションで保存する。
+    PIPELINE_SPECULATIVE_COMPLETION=trueの場合は、検索・記事の取得と並行して会話履歴のみのコンテキストで
+    応答の生成を始め、記事の本文を1件も取得できなかった場合はその応答を使う（取得できた場合は破棄する）。
+    結果には段階ごとの所要時間（timings）、DBクエリの統計（db）、効いた最適化（optimizations）を含める。
+    """
+    def checkpoint():
+        if cancel_check is not None and cancel_check():
+            raise PipelineCancelled()
+
+    timer = StageTimer()
+    with query_tracker.track(f"チャットターン (project {project.id})") as db_stats:
+        speculative = None
+        fetch_budget = None
+        summary_update = None
+        if Config.PIPELINE_SPECULATIVE_COMPLETION and acquire_speculation_slot():
+            try:
+                with timer.stage("context"):
+                    history_messages, summary_update = build_chat_messages(project, user_prompt, [], HISTORY_ONLY_RESULTS)
+                speculative = _speculation_executor.submit(create_completion, history_messages)
+            except Exception:
+                release_speculation_slot()
+                raise
+            speculative.add_done_callback(release_speculation_slot)
+            fetch_budget = Config.PIPELINE_SPECULATIVE_FETCH_BUDGET
 
-        conversation_history.append({"role": "user", "content": user_prompt})
+        try:
+            # 検索クエリの生成
+            with timer.stage("query"):
+                search_query = generate_search_query(user_prompt)
+            checkpoint()
+
+            sources, formatted_search_results, articles_list = collect_articles(search_query, timer, fetch_budget)
+
+            if speculative is not None and use_speculation(sources, timer):
+                with timer.stage("completion"):
+                    response = speculative.result()
+            else:
+                if speculative is not None:
+                    # 実行中の場合は止められず、完了まで枠とOpenAIのトークンを消費する
+                    speculative.cancel()
+                with timer.stage("context"):
+                    messages, summary_update = build_chat_messages(
+                        project, user_prompt, sources, formatted_search_results, summary_update,
+                    )
+                checkpoint()
+
+                with timer.stage("completion"):
+                    response = create_completion(messages)
+        finally:
+            if speculative is not None:
+                speculative.cancel()
 
-        messages = [system_message] + conversation_history
+        ai_response = response.choices[0].message.content.strip()
+        checkpoint()
 
-        # OpenAI APIの呼び出し
-        response = OpenAI_API(api_key=openai_api_key).chat.completions.create(
-            model="chatgpt-4o-latest",
-            messages=messages,
-            temperature=0.7,
-            max_tokens=1500,
-        )
+        with timer.stage("persist"):
+            message_id = save_turn(
+                project.id, ai_response, sources,
+                user_prompt if save_user_message else None, user_created_at, summary_update,
+            )
 
-        ai_response = response.choices[0].message.content.strip()
+    return turn_result(project, message_id, ai_response, articles_list, timer, db_stats)
 
-        # AIのメッセージをデータベースに保存
-        ai_message = Message(project_id=project.id, sender='ai', content=ai_response, created_at=datetime.utcnow())
-        db.session.add(ai_message)
-        db.session.commit()
+def get_ai_response_with_search(project, user_prompt, save_user_message=False):
+    user_created_at = datetime.utcnow()
+    try:
+        # 似たプロンプトへの応答がキャッシュにあれば検索・生成を省略する（RESPONSE_CACHE_ENABLED）
+        context_key = None
+        if response_cache.enabled:
+            cached, context_key = cached_response(project, user_prompt, save_user_message, user_created_at)
+            if cached is not None:
+                record_turn("sync", "cache_hit", cached["db"])
+                return cached
+
+        result = run_ai_pipeline(project, user_prompt, save_user_message=save_user_message, user_created_at=user_created_at)
+        record_turn("sync", "success", result["db"])
+        remember_response(context_key, user_prompt, result)
+        return result
+
+    except RateLimited as e:
+        logging.warning(f"レート制限により応答を生成できませんでした: {e}")
+        record_turn("sync", "rate_limited")
+        if save_user_message:
+            keep_user_message(project, user_prompt, user_created_at)
+        return rate_limited_response(e)
 
-        # 関連する記事をメッセージと関連付け
-        if articles_list:
-            for article in articles_list:
-                db_article = DBArticle.query.filter_by(title=article['title'], url=article['url']).first()
-                if db_article:
-                    associate_article_with_message(db_article, ai_message)
+    except Exception as e:
+        logging.error(f"Error: {e}")
+        record_turn("sync", "error")
+        if save_user_message:
+            keep_user_message(project, user_prompt, user_created_at)
+        return error_response()
 
-        return {
+def stream_ai_response_with_search(project, user_prompt, save_user_message=False):
+    """
+    get_ai_response_with_searchのストリーミング版。
+    (イベント名, データ) のタプルを順に生成する。
+    ジェネレータが途中で閉じられた場合（クライアント切断）は上流のストリームも閉じ、AIのメッセージは保存しない。
+    """
+    user_created_at = datetime.utcnow()
+    timer = StageTimer()
+    try:
+        with timer.stage("query"):
+            search_query = generate_search_query(user_prompt)
+        yield "query", {"search_query": search_query}
+
+        sources, formatted_search_results, articles_list = collect_articles(search_query, timer)
+        yield "articles", {"articles": articles_list}
+
+        with timer.stage("context"):
+            messages, summary_update = build_chat_messages(project, user_prompt, sources, formatted_search_results)
+
+        # クライアントへの送信待ちも含むため、同期版のcompletionとは別の段階として記録する
+        # 同時呼び出し数の枠はストリームを開始する呼び出しの間だけ使い、クライアントへの送信中は使わない
+        with timer.stage("completion_stream"):
+            stream = upstream_governor.call(
+                "openai",
+                get_openai_client().chat.completions.create,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                **COMPLETION_OPTIONS,
+            )
+            collected = CompletionStream()
+            try:
+                for chunk in stream:
+                    delta = collected.add(chunk)
+                    if delta:
+                        yield "delta", {"content": delta}
+            finally:
+                # 切断時はここでHTTP接続を閉じ、上流の生成を中断する
+                stream.close()
+
+        ai_response = collected.finish()
+        with timer.stage("persist"):
+            message_id = save_turn(
+                project.id, ai_response, sources,
+                user_prompt if save_user_message else None, user_created_at, summary_update,
+            )
+        record_turn("stream", "success")
+        log_optimizations(project, timer)
+
+        yield "done", {
+            "message_id": message_id,
             "ai_response": ai_response,
             "articles": articles_list
         }
 
+    except GeneratorExit:
+        logging.info(f"クライアントが切断したためストリーミングを中断しました (project {project.id})")
+        record_turn("stream", "disconnected")
+        if save_user_message:
+            keep_user_message(project, user_prompt, user_created_at)
+        raise
+    except RateLimited as e:
+        logging.warning(f"レート制限により応答を生成できませんでした: {e}")
+        record_turn("stream", "rate_limited")
+        if save_user_message:
+            keep_user_message(project, user_prompt, user_created_at)
+        yield "error", {
+            "message": RATE_LIMITED_MESSAGE,
+            "retry_after": e.retry_after_header,
+        }
     except Exception as e:
         logging.error(f"Error: {e}")
-        return {
-            "ai_response": "エラーが発生しました。もう一度試してください。",
-            "articles": []
-        }
\ No newline at end of file
+        record_turn("stream", "error")
+        if save_user_message:
+            keep_user_message(project, user_prompt, user_created_at)
+        yield "error", {"message": ERROR_MESSAGE}
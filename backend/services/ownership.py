@@ -0,0 +1,67 @@
+# backend/services/ownership.py
+from models import db, Project
+from .cache import TTLCache
+
+
+class ProjectRef:
+    """
+    所有確認済みのプロジェクトの軽量な参照。
+    チャットのパイプラインはプロジェクトのIDしか使わないため、Projectを読み込まずに渡す。
+    """
+    __slots__ = ('id', 'user_id')
+
+    def __init__(self, id, user_id):
+        self.id = id
+        self.user_id = user_id
+
+
+class ProjectOwnership:
+    """
+    ユーザーID→所有するプロジェクトIDの集合を短いTTLでキャッシュし、認証済みリクエストごとの
+    所有確認のクエリを省く。このプロセスでの作成・削除時は無効化する。
+    他のプロセスで作成されたプロジェクトは見つからない場合の再確認で反映する。削除はTTLで反映されるが、
+    それまでに届いたプロンプトはターンの保存（外部キー制約）で失敗し、その時点でforget_projectで無効化する。
+    """
+
+    def __init__(self, maxsize=10000, ttl=30):
+        self.configure(maxsize, ttl)
+
+    def configure(self, maxsize, ttl):
+        self._projects = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def init_app(self, app):
+        self.configure(
+            app.config.get('PROJECT_OWNERSHIP_CACHE_SIZE', 10000),
+            app.config.get('PROJECT_OWNERSHIP_CACHE_TTL', 30),
+        )
+
+    def project_ids(self, user_id, refresh=False):
+        project_ids = None if refresh else self._projects.get(user_id)
+        if project_ids is None:
+            project_ids = frozenset(
+                project_id for (project_id,) in db.session.query(Project.id).filter(Project.user_id == user_id)
+            )
+            self._projects.set(user_id, project_ids)
+        return project_ids
+
+    def get(self, user_id, project_id):
+        """ユーザーが所有するプロジェクトであればProjectRefを、そうでなければNoneを返す。"""
+        if project_id in self.project_ids(user_id):
+            return ProjectRef(project_id, user_id)
+        # 他のプロセスで作成された直後のプロジェクトの場合があるため、見つからなければDBを確認し直す
+        if project_id in self.project_ids(user_id, refresh=True):
+            return ProjectRef(project_id, user_id)
+        return None
+
+    def invalidate(self, user_id):
+        self._projects.delete(user_id)
+
+    def forget_project(self, project_id):
+        """削除されたプロジェクトを含むエントリを無効化する（所有者のIDが分からない場合用）。"""
+        self._projects.delete_where(lambda project_ids: project_id in project_ids)
+
+    def stats(self):
+        return self._projects.stats()
+
+
+project_ownership = ProjectOwnership()
@@ -0,0 +1,360 @@
+# backend/services/persistence.py
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from sqlalchemy import event, insert, update
+from sqlalchemy.exc import IntegrityError
+from models import (
+    db, Article as DBArticle, ArticleChunkIndex, ArticleLshBand, Message, Project, ProjectSummary, SearchDocument,
+    article_message,
+)
+from .compression import article_codec
+from .dedup import band_keys, find_canonical_ids, to_bytes
+from .ownership import project_ownership
+from .search_index import document_terms
+
+
+def _dialect_insert(table):
+    """ON CONFLICTを使えるINSERT文を返す（PostgreSQL/SQLite）。その他のDBではNone。"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert(table)
+
+
+def _upsert_articles(rows):
+    """記事をまとめて登録し（既存のURLは無視）、{url: id} を返す。"""
+    if not rows:
+        return {}
+    urls = [row['url'] for row in rows]
+    stmt = _dialect_insert(DBArticle.__table__)
+    if stmt is not None:
+        db.session.execute(stmt.on_conflict_do_nothing(), rows)
+    else:
+        existing = {url for (url,) in db.session.query(DBArticle.url).filter(DBArticle.url.in_(urls))}
+        new_rows = [row for row in rows if row['url'] not in existing]
+        if new_rows:
+            db.session.execute(insert(DBArticle.__table__), new_rows)
+    return dict(db.session.query(DBArticle.url, DBArticle.id).filter(DBArticle.url.in_(urls)).all())
+
+
+def _upsert_chunk_indexes(rows):
+    if not rows:
+        return
+    stmt = _dialect_insert(ArticleChunkIndex.__table__)
+    if stmt is not None:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['article_id'],
+            set_={
+                'content_hash': stmt.excluded.content_hash,
+                'chunks': stmt.excluded.chunks,
+                'terms': stmt.excluded.terms,
+            },
+        )
+        db.session.execute(stmt, rows)
+    else:
+        for row in rows:
+            db.session.merge(ArticleChunkIndex(**row))
+
+
+def _insert_ignore(table, rows):
+    """行をまとめて登録する（一意制約に違反する行は無視）。"""
+    if not rows:
+        return
+    stmt = _dialect_insert(table)
+    if stmt is not None:
+        db.session.execute(stmt.on_conflict_do_nothing(), rows)
+    else:
+        db.session.execute(insert(table), rows)
+
+
+def _upsert_summary(update, now):
+    """会話要約の更新を保存する（同時のターンが先に新しいメッセージまで要約していた場合は上書きしない）。"""
+    if update is None:
+        return
+    row = {**update, 'updated_at': now}
+    stmt = _dialect_insert(ProjectSummary.__table__)
+    if stmt is not None:
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['project_id'],
+            set_={
+                'summary': stmt.excluded.summary,
+                'last_message_id': stmt.excluded.last_message_id,
+                'updated_at': stmt.excluded.updated_at,
+            },
+            where=ProjectSummary.__table__.c.last_message_id < stmt.excluded.last_message_id,
+        ), [row])
+        return
+    summary = ProjectSummary.query.filter_by(project_id=update['project_id']).first()
+    if summary is None:
+        db.session.add(ProjectSummary(**row))
+    elif summary.last_message_id < update['last_message_id']:
+        summary.summary, summary.last_message_id, summary.updated_at = row['summary'], row['last_message_id'], now
+
+
+def _insert_search_documents(rows):
+    _insert_ignore(SearchDocument.__table__, rows)
+
+
+def _message_document(message):
+    return {'message_id': message.id, 'article_id': None, 'terms': document_terms(message.content)}
+
+
+def index_messages(messages):
+    """flush済みのメッセージを全文検索の索引に追加する。コミットは呼び出し側で行う。"""
+    _insert_search_documents([_message_document(message) for message in messages])
+
+
+def reindex_search(batch_size=500):
+    """索引に無いメッセージと記事をまとめて追加する（既存データの移行用）。追加した件数を返す。"""
+    added = 0
+    sources = (
+        (Message, 'message_id', (Message.content,), lambda row: row.content),
+        (DBArticle, 'article_id', (DBArticle.body, DBArticle.legacy_content), article_codec.text),
+    )
+    for model, key, columns, text_of in sources:
+        while True:
+            batch = db.session.query(model.id, *columns).outerjoin(
+                SearchDocument, getattr(SearchDocument, key) == model.id
+            ).filter(SearchDocument.id.is_(None)).order_by(model.id).limit(batch_size).all()
+            if not batch:
+                break
+            _insert_search_documents([
+                {'message_id': None, 'article_id': None, key: row.id, 'terms': document_terms(text_of(row) or '')}
+                for row in batch
+            ])
+            db.session.commit()
+            added += len(batch)
+    return added
+
+
+def compress_articles(batch_size=500):
+    """
+    圧縮前の本文（legacy_content）をbatch_size件ずつ圧縮してbodyに移す（既存データの移行用）。
+    移行した件数と本文の圧縮前・圧縮後のバイト数を返す。
+    """
+    converted = original_bytes = stored_bytes = 0
+    while True:
+        batch = db.session.query(DBArticle.id, DBArticle.legacy_content).filter(
+            DBArticle.body.is_(None), DBArticle.legacy_content.isnot(None)
+        ).order_by(DBArticle.id).limit(batch_size).all()
+        if not batch:
+            break
+        rows = []
+        for article_id, content in batch:
+            values = article_codec.encode(content)
+            rows.append({'id': article_id, **values, 'legacy_content': None})
+            original_bytes += values['content_size']
+            stored_bytes += len(values['body'])
+        db.session.execute(update(DBArticle), rows)
+        db.session.commit()
+        converted += len(batch)
+    return {"articles": converted, "original_bytes": original_bytes, "stored_bytes": stored_bytes}
+
+
+class ProjectDeleted(Exception):
+    """ターンの保存中に、プロジェクトが（他のプロセスで）削除されていた。"""
+
+    def __init__(self, project_id):
+        super().__init__(f"project {project_id} was deleted")
+        self.project_id = project_id
+
+
+def _check_project_exists(project_id):
+    """
+    保存が制約違反で失敗した後に呼ぶ。プロジェクトが削除されていた場合は所有確認のキャッシュから外し、
+    ProjectDeletedを送出する（次のリクエストからは404になる）。
+    """
+    if db.session.query(Project.id).filter_by(id=project_id).scalar() is None:
+        project_ownership.forget_project(project_id)
+        raise ProjectDeleted(project_id)
+
+
+def _add_turn_messages(project_id, ai_response, user_prompt, user_created_at):
+    """ターンのメッセージ（ユーザー、AIの順）を追加してflushし、そのリストを返す。"""
+    new_messages = []
+    if user_prompt is not None:
+        new_messages.append(Message(
+            project_id=project_id,
+            sender='user',
+            content=user_prompt,
+            created_at=user_created_at or datetime.utcnow(),
+        ))
+    new_messages.append(Message(project_id=project_id, sender='ai', content=ai_response, created_at=datetime.utcnow()))
+    db.session.add_all(new_messages)
+    db.session.flush()
+    return new_messages
+
+
+def persist_turn(project_id, ai_response, sources, user_prompt=None, user_created_at=None, summary_update=None):
+    """
+    1ターン分の保存（ユーザー/AIメッセージ、記事とその重複判定、記事との関連付け、チャンク索引）を
+    一括で行い、最後に1回だけコミットする。新しいメッセージと記事は全文検索の索引にも追加する。
+    user_promptを渡した場合はユーザーのメッセージも同じトランザクションで保存する。
+    summary_update（build_contextが返す会話要約の更新）も同じトランザクションで保存する。
+    保存したAIメッセージを返す。
+    """
+    now = datetime.now()
+    fetched = [source for source in sources if source.get("content")]
+    # 取得時点でDBに無かった記事（索引への追加対象）
+    new_urls = {source["url"] for source in fetched if not source.get("article_id")}
+
+    try:
+        # 新しい記事と同じ内容の既存記事（正規の記事）をLSHの索引から探す
+        fingerprints = {source["url"]: source.get("fingerprint") for source in fetched if source["url"] in new_urls}
+        canonical_ids = find_canonical_ids(fingerprints)
+
+        # 記事の一括登録（同じURLが複数あっても1件にまとめる）
+        rows = {}
+        for source in fetched:
+            fingerprint = source.get("fingerprint")
+            rows.setdefault(source["url"], {
+                'title': source["title"],
+                'url': source["url"],
+                **article_codec.encode(source["content"]),
+                'fetched_at': now,
+                'fingerprint': to_bytes(fingerprint) if fingerprint is not None else None,
+                'canonical_id': canonical_ids.get(source["url"]),
+            })
+        article_ids = _upsert_articles(list(rows.values()))
+        contents = {source["url"]: source["content"] for source in fetched}
+
+        # 正規の記事のみLSHの索引に登録する（重複記事は正規の記事を経由して見つかる）
+        _insert_ignore(ArticleLshBand.__table__, [
+            {'bucket': bucket, 'article_id': article_ids[url]}
+            for url, fingerprint in fingerprints.items()
+            if fingerprint is not None and url not in canonical_ids and url in article_ids
+            for bucket in band_keys(fingerprint)
+        ])
+
+        new_messages = _add_turn_messages(project_id, ai_response, user_prompt, user_created_at)
+        ai_message = new_messages[-1]
+
+        # 記事とメッセージの関連付けを一括登録
+        links = [{'article_id': article_id, 'message_id': ai_message.id}
+                 for article_id in dict.fromkeys(article_ids[source["url"]] for source in fetched
+                                                 if source["url"] in article_ids)]
+        if links:
+            db.session.execute(insert(article_message), links)
+
+        # 新規・更新されたチャンク索引の保存
+        chunk_rows = {}
+        for source in fetched:
+            index = source.get("chunk_index")
+            article_id = article_ids.get(source["url"])
+            if index is not None and article_id is not None:
+                source["article_id"] = article_id
+                chunk_rows[article_id] = {
+                    'article_id': article_id,
+                    'content_hash': index["hash"],
+                    'chunks': index["chunks"],
+                    'terms': index["terms"],
+                    'created_at': now,
+                }
+        _upsert_chunk_indexes(list(chunk_rows.values()))
+
+        # 全文検索の索引（既に索引済みの記事は無視される）
+        _insert_search_documents(
+            [_message_document(message) for message in new_messages]
+            + [{'message_id': None, 'article_id': article_ids[url], 'terms': document_terms(contents[url])}
+               for url in new_urls if url in article_ids]
+        )
+        _upsert_summary(summary_update, now)
+
+        db.session.commit()
+        return ai_message
+    except IntegrityError:
+        db.session.rollback()
+        _check_project_exists(project_id)
+        raise
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def persist_cached_turn(project_id, ai_response, articles, user_prompt=None, user_created_at=None):
+    """
+    応答キャッシュから返したターンを保存する。記事は保存済みのものにURLで関連付ける
+    （キャッシュ後に削除された記事は関連付けない）。保存したAIメッセージを返す。
+    """
+    try:
+        new_messages = _add_turn_messages(project_id, ai_response, user_prompt, user_created_at)
+        ai_message = new_messages[-1]
+
+        urls = [article["url"] for article in articles]
+        if urls:
+            article_ids = db.session.query(DBArticle.id).filter(DBArticle.url.in_(urls)).all()
+            links = [{'article_id': article_id, 'message_id': ai_message.id} for (article_id,) in article_ids]
+            if links:
+                db.session.execute(insert(article_message), links)
+
+        index_messages(new_messages)
+        db.session.commit()
+        return ai_message
+    except IntegrityError:
+        db.session.rollback()
+        _check_project_exists(project_id)
+        raise
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+class QueryTracker:
+    """
+    SQLAlchemyのイベントでSQLの実行回数と所要時間を数える。
+    track()のブロック内で、そのスレッドが実行したクエリのみを集計する。
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def init_app(self, app):
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', self._before)
+        event.listen(engine, 'after_cursor_execute', self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        if getattr(self._local, 'stats', None) is not None:
+            self._local.started = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        stats = getattr(self._local, 'stats', None)
+        if stats is not None:
+            stats["queries"] += 1
+            stats["seconds"] += time.perf_counter() - self._local.started
+
+    @contextmanager
+    def track(self, label):
+        stats = {"queries": 0, "seconds": 0.0}
+        try:
+            with self.collect(stats):
+                yield stats
+        finally:
+            self.report(label, stats)
+
+    def report(self, label, stats):
+        logging.info(f"{label}: DBクエリ{stats['queries']}件, {stats['seconds'] * 1000:.1f}ms")
+
+    @contextmanager
+    def collect(self, stats):
+        """
+        このスレッドのクエリを既存の集計statsに加える（ログは出さない）。
+        ASGIモードのようにDBアクセスが呼び出しごとに別のスレッドで行われる場合に使う。
+        """
+        previous = getattr(self._local, 'stats', None)
+        self._local.stats = stats
+        try:
+            yield stats
+        finally:
+            self._local.stats = previous
+
+
+query_tracker = QueryTracker()
@@ -0,0 +1,293 @@
+# backend/services/pipeline.py
+"""
+チャットのパイプラインの同期版（openai_service.py）と非同期版（async_pipeline.py）で共有する判定と保存。
+記事取得の打ち切り・ヘッジ、応答の先行生成の採否、応答キャッシュ、ターンの保存と結果の組み立てをここで行い、
+各版はスレッドプール・イベントループでのI/Oのみを行う。
+"""
+import logging
+import threading
+from config import Config
+from models import db, Message
+from .article_cache import article_cache
+from .dedup import DistinctContents
+from .hedging import hedge_policy
+from .metrics import record_speculation, record_usage, ARTICLE_FETCH_DEADLINE_MISSES
+from .persistence import persist_turn, persist_cached_turn, index_messages, query_tracker
+from .response_cache import response_cache, COMPLETION_MODEL
+from .timing import StageTimer
+
+# 応答の生成のパラメーター（モデルは応答キャッシュのキーにも含める）
+COMPLETION_OPTIONS = {"model": COMPLETION_MODEL, "temperature": 0.7, "max_tokens": 1500}
+
+# 先行させる応答の生成で、検索結果の代わりに渡す文
+HISTORY_ONLY_RESULTS = "検索結果はありません。会話の履歴と既存の知識に基づいて回答してください。"
+
+RATE_LIMITED_MESSAGE = "リクエストが混み合っています。しばらくしてから再度お試しください。"
+ERROR_MESSAGE = "エラーが発生しました。もう一度試してください。"
+
+
+class FetchRound:
+    """
+    1ターン分の記事の並列取得の判定（重複を除いた十分な件数での打ち切り、ヘッジ、締め切り）。
+    取得の開始と完了の待機は各版が行い、取得のハンドル（Future / Task）を検索結果の位置と一緒に登録する。
+    """
+
+    def __init__(self, links, started, budget=None, timer=None):
+        self.links = links
+        self.timer = timer or StageTimer()
+        self.started = started
+        self.deadline = started + (budget if budget is not None else Config.ARTICLE_FETCH_DEADLINE)
+        self.contents = [None] * len(links)
+        # 重複（転載など）を除いた件数で打ち切りを判定する
+        self.distinct = DistinctContents()
+        self.hedge_delay = hedge_policy.delay()
+        self.handles = {}
+        self.hedges = set()
+        self.finished = set()
+        self.resolved = set()
+        self.unresolved = set()
+        self.cut_short = False
+
+    def use_cached(self, index, content):
+        self.contents[index] = content
+        logging.info(f"記事キャッシュを使用します ({self.links[index]})")
+
+    def add(self, handle, index):
+        self.handles[handle] = index
+        self.unresolved.add(index)
+
+    def _hedged(self):
+        return {self.handles[handle] for handle in self.hedges}
+
+    def _can_hedge(self):
+        return (
+            self.hedge_delay is not None
+            and len(self.hedges) < hedge_policy.max_per_turn
+            and bool(self.unresolved - self._hedged())
+        )
+
+    def next_wait(self, now):
+        """
+        次に待つ (秒数, 完了を待つハンドルのリスト) を返す。
+        十分な件数が揃った場合、締め切りを過ぎた場合、全件が終わった場合はNoneを返す。
+        """
+        if not self.unresolved:
+            return None
+        sufficient = Config.ARTICLE_FETCH_SUFFICIENT
+        if sufficient and len(self.distinct) >= sufficient:
+            self.cut_short = True
+            self.timer.fired("sufficient_set")
+            return None
+        if now >= self.deadline:
+            return None
+
+        # ヘッジする時刻か締め切りか、どちらか早い方まで待つ
+        timeout = self.deadline - now
+        if self._can_hedge():
+            timeout = max(0.0, min(timeout, self.started + self.hedge_delay - now))
+        active = [
+            handle for handle, index in self.handles.items()
+            if index in self.unresolved and handle not in self.finished
+        ]
+        return timeout, active
+
+    def complete(self, handle):
+        """終わった取得の結果を反映する（結果は(本文, 所要秒数)）。"""
+        self.finished.add(handle)
+        index = self.handles[handle]
+        if index in self.resolved:
+            return
+        url = self.links[index]
+        try:
+            content, elapsed = handle.result()
+        except Exception as e:
+            logging.error(f"記事取得中にエラーが発生しました ({url}): {e}")
+            # ヘッジのもう一方がまだ実行中であればそちらを待つ
+            if all(other in self.finished for other, other_index in self.handles.items() if other_index == index):
+                self.resolved.add(index)
+                self.unresolved.discard(index)
+            return
+        self.resolved.add(index)
+        self.unresolved.discard(index)
+        self.contents[index] = content
+        self.distinct.add(content)
+        article_cache.store(url, content)
+        if handle in self.hedges:
+            self.timer.fired("hedge_won")
+        outcome = "成功" if content else "本文なし"
+        logging.info(f"記事取得 {outcome} ({url}): {elapsed:.2f}秒")
+
+    def due_hedges(self, now):
+        """ヘッジの時刻を過ぎても終わっていない取得の位置（同じURLをもう1本取得する）。"""
+        if not self._can_hedge() or now < self.started + self.hedge_delay:
+            return []
+        return sorted(self.unresolved - self._hedged())[:hedge_policy.max_per_turn - len(self.hedges)]
+
+    def add_hedge(self, handle, index):
+        self.handles[handle] = index
+        self.hedges.add(handle)
+        self.timer.fired("hedged_fetch")
+        logging.info(f"記事取得が{self.hedge_delay:.2f}秒を過ぎたためヘッジします ({self.links[index]})")
+
+    def leftovers(self):
+        """終わっていない取得の (ハンドル, URL, 本文がまだ無いか) のリスト。"""
+        return [
+            (handle, self.links[index], index not in self.resolved)
+            for handle, index in self.handles.items() if not handle.done()
+        ]
+
+    def finish(self):
+        """検索結果と同じ順序の本文のリストを返す（取得できなかった記事はNone）。"""
+        if not self.cut_short:
+            for index in self.unresolved:
+                ARTICLE_FETCH_DEADLINE_MISSES.inc()
+                logging.warning(f"記事取得が締め切りまでに完了しませんでした ({self.links[index]})")
+        return self.contents
+
+
+# 実行中の先行生成（破棄したものを含む）の枠。空きが無いターンは先行生成しない
+_speculation_slots = threading.BoundedSemaphore(Config.PIPELINE_SPECULATIVE_WORKERS)
+
+
+def acquire_speculation_slot():
+    """先行生成の枠を取れた場合は真を返す（取れなかった場合はskippedとして記録する）。"""
+    if _speculation_slots.acquire(blocking=False):
+        return True
+    record_speculation("skipped")
+    return False
+
+
+def release_speculation_slot(_handle=None):
+    # 先行生成の完了時（破棄した場合も上流の呼び出しが終わった時点）に呼ぶ
+    _speculation_slots.release()
+
+
+def use_speculation(sources, timer):
+    """
+    先行生成した応答を使うかを判定して記録する。記事の本文を1件も取得できなかった場合のみ使う。
+    偽を返した場合、呼び出し側は先行生成を取り消す。
+    """
+    if not any(source["content"] for source in sources):
+        timer.fired("speculative_completion")
+        record_speculation("used")
+        return True
+    timer.fired("speculation_discarded")
+    record_speculation("discarded")
+    return False
+
+
+class CompletionStream:
+    """ストリーミングの応答のチャンクから本文とusageを集める。"""
+
+    def __init__(self):
+        self.chunks = []
+        self.usage = None
+
+    def add(self, chunk):
+        """チャンクを加え、本文の差分（無ければNone）を返す。"""
+        # include_usage指定時は最後のチャンクにusageのみが入る
+        self.usage = getattr(chunk, "usage", None) or self.usage
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            self.chunks.append(delta)
+        return delta
+
+    def finish(self):
+        """usageを記録し、応答の本文を返す。"""
+        record_usage(COMPLETION_MODEL, self.usage)
+        return "".join(self.chunks).strip()
+
+
+def cached_response(project, user_prompt, save_user_message, user_created_at):
+    """
+    応答キャッシュを引き、ヒットした場合はメッセージと記事の関連付けを保存する。
+    (結果またはNone, 会話の状態のキー) を返す。アプリコンテキスト内で呼び出すこと。
+    """
+    timer = StageTimer()
+    with query_tracker.track(f"応答キャッシュ (project {project.id})") as db_stats:
+        with timer.stage("cache"):
+            context_key = response_cache.context_key(project)
+            cached = response_cache.get(context_key, user_prompt)
+        if cached is None:
+            return None, context_key
+
+        with timer.stage("persist"):
+            ai_message = persist_cached_turn(
+                project.id,
+                cached["ai_response"],
+                cached["articles"],
+                user_prompt=user_prompt if save_user_message else None,
+                user_created_at=user_created_at,
+            )
+
+    return {
+        "message_id": ai_message.id,
+        "ai_response": cached["ai_response"],
+        "articles": cached["articles"],
+        "timings": timer,
+        "db": db_stats,
+    }, context_key
+
+
+def remember_response(context_key, user_prompt, result):
+    # cached_responseで引いた会話の状態のキーがある場合（キャッシュが有効な場合）のみ保存する
+    if context_key is not None:
+        response_cache.set(context_key, user_prompt, result["ai_response"], result["articles"])
+
+
+def save_turn(project_id, ai_response, sources, user_prompt, user_created_at, summary_update):
+    """
+    ターンを保存し、AIメッセージのIDを返す（アプリコンテキストの外でも使えるよう、ORMのオブジェクトは返さない）。
+    user_promptはユーザーのメッセージも保存する場合のみ渡す。
+    """
+    return persist_turn(
+        project_id, ai_response, sources, user_prompt=user_prompt, user_created_at=user_created_at,
+        summary_update=summary_update,
+    ).id
+
+
+def keep_user_message(project, user_prompt, created_at):
+    # 応答の生成に失敗した場合も、ユーザーのメッセージは履歴に残す
+    try:
+        db.session.rollback()
+        message = Message(project_id=project.id, sender='user', content=user_prompt, created_at=created_at)
+        db.session.add(message)
+        db.session.flush()
+        index_messages([message])
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"ユーザーメッセージの保存に失敗しました: {e}")
+
+
+def log_optimizations(project, timer):
+    if timer.optimizations:
+        logging.info(f"ターンで効いた最適化 (project {project.id}): {timer.optimizations}")
+
+
+def turn_result(project, message_id, ai_response, articles, timer, db_stats):
+    log_optimizations(project, timer)
+    return {
+        "message_id": message_id,
+        "ai_response": ai_response,
+        "articles": articles,
+        "timings": timer,
+        "db": db_stats,
+        "optimizations": dict(timer.optimizations),
+    }
+
+
+def rate_limited_response(error):
+    # 上流のレート制限に達した場合の結果（ルートは429とRetry-Afterヘッダーを返す）
+    return {
+        "ai_response": RATE_LIMITED_MESSAGE,
+        "articles": [],
+        "retry_after": error.retry_after_header,
+    }
+
+
+def error_response():
+    return {
+        "ai_response": ERROR_MESSAGE,
+        "articles": []
+    }
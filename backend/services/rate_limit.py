@@ -0,0 +1,351 @@
+# backend/services/rate_limit.py
+import asyncio
+import logging
+import math
+import random
+import sys
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+import requests
+from sqlalchemy import case, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from models import db, RateLimitBucket
+from .metrics import RATE_LIMITED, UPSTREAM_RETRIES
+
+
+class RateLimited(Exception):
+    """レート制限により処理できない場合の例外。retry_afterは再試行できるまでの秒数。"""
+
+    def __init__(self, scope, retry_after):
+        super().__init__(f"{scope}のレート制限に達しました（{retry_after:.1f}秒後に再試行できます）")
+        self.scope = scope
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self):
+        # Retry-Afterヘッダーは整数の秒数
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class TokenBuckets:
+    """
+    プロセス内のトークンバケット（rateは1秒あたりに補充するトークン数）。
+    GCRAにより、キーごとに「バケットが満杯に戻る時刻」だけを保持する。
+    その時刻を過ぎたキーは満杯のバケットと同じなので削除しても制限は変わらず、
+    キーの数がmax_keysを超えた時はそれらだけを削除する（使用中のバケットは削除しない）。
+    """
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._full_at = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        """トークンを1つ取る。取れた場合は0を、取れない場合は次のトークンまでの秒数を返す。"""
+        interval = 1 / rate
+        with self._lock:
+            now = time.monotonic()
+            full_at = max(self._full_at.get(key, now), now) + interval
+            # 満杯に戻るまでの時間がburst個分を超える場合は取れない（浮動小数点の誤差は無視する）
+            wait = full_at - now - burst * interval
+            if wait > 1e-9:
+                return wait
+            if key not in self._full_at and len(self._full_at) >= self.max_keys:
+                self._prune(now)
+            self._full_at[key] = full_at
+            return 0.0
+
+    def _prune(self, now):
+        for key in [key for key, full_at in self._full_at.items() if full_at <= now]:
+            del self._full_at[key]
+
+    def __len__(self):
+        return len(self._full_at)
+
+
+class RateLimiter:
+    """
+    トークンバケットによるレート制限（scope: user / openai / cse）。
+    既定ではバケットをプロセス内に置き、RATE_LIMIT_DB_TIER=trueの場合はrate_limit_bucketテーブルに置いて
+    複数ワーカーで共有する（補充と消費を1回のUPDATEで行うため、ワーカー間で競合しない）。
+    """
+
+    def __init__(self):
+        self._limits = {}
+        self._buckets = TokenBuckets()
+        self._lock = threading.Lock()
+        self._engine = None
+        self.db_tier = False
+        self.limited = {}
+
+    def init_app(self, app):
+        config = app.config
+        self._limits = {}
+        for scope, prefix in (('user', 'USER'), ('openai', 'OPENAI'), ('cse', 'CSE')):
+            per_minute = config.get(f'{prefix}_RATE_LIMIT_PER_MINUTE', 0)
+            if per_minute > 0:
+                self._limits[scope] = (per_minute / 60, max(1, config.get(f'{prefix}_RATE_LIMIT_BURST', 1)))
+        self._buckets = TokenBuckets(config.get('RATE_LIMIT_MAX_KEYS', 10000))
+        self.db_tier = config.get('RATE_LIMIT_DB_TIER', False)
+        if self.db_tier:
+            # 上流の呼び出しはアプリケーションコンテキストの外（記事取得のスレッド、イベントループ）からも行われる
+            with app.app_context():
+                self._engine = db.engine
+
+    def enabled(self, scope):
+        return scope in self._limits
+
+    def try_acquire(self, scope, key=None):
+        """
+        トークンを1つ取る。取れた場合は0を、取れない場合は次のトークンまでの秒数を返す。
+        keyはユーザーIDなど、scope内でバケットを分ける値。
+        """
+        limit = self._limits.get(scope)
+        if limit is None:
+            return 0.0
+        bucket_key = scope if key is None else f"{scope}:{key}"
+        if self.db_tier:
+            wait = self._take_db(bucket_key, *limit)
+        else:
+            wait = self._buckets.take(bucket_key, *limit)
+        if wait:
+            RATE_LIMITED.labels(scope).inc()
+            with self._lock:
+                self.limited[scope] = self.limited.get(scope, 0) + 1
+        return wait
+
+    def check(self, scope, key=None):
+        """トークンを1つ取る。取れない場合はRateLimitedを送出する。"""
+        wait = self.try_acquire(scope, key)
+        if wait:
+            raise RateLimited(scope, wait)
+
+    async def check_async(self, scope, key=None):
+        wait = await self.try_acquire_async(scope, key)
+        if wait:
+            raise RateLimited(scope, wait)
+
+    async def try_acquire_async(self, scope, key=None):
+        """try_acquireの非同期版（DB層を使う場合のみスレッドで実行する）。"""
+        if self.db_tier and self.enabled(scope):
+            return await asyncio.to_thread(self.try_acquire, scope, key)
+        return self.try_acquire(scope, key)
+
+    def _take_db(self, bucket_key, rate, burst):
+        table = RateLimitBucket.__table__
+        now = time.time()
+        refilled = table.c.tokens + (now - table.c.updated_at) * rate
+        available = case((refilled > burst, burst), else_=refilled)
+        with self._engine.begin() as conn:
+            taken = conn.execute(
+                update(table)
+                .where(table.c.key == bucket_key, available >= 1)
+                .values(tokens=available - 1, updated_at=now)
+            ).rowcount
+            if taken:
+                return 0.0
+            row = conn.execute(select(table.c.tokens, table.c.updated_at).where(table.c.key == bucket_key)).first()
+        if row is not None:
+            tokens = min(burst, row.tokens + (now - row.updated_at) * rate)
+            return max(0.0, (1 - tokens) / rate)
+
+        # 最初の呼び出しでは満杯のバケットを作る（他のワーカーと同時に作った場合は取り直す）
+        try:
+            with self._engine.begin() as conn:
+                conn.execute(insert(table).values(key=bucket_key, tokens=burst - 1, updated_at=now))
+            return 0.0
+        except IntegrityError:
+            return self._take_db(bucket_key, rate, burst)
+
+    def stats(self):
+        return {
+            "db_tier": self.db_tier,
+            "limits_per_minute": {scope: round(rate * 60, 3) for scope, (rate, _burst) in self._limits.items()},
+            "limited": dict(self.limited),
+            "buckets": len(self._buckets),
+        }
+
+
+def _retry_reason(e):
+    """再試行する例外であれば理由（429 / 5xx / connection）を、そうでなければNoneを返す。"""
+    response = getattr(e, 'response', None)
+    status = getattr(e, 'status_code', None) or getattr(response, 'status_code', None)
+    if isinstance(status, int):
+        if status == 429:
+            return '429'
+        if status >= 500:
+            return '5xx'
+        return None
+
+    # httpx・openaiは読み込み済みの場合のみ対象にする（CSEの失敗だけでopenaiを読み込まない）
+    errors = [ConnectionError, TimeoutError, requests.ConnectionError, requests.Timeout]
+    if 'httpx' in sys.modules:
+        errors.append(sys.modules['httpx'].TransportError)
+    if 'openai' in sys.modules:
+        errors.append(sys.modules['openai'].APIConnectionError)
+    if isinstance(e, tuple(errors)):
+        return 'connection'
+    return None
+
+
+def _retry_after(e):
+    # 上流が返したRetry-After（秒数の形式のみ）
+    headers = getattr(getattr(e, 'response', None), 'headers', None)
+    try:
+        return float(headers.get('Retry-After')) if headers else None
+    except (TypeError, ValueError):
+        return None
+
+
+class UpstreamGovernor:
+    """
+    OpenAI・Google CSEへの呼び出しの流量制御。
+    呼び出しごとに上流のトークンバケット（RateLimiter）からトークンを取り、
+    同時に実行する呼び出しの数をプロセスごとのセマフォで制限する（スレッド用とイベントループ用がある）。
+    429・5xx・接続エラーは指数バックオフ（フルジッター、Retry-Afterがあればそれ以上）で再試行し、
+    待っても流せない場合や429が続いた場合はRateLimitedを送出する。
+    """
+
+    def __init__(self, limiter):
+        self._limiter = limiter
+        self._semaphores = {}
+        self._async_semaphores = {}
+        self._concurrency = {}
+        self.max_wait = 10.0
+        self.max_retries = 3
+        self.retry_base = 0.5
+        self.retry_max = 8.0
+
+    def init_app(self, app):
+        config = app.config
+        self._concurrency = {
+            'openai': config.get('OPENAI_MAX_CONCURRENCY', 200),
+            'cse': config.get('CSE_MAX_CONCURRENCY', 20),
+        }
+        self._semaphores = {name: threading.BoundedSemaphore(size) for name, size in self._concurrency.items()}
+        self._async_semaphores = {}
+        self.max_wait = config.get('UPSTREAM_MAX_WAIT', 10.0)
+        self.max_retries = config.get('UPSTREAM_MAX_RETRIES', 3)
+        self.retry_base = config.get('UPSTREAM_RETRY_BASE', 0.5)
+        self.retry_max = config.get('UPSTREAM_RETRY_MAX', 8.0)
+
+    def _token(self, upstream):
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            wait = self._limiter.try_acquire(upstream)
+            if not wait:
+                return
+            if time.monotonic() + wait > deadline:
+                raise RateLimited(upstream, wait)
+            time.sleep(wait)
+
+    async def _atoken(self, upstream):
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            wait = await self._limiter.try_acquire_async(upstream)
+            if not wait:
+                return
+            if time.monotonic() + wait > deadline:
+                raise RateLimited(upstream, wait)
+            await asyncio.sleep(wait)
+
+    def _backoff(self, upstream, attempt, e):
+        """再試行までの秒数を返す。再試行しない場合は例外を送出する。"""
+        reason = _retry_reason(e)
+        if reason is None:
+            raise e
+        if attempt >= self.max_retries:
+            if reason == '429':
+                raise RateLimited(upstream, _retry_after(e) or self.retry_max) from e
+            raise e
+        UPSTREAM_RETRIES.labels(upstream, reason).inc()
+        delay = random.uniform(0, min(self.retry_max, self.retry_base * 2 ** attempt))
+        delay = max(delay, min(self.retry_max, _retry_after(e) or 0))
+        logging.warning(f"{upstream}の呼び出しを{delay:.2f}秒後に再試行します（{attempt + 1}回目）: {e}")
+        return delay
+
+    @contextmanager
+    def slot(self, upstream):
+        """同時呼び出し数の枠を1つ使う。UPSTREAM_MAX_WAIT秒以内に空かなければRateLimitedを送出する。"""
+        semaphore = self._semaphores.get(upstream)
+        if semaphore is None:
+            yield
+            return
+        if not semaphore.acquire(timeout=self.max_wait):
+            RATE_LIMITED.labels(upstream).inc()
+            raise RateLimited(upstream, self.retry_base)
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    @asynccontextmanager
+    async def aslot(self, upstream):
+        """slotの非同期版（イベントループごとのasyncio.Semaphoreを使う）。"""
+        size = self._concurrency.get(upstream)
+        if size is None:
+            yield
+            return
+        semaphore = self._async_semaphores.get(upstream)
+        if semaphore is None:
+            semaphore = self._async_semaphores.setdefault(upstream, asyncio.Semaphore(size))
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.max_wait)
+        except asyncio.TimeoutError:
+            RATE_LIMITED.labels(upstream).inc()
+            raise RateLimited(upstream, self.retry_base)
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    def retry(self, upstream, func, *args, **kwargs):
+        """試行ごとにトークンを取ってfuncを呼び、一時的なエラーは再試行する（同時呼び出し数の枠は使わない）。"""
+        attempt = 0
+        while True:
+            self._token(upstream)
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                time.sleep(self._backoff(upstream, attempt, e))
+            attempt += 1
+
+    def call(self, upstream, func, *args, **kwargs):
+        """retryと同じだが、各試行の間は同時呼び出し数の枠を使う。"""
+        def attempt():
+            with self.slot(upstream):
+                return func(*args, **kwargs)
+        return self.retry(upstream, attempt)
+
+    async def aretry(self, upstream, func, *args, **kwargs):
+        """retryの非同期版。funcはコルーチン関数。"""
+        attempt = 0
+        while True:
+            await self._atoken(upstream)
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                await asyncio.sleep(self._backoff(upstream, attempt, e))
+            attempt += 1
+
+    async def acall(self, upstream, func, *args, **kwargs):
+        """callの非同期版。funcはコルーチン関数。"""
+        async def attempt():
+            async with self.aslot(upstream):
+                return await func(*args, **kwargs)
+        return await self.aretry(upstream, attempt)
+
+    def stats(self):
+        return {
+            upstream: {
+                "max_concurrency": size,
+                # BoundedSemaphoreの残りの枠（内部の値を参照する）
+                "available": self._semaphores[upstream]._value,
+            }
+            for upstream, size in self._concurrency.items()
+        }
+
+
+rate_limiter = RateLimiter()
+upstream_governor = UpstreamGovernor(rate_limiter)
@@ -0,0 +1,327 @@
+# backend/services/registry.py
+import atexit
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from .metrics import record_usage
+
+# 検索クエリ生成用のプロンプトテンプレート
+prompt_template = """
+ユーザーの質問: {user_prompt}
+この質問に基づいて、信頼性の高い情報を得るための最適な検索クエリを作成してください。検索クエリは具体的かつ簡潔に。
+検索クエリには絶対に引用符（""や''）を付けず、各キーワードをスペースで区切って作成すること。
+"""
+
+
+class _Counter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def request(self, _request=None):
+        with self._lock:
+            self.requests += 1
+
+    def response(self, response):
+        if response.status_code >= 400:
+            self.error()
+
+    def error(self):
+        with self._lock:
+            self.errors += 1
+
+    # httpx.AsyncClientのイベントフックはコルーチンである必要がある
+    async def arequest(self, request=None):
+        self.request(request)
+
+    async def aresponse(self, response):
+        self.response(response)
+
+    def stats(self):
+        return {"requests": self.requests, "errors": self.errors}
+
+
+def _detect_encoding(content):
+    # charsetの指定がないページはrequestsのapparent_encodingと同様に内容から推定する
+    import charset_normalizer
+    return charset_normalizer.detect(content)['encoding'] or 'utf-8'
+
+
+class ServiceRegistry:
+    """
+    アプリ全体で共有する外部サービスのクライアント。
+    OpenAI・Google CSE・記事取得でKeep-Aliveの接続プールを再利用する。
+    OpenAIのクライアントとLangChainのチェーンは読み込みが重いため、最初に使われた時に作成する。
+    SDKの自動再試行は無効にし、再試行はUpstreamGovernor（services/rate_limit.py）でまとめて行う。
+    ASGIモード用の非同期クライアント（async_openai、async_http、async_query_chain）も同様に最初に使われた時に作成する。
+    非同期クライアントは作成したイベントループでのみ使えるため、ASGIのワーカー（1ループ）から使う。
+    """
+
+    def __init__(self):
+        self.config = None
+        self.http = None
+        self._openai = None
+        self._query_chain = None
+        self._async_query_chain = None
+        self._openai_http = None
+        self._async_openai = None
+        self._async_openai_http = None
+        self._async_http = None
+        self._adapter = None
+        self._lock = threading.Lock()
+        self._atexit_registered = False
+        self._openai_counter = _Counter()
+        self._cse_counter = _Counter()
+
+    def init_app(self, app):
+        config = app.config
+        self.config = config
+        self.cse_endpoint = config['GOOGLE_CSE_ENDPOINT']
+        self.cse_timeout = config['CSE_TIMEOUT']
+        self.google_api_key = config['GOOGLE_API_KEY']
+        self.google_cse_id = config['GOOGLE_CSE_ID']
+
+        # Google CSEと記事取得用のHTTPセッション（ホストごとに接続を保持）
+        self.http = requests.Session()
+        self.http.headers['User-Agent'] = config['HTTP_USER_AGENT']
+        adapter = HTTPAdapter(
+            pool_connections=config['HTTP_POOL_CONNECTIONS'],
+            pool_maxsize=config['HTTP_POOL_MAXSIZE'],
+            max_retries=0,
+        )
+        self.http.mount('http://', adapter)
+        self.http.mount('https://', adapter)
+        self._adapter = adapter
+
+        # プロセス終了時に接続プールを閉じる（init_appが複数回呼ばれても登録は一度だけ）
+        with self._lock:
+            if self._atexit_registered:
+                return
+            self._atexit_registered = True
+        atexit.register(self.close)
+
+    @property
+    def openai(self):
+        """チャット補完用のOpenAIクライアント（OPENAI_FAKE=trueの場合はダミー）。"""
+        if self._openai is None:
+            with self._lock:
+                if self._openai is None:
+                    self._openai = self._create_openai()
+        return self._openai
+
+    @property
+    def query_chain(self):
+        """検索クエリ生成用のLLMChain（WSGIモード、同期の接続プールのみを使う）。"""
+        if self._query_chain is None:
+            with self._lock:
+                if self._query_chain is None:
+                    self._query_chain = self._create_query_chain()
+        return self._query_chain
+
+    @property
+    def async_query_chain(self):
+        """ASGIモードの検索クエリ生成用のLLMChain（arunは非同期の接続プールを使う）。"""
+        if self._async_query_chain is None:
+            with self._lock:
+                if self._async_query_chain is None:
+                    self._async_query_chain = self._create_query_chain(async_client=True)
+        return self._async_query_chain
+
+    def _openai_http_client(self):
+        # チャット補完と検索クエリ生成で同じ接続プールを共有する（ロック内から呼ぶ）
+        if self._openai_http is None:
+            import httpx
+            config = self.config
+            self._openai_http = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=config['OPENAI_MAX_CONNECTIONS'],
+                    max_keepalive_connections=config['OPENAI_MAX_KEEPALIVE'],
+                ),
+                timeout=httpx.Timeout(config['OPENAI_TIMEOUT'], connect=config['OPENAI_CONNECT_TIMEOUT']),
+                event_hooks={
+                    'request': [self._openai_counter.request],
+                    'response': [self._openai_counter.response],
+                },
+            )
+        return self._openai_http
+
+    def _create_openai(self):
+        if self.config['OPENAI_FAKE']:
+            from .fake_openai import FakeOpenAI
+            return FakeOpenAI()
+        from openai import OpenAI as OpenAI_API
+        return OpenAI_API(
+            api_key=self.config['OPENAI_API_KEY'],
+            base_url=self.config['OPENAI_BASE_URL'],
+            http_client=self._openai_http_client(),
+            max_retries=0,
+        )
+
+    def _create_query_chain(self, async_client=False):
+        from langchain.chains import LLMChain
+        from langchain_core.callbacks import BaseCallbackHandler
+        from langchain.prompts import PromptTemplate
+        from langchain_openai import OpenAI
+        # 非同期の接続プールはASGIモードのチェーンでのみ作成する（WSGIモードでは使わないため）
+        async_options = {'http_async_client': self._async_openai_http_client()} if async_client else {}
+        llm = OpenAI(
+            api_key=self.config['OPENAI_API_KEY'],
+            base_url=self.config['OPENAI_BASE_URL'],
+            http_client=self._openai_http_client(),
+            max_retries=0,
+            **async_options,
+        )
+
+        class UsageHandler(BaseCallbackHandler):
+            # 検索クエリ生成で消費したトークン数をチャット補完と同じメトリクスに加算する
+            def on_llm_end(self, response, **kwargs):
+                llm_output = response.llm_output or {}
+                record_usage(llm_output.get('model_name', llm.model_name), llm_output.get('token_usage'))
+
+        return LLMChain(
+            llm=llm,
+            prompt=PromptTemplate(input_variables=["user_prompt"], template=prompt_template),
+            callbacks=[UsageHandler()],
+        )
+
+    @property
+    def async_openai(self):
+        """ASGIモードのチャット補完用のAsyncOpenAIクライアント（OPENAI_FAKE=trueの場合はダミー）。"""
+        if self._async_openai is None:
+            with self._lock:
+                if self._async_openai is None:
+                    self._async_openai = self._create_async_openai()
+        return self._async_openai
+
+    @property
+    def async_http(self):
+        """ASGIモードのGoogle CSEと記事取得用のhttpx.AsyncClient。"""
+        if self._async_http is None:
+            with self._lock:
+                if self._async_http is None:
+                    import httpx
+                    self._async_http = httpx.AsyncClient(
+                        headers={'User-Agent': self.config['HTTP_USER_AGENT']},
+                        limits=httpx.Limits(max_connections=self.config['ASYNC_HTTP_MAX_CONNECTIONS']),
+                        follow_redirects=True,
+                        default_encoding=_detect_encoding,
+                    )
+        return self._async_http
+
+    def _async_openai_http_client(self):
+        # ASGIモードで検索クエリ生成とチャット補完が共有する接続プール（ロック内から呼ぶ）
+        if self._async_openai_http is None:
+            import httpx
+            config = self.config
+            self._async_openai_http = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=config['ASYNC_OPENAI_MAX_CONNECTIONS'],
+                    max_keepalive_connections=config['ASYNC_OPENAI_MAX_CONNECTIONS'],
+                ),
+                timeout=httpx.Timeout(config['OPENAI_TIMEOUT'], connect=config['OPENAI_CONNECT_TIMEOUT']),
+                event_hooks={
+                    'request': [self._openai_counter.arequest],
+                    'response': [self._openai_counter.aresponse],
+                },
+            )
+        return self._async_openai_http
+
+    def _create_async_openai(self):
+        if self.config['OPENAI_FAKE']:
+            from .fake_openai import FakeAsyncOpenAI
+            return FakeAsyncOpenAI()
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(
+            api_key=self.config['OPENAI_API_KEY'],
+            base_url=self.config['OPENAI_BASE_URL'],
+            http_client=self._async_openai_http_client(),
+            max_retries=0,
+        )
+
+    async def search_async(self, query, num=5):
+        """search()の非同期版。"""
+        self._cse_counter.request()
+        try:
+            response = await self.async_http.get(
+                self.cse_endpoint,
+                params={'key': self.google_api_key, 'cx': self.google_cse_id, 'q': query, 'num': num},
+                timeout=self.cse_timeout,
+            )
+            response.raise_for_status()
+        except Exception:
+            self._cse_counter.error()
+            raise
+        return response.json().get('items', [])
+
+    async def fetch_page_async(self, url, timeout):
+        """
+        記事ページを非同期に取得し、httpxのレスポンスを返す。
+        charsetの指定がない場合の文字コードの推定はresponse.textの参照時に行われるため、スレッドで参照する。
+        """
+        response = await self.async_http.get(url, timeout=timeout)
+        response.raise_for_status()
+        return response
+
+    async def aclose(self):
+        """非同期クライアントを閉じる（ASGIのlifespanの終了時に呼ぶ）。"""
+        for client in (self._async_openai_http, self._async_http):
+            if client is not None:
+                await client.aclose()
+
+    def search(self, query, num=5):
+        """Google Custom Search APIを呼び出し、検索結果のitemsを返す。"""
+        self._cse_counter.request()
+        try:
+            response = self.http.get(
+                self.cse_endpoint,
+                params={'key': self.google_api_key, 'cx': self.google_cse_id, 'q': query, 'num': num},
+                timeout=self.cse_timeout,
+            )
+            response.raise_for_status()
+        except Exception:
+            self._cse_counter.error()
+            raise
+        return response.json().get('items', [])
+
+    def fetch_html(self, url, timeout):
+        """記事ページのHTMLを共有セッションで取得する。"""
+        response = self.http.get(url, timeout=timeout)
+        response.raise_for_status()
+        # charsetの指定がない場合はrequestsの既定（ISO-8859-1）ではなく内容から推定する
+        if 'charset' not in response.headers.get('Content-Type', '').lower():
+            response.encoding = response.apparent_encoding
+        return response.text
+
+    def stats(self):
+        """接続プールの状態と再利用の統計を返す。"""
+        hosts = {}
+        if self._adapter is not None:
+            for key in self._adapter.poolmanager.pools.keys():
+                pool = self._adapter.poolmanager.pools[key]
+                num_requests = pool.num_requests
+                hosts[f"{pool.scheme}://{pool.host}"] = {
+                    "connections_opened": pool.num_connections,
+                    "requests": num_requests,
+                    "idle": pool.pool.qsize() if pool.pool is not None else 0,
+                    "reuse_ratio": round(1 - pool.num_connections / num_requests, 3) if num_requests else None,
+                }
+        return {
+            "openai": {
+                **self._openai_counter.stats(),
+                "closed": self._openai_http.is_closed if self._openai_http is not None else True,
+            },
+            "cse": self._cse_counter.stats(),
+            "http_pools": hosts,
+        }
+
+    def close(self):
+        if self._openai_http is not None:
+            self._openai_http.close()
+        if self.http is not None:
+            self.http.close()
+        logging.info("外部サービスの接続プールを閉じました。")
+
+
+services = ServiceRegistry()
@@ -0,0 +1,118 @@
+# backend/services/response_cache.py
+import hashlib
+import math
+from collections import Counter
+from models import Message, ProjectSummary
+from .cache import TTLCache
+from .search_cache import normalize_prompt
+from .template_prompt import template_prompt
+from .tokenizer import tokenize
+
+# 応答の生成に使うモデル（変更された場合もキャッシュを無効にする）
+COMPLETION_MODEL = "chatgpt-4o-latest"
+
+
+def _digest(*parts):
+    return hashlib.sha256("\x1f".join(parts).encode('utf-8')).hexdigest()
+
+
+def _cosine(a, b):
+    if not a or not b:
+        return 0.0
+    dot = sum(count * b[token] for token, count in a.items() if token in b)
+    return dot / (math.sqrt(sum(v * v for v in a.values())) * math.sqrt(sum(v * v for v in b.values())))
+
+
+class ResponseCache:
+    """
+    似たプロンプトに対するAI応答のキャッシュ（オプトイン）。
+    正規化したプロンプトと会話の状態（ユーザー・プロジェクト・会話の要約・直近の会話）の指紋をキーにし、
+    同じ会話の状態のエントリの中からプロンプトのbigramのコサイン類似度が閾値以上のものを再利用する。
+    テンプレートプロンプトとモデルのハッシュもキーに含め、変更時は古いエントリを使わない。
+    """
+
+    def __init__(self, enabled=False, maxsize=500, ttl=3600, threshold=0.85, context_messages=4):
+        self.configure(enabled, maxsize, ttl, threshold, context_messages)
+
+    def configure(self, enabled, maxsize, ttl, threshold, context_messages):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.context_messages = context_messages
+        self.template_hash = _digest(template_prompt, COMPLETION_MODEL)
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        self.configure(
+            app.config.get('RESPONSE_CACHE_ENABLED', False),
+            app.config.get('RESPONSE_CACHE_SIZE', 500),
+            app.config.get('RESPONSE_CACHE_TTL', 3600),
+            app.config.get('RESPONSE_CACHE_THRESHOLD', 0.85),
+            app.config.get('RESPONSE_CACHE_CONTEXT_MESSAGES', 4),
+        )
+
+    def context_key(self, project):
+        """
+        ユーザー・プロジェクト・会話の要約・直近の会話（最大context_messages件）とテンプレートから
+        会話の状態のキーを作る。応答は要約を含む会話の履歴に依存するため、他のユーザーやプロジェクトとは共有しない。
+        """
+        summary = ProjectSummary.query.with_entities(
+            ProjectSummary.summary, ProjectSummary.last_message_id,
+        ).filter_by(project_id=project.id).first()
+        recent = Message.query.with_entities(Message.id, Message.sender, Message.content).filter(
+            Message.project_id == project.id,
+        ).order_by(Message.created_at.desc(), Message.id.desc()).limit(self.context_messages).all()
+        parts = [f"{message_id}:{sender}:{normalize_prompt(content)}" for message_id, sender, content in reversed(recent)]
+        summary_part = f"{summary.last_message_id}:{summary.summary}" if summary is not None else ""
+        return _digest(self.template_hash, f"{project.user_id}:{project.id}", summary_part, *parts)
+
+    def get(self, context_key, user_prompt):
+        """
+        キャッシュ済みの応答 {"ai_response", "articles"} を返す。見つからない場合はNone。
+        完全一致を優先し、無ければ同じ会話の状態のエントリから最も類似したものを使う。
+        """
+        normalized = normalize_prompt(user_prompt)
+        entry = self._entries.get(_digest(context_key, normalized))
+        if entry is not None:
+            self.exact_hits += 1
+            return entry
+
+        vector = Counter(tokenize(normalized))
+        best, best_score = None, self.threshold
+        for candidate in self._entries.values():
+            if candidate["context_key"] != context_key:
+                continue
+            score = _cosine(vector, candidate["vector"])
+            if score >= best_score:
+                best, best_score = candidate, score
+        if best is None:
+            self.misses += 1
+            return None
+        self.similar_hits += 1
+        return best
+
+    def set(self, context_key, user_prompt, ai_response, articles):
+        normalized = normalize_prompt(user_prompt)
+        self._entries.set(_digest(context_key, normalized), {
+            "context_key": context_key,
+            "vector": Counter(tokenize(normalized)),
+            "ai_response": ai_response,
+            "articles": articles,
+        })
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "entries": self._entries.stats(),
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+        }
+
+
+response_cache = ResponseCache()
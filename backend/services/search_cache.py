@@ -0,0 +1,166 @@
+# backend/services/search_cache.py
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+import unicodedata
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+from models import db, SearchCacheEntry
+from .cache import TTLCache
+
+QUERY_LEVEL = 'query'
+RESULTS_LEVEL = 'results'
+
+
+def normalize_prompt(text):
+    """
+    キャッシュキー用にプロンプトを正規化する。
+    全角・半角の統一（NFKC）、小文字化、空白の圧縮、末尾の句読点除去を行う。
+    """
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text.rstrip('?？!！。.、, ')
+
+
+def _cache_key(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class SearchCache:
+    """
+    検索クエリ生成と検索結果の二段キャッシュ。
+    一段目は正規化したプロンプト→検索クエリ、二段目は検索クエリ→CSEの検索結果。
+    どちらもプロセス内LRUを持ち、有効にした場合はDB（SQLite/PostgreSQL）を共有層として使う。
+    DB層はリクエストのセッションとは別のセッションで読み書きする（リクエストのトランザクションをコミットしない）。
+    空の結果（検索結果0件など）は一時的な失敗の可能性があるため、プロセス内に短時間だけ保持しDBには書かない。
+    """
+
+    def __init__(self, maxsize=1024, query_ttl=86400, results_ttl=21600, db_tier=False,
+                 empty_ttl=300, prune_interval=600, prune_batch=500):
+        self._prune_lock = threading.Lock()
+        self.configure(maxsize, query_ttl, results_ttl, db_tier, empty_ttl, prune_interval, prune_batch)
+
+    def configure(self, maxsize, query_ttl, results_ttl, db_tier, empty_ttl=300, prune_interval=600, prune_batch=500):
+        self._ttls = {QUERY_LEVEL: query_ttl, RESULTS_LEVEL: results_ttl}
+        self._empty_ttl = empty_ttl
+        self._prune_interval = prune_interval
+        self._prune_batch = prune_batch
+        self._last_prune = time.monotonic()
+        self._levels = {
+            QUERY_LEVEL: TTLCache(maxsize=maxsize, ttl=query_ttl),
+            RESULTS_LEVEL: TTLCache(maxsize=maxsize, ttl=results_ttl),
+        }
+        self._db_tier = db_tier
+        self.db_hits = 0
+
+    def init_app(self, app):
+        self.configure(
+            app.config.get('SEARCH_CACHE_SIZE', 1024),
+            app.config.get('SEARCH_QUERY_CACHE_TTL', 86400),
+            app.config.get('SEARCH_RESULT_CACHE_TTL', 21600),
+            app.config.get('SEARCH_CACHE_DB_TIER', False),
+            app.config.get('SEARCH_EMPTY_RESULT_CACHE_TTL', 300),
+            app.config.get('SEARCH_CACHE_PRUNE_INTERVAL', 600),
+            app.config.get('SEARCH_CACHE_PRUNE_BATCH', 500),
+        )
+
+    @property
+    def db_tier(self):
+        return self._db_tier
+
+    def _get(self, level, text):
+        key = _cache_key(text)
+        value = self._levels[level].get(key)
+        if value is not None or not self._db_tier:
+            return value
+
+        try:
+            with Session(db.engine) as session:
+                row = session.execute(
+                    select(SearchCacheEntry.value, SearchCacheEntry.expires_at)
+                    .filter_by(kind=level, cache_key=key)
+                ).first()
+        except Exception as e:
+            logging.warning(f"検索キャッシュ（DB）の読み込みに失敗しました: {e}")
+            return None
+        if row is None or row.expires_at < datetime.now():
+            return None
+
+        value = json.loads(row.value)
+        remaining = (row.expires_at - datetime.now()).total_seconds()
+        self._levels[level].set(key, value, ttl=remaining)
+        self.db_hits += 1
+        return value
+
+    def _set(self, level, text, value):
+        key = _cache_key(text)
+        if not value:
+            self._levels[level].set(key, value, ttl=self._empty_ttl)
+            return
+        self._levels[level].set(key, value)
+        if not self._db_tier:
+            return
+
+        expires_at = datetime.now() + timedelta(seconds=self._ttls[level])
+        try:
+            with Session(db.engine) as session:
+                entry = session.execute(
+                    select(SearchCacheEntry).filter_by(kind=level, cache_key=key)
+                ).scalar_one_or_none()
+                if entry is None:
+                    entry = SearchCacheEntry(kind=level, cache_key=key)
+                    session.add(entry)
+                entry.value = json.dumps(value, ensure_ascii=False)
+                entry.expires_at = expires_at
+                session.commit()
+        except Exception as e:
+            logging.warning(f"検索キャッシュ（DB）の書き込みに失敗しました: {e}")
+            return
+        self._prune_expired()
+
+    def _prune_expired(self):
+        """期限切れのエントリをprune_intervalごとに最大prune_batch件ずつ削除する（テーブルの肥大化を防ぐ）。"""
+        now = time.monotonic()
+        with self._prune_lock:
+            if now - self._last_prune < self._prune_interval:
+                return
+            self._last_prune = now
+        try:
+            with Session(db.engine) as session:
+                expired = (
+                    select(SearchCacheEntry.id)
+                    .where(SearchCacheEntry.expires_at < datetime.now())
+                    .limit(self._prune_batch)
+                    .scalar_subquery()
+                )
+                session.execute(delete(SearchCacheEntry).where(SearchCacheEntry.id.in_(expired)))
+                session.commit()
+        except Exception as e:
+            logging.warning(f"検索キャッシュ（DB）の期限切れエントリの削除に失敗しました: {e}")
+
+    def get_query(self, user_prompt):
+        return self._get(QUERY_LEVEL, normalize_prompt(user_prompt))
+
+    def set_query(self, user_prompt, search_query):
+        self._set(QUERY_LEVEL, normalize_prompt(user_prompt), search_query)
+
+    def get_results(self, search_query):
+        return self._get(RESULTS_LEVEL, normalize_prompt(search_query))
+
+    def set_results(self, search_query, items):
+        self._set(RESULTS_LEVEL, normalize_prompt(search_query), items)
+
+    def stats(self):
+        return {
+            "query": self._levels[QUERY_LEVEL].stats(),
+            "results": self._levels[RESULTS_LEVEL].stats(),
+            "db_tier": self._db_tier,
+            "db_hits": self.db_hits,
+        }
+
+
+search_cache = SearchCache()
@@ -0,0 +1,136 @@
+# backend/services/search_index.py
+import unicodedata
+from sqlalchemy import and_, func, literal, literal_column, or_, select, table, column
+from sqlalchemy.orm import load_only
+from models import db, Article as DBArticle, Message, Project, SearchDocument, article_message
+from .compression import article_codec
+from .tokenizer import tokenize
+
+# 検索結果に表示する本文の抜粋の長さ（文字数）
+SNIPPET_LENGTH = 120
+
+# SQLiteのFTS5仮想テーブル（models.pyのDDLで作成）
+_fts = table('search_document_fts', column('rowid'))
+
+
+def document_terms(text):
+    """索引に保存するトークン列（空白区切り）を返す。"""
+    return " ".join(tokenize(text))
+
+
+def _query_terms(query):
+    """
+    検索語のトークン列を (トークン, 前方一致か) のリストで返す。
+    日本語の1文字だけの語は文書側のbigramと一致しないため前方一致で検索する。
+    """
+    terms = []
+    for token in dict.fromkeys(tokenize(query)):
+        terms.append((token, len(token) == 1 and not token.isascii()))
+    return terms
+
+
+def _match_and_score(dialect, terms):
+    """DBごとの (検索条件, スコア式, FROM句) を返す。スコアは大きいほど関連度が高い。"""
+    documents = SearchDocument.__table__
+    if dialect == 'postgresql':
+        tsquery = " & ".join(f"'{token}'" + (":*" if prefix else "") for token, prefix in terms)
+        vector = func.to_tsvector(literal_column("'simple'"), SearchDocument.terms)
+        query = func.to_tsquery(literal_column("'simple'"), tsquery)
+        return vector.op('@@')(query), func.ts_rank(vector, query), documents
+    if dialect == 'sqlite':
+        expression = " ".join(f'"{token}"' + ("*" if prefix else "") for token, prefix in terms)
+        match = literal_column('search_document_fts').match(expression)
+        # bm25()は小さいほど関連度が高い
+        score = -func.bm25(literal_column('search_document_fts'))
+        return match, score, documents.join(_fts, _fts.c.rowid == SearchDocument.id)
+    # 索引を持たないDBでは部分一致で絞り込む（順位付けなし）
+    match = and_(*[SearchDocument.terms.contains(token) for token, _ in terms])
+    return match, literal(0.0), documents
+
+
+def _snippet(content, query):
+    """検索語が最初に現れる位置の周辺を抜粋する。"""
+    lowered = content.lower()
+    candidates = [word for word in unicodedata.normalize('NFKC', query).lower().split() if word]
+    candidates += [token for token in tokenize(query) if token not in candidates]
+    position = -1
+    for word in candidates:
+        position = lowered.find(word)
+        if position >= 0:
+            break
+    start = max(0, position - SNIPPET_LENGTH // 3) if position >= 0 else 0
+    snippet = content[start:start + SNIPPET_LENGTH].replace("\n", " ")
+    return ("…" if start > 0 else "") + snippet + ("…" if start + SNIPPET_LENGTH < len(content) else "")
+
+
+def search(user_id, query, kind=None, project_id=None, limit=20, offset=0):
+    """
+    ユーザーのメッセージと、そのメッセージに紐づく記事を全文検索する。
+    kindに'message'または'article'を指定すると対象を限定する。
+    関連度順に (結果のリスト, 次のoffsetまたはNone) を返す。
+    """
+    terms = _query_terms(query)
+    if not terms:
+        return [], None
+
+    owned_messages = select(Message.id).join(Project, Project.id == Message.project_id).where(Project.user_id == user_id)
+    if project_id is not None:
+        owned_messages = owned_messages.where(Message.project_id == project_id)
+    owned_articles = select(article_message.c.article_id).where(article_message.c.message_id.in_(owned_messages))
+
+    ownership = []
+    if kind in (None, 'message'):
+        ownership.append(SearchDocument.message_id.in_(owned_messages))
+    if kind in (None, 'article'):
+        ownership.append(SearchDocument.article_id.in_(owned_articles))
+
+    match, score, from_clause = _match_and_score(db.session.get_bind().dialect.name, terms)
+    rows = db.session.execute(
+        select(SearchDocument.message_id, SearchDocument.article_id, score.label('score'))
+        .select_from(from_clause)
+        .where(match, or_(*ownership))
+        .order_by(literal_column('score').desc(), SearchDocument.id.desc())
+        .limit(limit + 1)
+        .offset(offset)
+    ).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    # 本文はページ内の結果の分だけまとめて取得する
+    message_ids = [row.message_id for row in rows if row.message_id is not None]
+    article_ids = [row.article_id for row in rows if row.article_id is not None]
+    messages = {message.id: message for message in Message.query.filter(Message.id.in_(message_ids))} if message_ids else {}
+    articles = {
+        article.id: article
+        for article in DBArticle.query.options(load_only(
+            DBArticle.id, DBArticle.title, DBArticle.url, DBArticle.body, DBArticle.legacy_content
+        ))
+        .filter(DBArticle.id.in_(article_ids))
+    } if article_ids else {}
+
+    results = []
+    for row in rows:
+        if row.message_id is not None and row.message_id in messages:
+            message = messages[row.message_id]
+            results.append({
+                "type": "message",
+                "id": message.id,
+                "project_id": message.project_id,
+                "sender": message.sender,
+                "created_at": message.created_at,
+                "snippet": _snippet(message.content, query),
+                "score": float(row.score),
+            })
+        elif row.article_id is not None and row.article_id in articles:
+            article = articles[row.article_id]
+            results.append({
+                "type": "article",
+                "id": article.id,
+                "title": article.title,
+                "url": article.url,
+                "snippet": _snippet(article_codec.text(article) or '', query),
+                "score": float(row.score),
+            })
+
+    return results, (offset + limit if has_more else None)
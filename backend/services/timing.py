@@ -0,0 +1,39 @@
+# backend/services/timing.py
+import time
+from contextlib import contextmanager
+from .metrics import observe_stage, record_optimization
+
+
+class StageTimer:
+    """
+    チャットパイプラインの段階ごとの所要時間（秒）と、ターンで効いた最適化を記録し、メトリクスにも反映する。
+    """
+
+    def __init__(self):
+        self.durations = {}
+        self.optimizations = {}
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.durations[name] = self.durations.get(name, 0.0) + elapsed
+            observe_stage(name, elapsed)
+
+    def fired(self, name):
+        """最適化（記事取得のヘッジ、十分な件数での打ち切り、応答の先行生成など）が効いたことを記録する。"""
+        self.optimizations[name] = self.optimizations.get(name, 0) + 1
+        record_optimization(name)
+
+    def server_timing(self, db_stats=None):
+        """Server-Timingヘッダーの値を返す（ミリ秒）。効いた最適化はoptのdescに含める。"""
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.durations.items()]
+        if db_stats is not None:
+            entries.append(f'db;desc="queries={db_stats["queries"]}";dur={db_stats["seconds"] * 1000:.1f}')
+        if self.optimizations:
+            fired = ",".join(f"{name}={count}" for name, count in self.optimizations.items())
+            entries.append(f'opt;desc="{fired}"')
+        return ", ".join(entries)
@@ -0,0 +1,23 @@
+# backend/services/tokenizer.py
+import re
+import unicodedata
+
+# 英数字の単語と、それ以外（日本語など）の連続した文字列に分割する
+_TOKEN_PATTERN = re.compile(r'[a-z0-9]+|[^\W_a-z0-9]+')
+
+
+def tokenize(text):
+    """
+    検索・ランキング用にテキストをトークン化する。
+    英数字は単語単位、日本語などの分かち書きされない文字列は文字bigramに分割する。
+    """
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    tokens = []
+    for word in _TOKEN_PATTERN.findall(text):
+        if word.isascii():
+            tokens.append(word)
+        elif len(word) == 1:
+            tokens.append(word)
+        else:
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
@@ -0,0 +1,94 @@
+# backend/tests/conftest.py
+import os
+import random
+import tempfile
+import pytest
+
+# config.pyは読み込み時に環境変数を読むため、アプリを読み込む前に設定する。
+# 外部サービスはダミー（OPENAI_FAKE、BROWSER_DRIVER=stub）にし、バックグラウンドのスレッドは起動しない
+_db_dir = tempfile.mkdtemp(prefix='ai-chat-service-test-')
+os.environ.update({
+    'DATABASE_URL': f"sqlite:///{os.path.join(_db_dir, 'test.db')}",
+    'JWT_SECRET_KEY': 'test-secret-key-that-is-long-enough-for-hs256',
+    'OPENAI_API_KEY': 'sk-test',
+    'OPENAI_FAKE': 'true',
+    'BROWSER_DRIVER': 'stub',
+    'JOB_WORKERS': '0',
+    'ARTICLE_GC_INTERVAL': '0',
+})
+
+ARTICLE_BODY = "画像生成AIの比較です。Midjourneyは高品質な画像を生成します。" * 20
+
+
+def _article_text(seed):
+    rng = random.Random(seed)
+    return "。".join("".join(rng.choice("あいうえおかきくけこさしすせそ") for _ in range(12)) for _ in range(200))
+
+
+class FakeQueryChain:
+    """検索クエリ生成のLLMChainの代わり（OpenAIを呼ばない）。"""
+
+    def run(self, user_prompt):
+        return "画像生成 AI 比較"
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import create_app
+    return create_app()
+
+
+@pytest.fixture
+def client(app):
+    """テストごとに空のDBとプロセス内のキャッシュ・レート制限の状態で始める。"""
+    from models import db
+    from services.article_cache import article_cache
+    from services.job_queue import job_queue
+    from services.ownership import project_ownership
+    from services.rate_limit import rate_limiter
+    from services.response_cache import response_cache
+    from services.search_cache import search_cache
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    for service in (article_cache, job_queue, project_ownership, rate_limiter, response_cache, search_cache):
+        service.init_app(app)
+    return app.test_client()
+
+
+@pytest.fixture
+def article_text():
+    """seedごとに内容の異なる記事の本文を返す関数（同じseedなら同じ本文）。"""
+    return _article_text
+
+
+@pytest.fixture
+def upstreams(monkeypatch):
+    """検索クエリ生成・Google CSE・記事の取得をダミーにする。取得したURLのリストを返す。"""
+    import services.openai_service as openai_service
+    from services.registry import services
+
+    items = [{"title": f"記事{i}", "link": f"http://example.com/{i}"} for i in range(5)]
+    fetched = []
+
+    def fetch_article_content(url, timeout=None):
+        fetched.append(url)
+        return ARTICLE_BODY + url
+
+    monkeypatch.setattr(services, '_query_chain', FakeQueryChain())
+    monkeypatch.setattr(services, 'search', lambda query, num=5: list(items))
+    monkeypatch.setattr(openai_service, 'fetch_article_content', fetch_article_content)
+    return fetched
+
+
+@pytest.fixture
+def auth(client):
+    """ユーザーを登録してログインし、(認証ヘッダー, プロジェクトID) を返す。"""
+    client.post('/api/auth/register', json={"username": "tester", "email": "tester@example.com", "password": "pw"})
+    token = client.post(
+        '/api/auth/login', json={"email": "tester@example.com", "password": "pw"},
+    ).get_json()['access_token']
+    headers = {"Authorization": f"Bearer {token}"}
+    project_id = client.post('/api/projects/', json={"name": "テスト"}, headers=headers).get_json()['project']['id']
+    return headers, project_id
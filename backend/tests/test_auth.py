@@ -0,0 +1,22 @@
+# backend/tests/test_auth.py
+from models import User
+
+
+def _login(client):
+    return client.post('/api/auth/login', json={"email": "u@example.com", "password": "pw"})
+
+
+def test_password_hash_follows_app_config(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+    client.post('/api/auth/register', json={"username": "u", "email": "u@example.com", "password": "pw"})
+    with app.app_context():
+        assert User.query.one().password_hash.startswith('pbkdf2:sha256:1000$')
+
+    # 設定を変えると、次のログインで新しい方式で作り直す
+    monkeypatch.setitem(app.config, 'PASSWORD_HASH_METHOD', 'pbkdf2:sha256:2000')
+    assert _login(client).status_code == 200
+    with app.app_context():
+        user = User.query.one()
+        assert user.password_hash.startswith('pbkdf2:sha256:2000$')
+        assert not user.needs_rehash()
+    assert _login(client).status_code == 200
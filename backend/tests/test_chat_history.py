@@ -0,0 +1,62 @@
+# backend/tests/test_chat_history.py
+from datetime import datetime, timedelta
+from models import db, Message
+
+
+def _add_messages(app, project_id, count):
+    start = datetime(2024, 1, 1)
+    with app.app_context():
+        db.session.add_all(
+            Message(project_id=project_id, sender='user' if i % 2 == 0 else 'ai', content=f"メッセージ{i}",
+                    created_at=start + timedelta(seconds=i // 2))  # 同じ時刻のメッセージも含める
+            for i in range(count)
+        )
+        db.session.commit()
+
+
+def test_history_pages_back_with_next_before_id(app, client, auth):
+    headers, project_id = auth
+    _add_messages(app, project_id, 25)
+
+    pages = []
+    params = {"limit": 10}
+    while True:
+        response = client.get(f'/api/chat/{project_id}', query_string=params, headers=headers)
+        assert response.status_code == 200
+        pages.append([message["content"] for message in response.get_json()])
+        next_before_id = response.headers.get('X-Next-Before-Id')
+        if next_before_id is None:
+            break
+        params = {"limit": 10, "before_id": next_before_id}
+
+    assert [len(page) for page in pages] == [10, 10, 5]
+    # 各ページは古い順、ページは新しい方から順に返る
+    contents = [content for page in reversed(pages) for content in page]
+    assert contents == [f"メッセージ{i}" for i in range(25)]
+
+
+def test_history_returns_304_until_a_message_is_added(app, client, auth):
+    headers, project_id = auth
+    _add_messages(app, project_id, 3)
+
+    first = client.get(f'/api/chat/{project_id}', headers=headers)
+    etag = first.headers['ETag']
+    cached = client.get(f'/api/chat/{project_id}', headers={**headers, "If-None-Match": etag})
+    _add_messages(app, project_id, 1)
+    changed = client.get(f'/api/chat/{project_id}', headers={**headers, "If-None-Match": etag})
+
+    assert cached.status_code == 304
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+
+def test_history_rejects_cursor_from_another_project(app, client, auth):
+    headers, project_id = auth
+    other_id = client.post('/api/projects/', json={"name": "別のプロジェクト"}, headers=headers).get_json()['project']['id']
+    _add_messages(app, other_id, 3)
+    with app.app_context():
+        foreign_id = Message.query.filter_by(project_id=other_id).first().id
+
+    for before_id in (foreign_id, 9999):
+        response = client.get(f'/api/chat/{project_id}', query_string={"before_id": before_id}, headers=headers)
+        assert response.status_code == 400
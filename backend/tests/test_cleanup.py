@@ -0,0 +1,60 @@
+# backend/tests/test_cleanup.py
+from datetime import datetime, timedelta
+from sqlalchemy import delete
+from models import db, Article, ChatJob, Message, Project, User, article_message
+from services.cleanup import article_collector
+
+
+def _article(url, fetched_at):
+    return Article(title=url, url=url, fetched_at=fetched_at)
+
+
+def test_delete_project_removes_history_and_collects_orphaned_articles(app, client, auth, monkeypatch):
+    headers, project_id = auth
+    monkeypatch.setitem(app.config, 'PROJECT_DELETE_BATCH_SIZE', 2)
+    old = datetime.now() - article_collector.grace - timedelta(minutes=1)
+    with app.app_context():
+        user_id = User.query.one().id
+        other = Project(name="残すプロジェクト", user_id=user_id)
+        orphaned, recent, shared = (
+            _article("http://a/old", old), _article("http://a/recent", datetime.now()), _article("http://a/shared", old),
+        )
+        messages = [Message(project_id=project_id, sender='ai', content=f"応答{i}") for i in range(5)]
+        db.session.add_all([other, orphaned, recent, shared, *messages])
+        db.session.flush()
+        for message in messages:
+            message.articles.extend([orphaned, recent, shared])
+        kept = Message(project_id=other.id, sender='ai', content="残る応答", articles=[shared])
+        db.session.add_all([kept, ChatJob(id='job', user_id=user_id, project_id=project_id, prompt='質問', status='queued')])
+        db.session.commit()
+        other_id = other.id
+
+    response = client.delete(f'/api/projects/{project_id}', headers=headers)
+
+    assert response.status_code == 200
+    assert client.get(f'/api/chat/{project_id}', headers=headers).status_code == 404
+    with app.app_context():
+        assert db.session.get(Project, project_id) is None
+        assert Message.query.filter_by(project_id=project_id).count() == 0
+        assert db.session.get(ChatJob, 'job') is None
+        assert db.session.query(article_message).count() == 1
+        # 記事は削除のリクエストでは消さず、ArticleCollectorが後で削除する
+        assert Article.query.count() == 3
+
+        assert article_collector.collect() == 1
+        assert sorted(url for (url,) in db.session.query(Article.url)) == ["http://a/recent", "http://a/shared"]
+        assert Message.query.filter_by(project_id=other_id).one().articles[0].url == "http://a/shared"
+
+
+def test_prompt_to_project_deleted_by_another_worker_invalidates_ownership(app, client, auth, upstreams):
+    headers, project_id = auth
+    assert client.get(f'/api/chat/{project_id}', headers=headers).status_code == 200
+    # 他のワーカーでの削除（このプロセスの所有確認のキャッシュは無効化されない）
+    with app.app_context():
+        db.session.execute(delete(Project).where(Project.id == project_id))
+        db.session.commit()
+
+    client.post(f'/api/chat/{project_id}', json={"content": "質問"}, headers=headers)
+
+    # ターンの保存に失敗した時点でキャッシュから外し、TTLを待たずに404を返す
+    assert client.post(f'/api/chat/{project_id}', json={"content": "質問"}, headers=headers).status_code == 404
@@ -0,0 +1,37 @@
+# backend/tests/test_compression.py
+import zlib
+import pytest
+from models import Article
+from services.compression import ArticleCodec
+
+BODY = "画像生成AIの比較です。Midjourneyは高品質な画像を生成します。" * 50
+
+
+class _App:
+    def __init__(self, **config):
+        self.config = config
+
+
+@pytest.mark.parametrize("method, prefix", [("zlib", b"z"), ("zstd", b"s")])
+def test_codec_round_trip(method, prefix):
+    if method == "zstd":
+        pytest.importorskip("zstandard")
+    codec = ArticleCodec()
+    codec.init_app(_App(ARTICLE_COMPRESSION=method))
+
+    values = codec.encode(BODY)
+
+    assert values["body"][:1] == prefix
+    assert len(values["body"]) < values["content_size"] == len(BODY.encode("utf-8"))
+    assert codec.decompress(values["body"]) == BODY
+
+
+def test_codec_reads_other_methods_and_legacy_rows():
+    codec = ArticleCodec()
+    codec.init_app(_App(ARTICLE_COMPRESSION="zstd"))
+
+    # 方式を変えても既存の行は読める
+    assert codec.decompress(b"z" + zlib.compress(BODY.encode("utf-8"))) == BODY
+    assert codec.text(Article(body=None, legacy_content=BODY)) == BODY
+    with pytest.raises(ValueError):
+        codec.decompress(b"x" + BODY.encode("utf-8"))
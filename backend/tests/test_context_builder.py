@@ -0,0 +1,35 @@
+# backend/tests/test_context_builder.py
+import services.openai_service as openai_service
+from config import Config
+from models import db, Message, ProjectSummary
+
+
+def _add_history(app, project_id, count):
+    with app.app_context():
+        db.session.add_all(
+            Message(project_id=project_id, sender='user' if i % 2 == 0 else 'ai', content=f"以前のやり取り{i}")
+            for i in range(count)
+        )
+        db.session.commit()
+
+
+def test_summary_is_saved_with_the_turn(app, client, auth, upstreams, monkeypatch):
+    headers, project_id = auth
+    monkeypatch.setattr(Config, 'CONTEXT_RECENT_MESSAGES', 2)
+    _add_history(app, project_id, 6)
+
+    def failing_completion(messages):
+        raise RuntimeError("応答の生成に失敗しました")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(openai_service, 'create_completion', failing_completion)
+        client.post(f'/api/chat/{project_id}', json={"content": "質問"}, headers=headers)
+    with app.app_context():
+        # 失敗したターンで作成した要約は保存しない
+        assert ProjectSummary.query.count() == 0
+
+    assert client.post(f'/api/chat/{project_id}', json={"content": "質問"}, headers=headers).status_code == 201
+    with app.app_context():
+        summary = ProjectSummary.query.filter_by(project_id=project_id).one()
+        assert summary.summary
+        assert summary.last_message_id > 0
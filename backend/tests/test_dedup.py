@@ -0,0 +1,39 @@
+# backend/tests/test_dedup.py
+from services.context_builder import _fit_articles
+from services.dedup import collapse_duplicates
+
+
+def _source(url, content):
+    return {"title": url, "url": url, "content": content, "chunks": [(1.0, 0, content[:40])] if content else []}
+
+
+def test_collapse_duplicates_keeps_first_of_near_identical_articles(article_text):
+    body = article_text(1)
+    sources = [
+        _source("http://a/1", body),
+        _source("http://b/1", body + "（転載）"),
+        _source("http://c/1", article_text(2)),
+    ]
+
+    collapse_duplicates(sources)
+
+    assert sources[0]["content"] == body
+    assert sources[1]["content"] is None
+    assert sources[1]["duplicate_of"] == "http://a/1"
+    assert "duplicate_of" not in sources[2]
+
+
+def test_fit_articles_leaves_duplicates_out_of_context(article_text):
+    body = article_text(1)
+    sources = collapse_duplicates([
+        _source("http://a/1", body),
+        _source("http://b/1", body),
+        _source("http://c/1", None),
+    ])
+
+    sections = _fit_articles(sources, budget=10000)
+
+    assert len(sections) == 2
+    assert sections[0].startswith("### http://a/1")
+    # 取得できなかった記事は失敗として示すが、重複した記事は含めない
+    assert sections[1] == "### http://c/1\nリンク: http://c/1\n記事内容の取得に失敗しました。"
@@ -0,0 +1,128 @@
+# backend/tests/test_job_queue.py
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import text
+import services.job_queue as job_queue_module
+from models import db, ChatJob, Message, User
+from services.job_queue import job_queue
+
+
+def _enqueue(client, headers, project_id, content):
+    return client.post(f'/api/chat/{project_id}?async=1', json={"content": content}, headers=headers)
+
+
+def test_enqueue_saves_message_and_job(app, client, auth):
+    headers, project_id = auth
+
+    response = _enqueue(client, headers, project_id, "最適な画像生成AIは？")
+
+    assert response.status_code == 202
+    job_id = response.get_json()["job_id"]
+    assert client.get(f'/api/chat/jobs/{job_id}', headers=headers).get_json()["status"] == "queued"
+    with app.app_context():
+        assert Message.query.filter_by(project_id=project_id, sender='user').count() == 1
+
+
+def test_full_queue_rejects_without_saving_message(app, client, auth, monkeypatch):
+    headers, project_id = auth
+    monkeypatch.setattr(job_queue, 'max_queued_per_user', 2)
+
+    responses = [_enqueue(client, headers, project_id, f"質問{i}") for i in range(3)]
+
+    assert [response.status_code for response in responses] == [202, 202, 429]
+    assert responses[2].headers['Retry-After'] == str(job_queue.full_retry_after)
+    with app.app_context():
+        assert ChatJob.query.count() == 2
+        assert Message.query.filter_by(project_id=project_id).count() == 2
+
+
+def test_worker_runs_job_and_stores_result(app, client, auth, upstreams):
+    headers, project_id = auth
+    job_id = _enqueue(client, headers, project_id, "最適な画像生成AIは？").get_json()["job_id"]
+
+    with app.app_context():
+        assert job_queue.process_next() == job_id
+        assert job_queue.process_next() is None
+
+    body = client.get(f'/api/chat/jobs/{job_id}', headers=headers).get_json()
+    assert body["status"] == "succeeded"
+    assert body["ai_response"]
+    assert body["articles"]
+
+
+def test_transient_errors_are_retried_until_max_attempts(app, client, auth, monkeypatch):
+    headers, project_id = auth
+    job_id = _enqueue(client, headers, project_id, "質問").get_json()["job_id"]
+    monkeypatch.setattr(job_queue, 'retry_backoff', 0)
+    calls = []
+
+    def failing_pipeline(project, prompt, cancel_check=None):
+        calls.append(prompt)
+        raise ConnectionError("接続できません")
+
+    monkeypatch.setattr(job_queue_module, 'run_ai_pipeline', failing_pipeline)
+
+    statuses = []
+    with app.app_context():
+        for _ in range(job_queue.max_attempts):
+            assert job_queue.process_next() == job_id
+            statuses.append(db.session.get(ChatJob, job_id).status)
+        assert job_queue.process_next() is None
+
+    assert statuses == ["queued"] * (job_queue.max_attempts - 1) + ["failed"]
+    assert len(calls) == job_queue.max_attempts
+    body = client.get(f'/api/chat/jobs/{job_id}', headers=headers).get_json()
+    assert body["attempts"] == job_queue.max_attempts
+    assert body["error"] == "接続できません"
+
+
+def _add_running_job(app, project_id, attempts=1, started_at=None):
+    # 他のワーカー（別のプロセス）が実行中のジョブ
+    with app.app_context():
+        db.session.add(ChatJob(
+            id='running', user_id=User.query.one().id, project_id=project_id, prompt='質問', status='running',
+            attempts=attempts, started_at=started_at or datetime.now(),
+        ))
+        db.session.commit()
+
+
+def test_worker_respects_running_cap_across_workers(app, client, auth):
+    headers, project_id = auth
+    _add_running_job(app, project_id)
+    job_id = _enqueue(client, headers, project_id, "質問").get_json()["job_id"]
+
+    with app.app_context():
+        assert job_queue.process_next() is None
+        assert db.session.get(ChatJob, job_id).status == "queued"
+
+
+@pytest.mark.parametrize("attempts, expected", [(1, "succeeded"), (3, "failed")])
+def test_stale_running_jobs(app, client, auth, monkeypatch, attempts, expected):
+    _, project_id = auth
+    monkeypatch.setattr(job_queue_module, 'run_ai_pipeline', lambda project, prompt, cancel_check=None: {
+        "ai_response": "応答", "articles": [], "db": None,
+    })
+    _add_running_job(app, project_id, attempts, datetime.now() - job_queue.stale_after - timedelta(seconds=1))
+
+    with app.app_context():
+        # 試行回数が残っているジョブは待機状態に戻して再実行し、上限に達したジョブは失敗にする
+        job_queue.process_next()
+
+        assert db.session.get(ChatJob, 'running').status == expected
+
+
+def test_cancel_does_not_cancel_job_claimed_after_loading(app, client, auth):
+    headers, project_id = auth
+    job_id = _enqueue(client, headers, project_id, "質問").get_json()["job_id"]
+
+    with app.app_context():
+        job = db.session.get(ChatJob, job_id)
+        # 読み込んだ後に別のワーカーが取り出した
+        db.session.execute(text("UPDATE chat_job SET status = 'running' WHERE id = :id"), {"id": job_id})
+
+        job_queue.cancel(job)
+
+        assert (job.status, job.cancel_requested) == ("running", True)
+
+    queued_id = _enqueue(client, headers, project_id, "質問2").get_json()["job_id"]
+    assert client.delete(f'/api/chat/jobs/{queued_id}', headers=headers).get_json()["status"] == "cancelled"
@@ -0,0 +1,78 @@
+# backend/tests/test_migrations.py
+import pytest
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from flask_migrate import upgrade
+from sqlalchemy import text
+from models import db, Article, article_message
+from services.compression import article_codec
+
+# migrations/versionsの最初のリビジョン（マイグレーション導入前のスキーマ）
+INITIAL_REVISION = '951cc213ea8e'
+
+BODY = "画像生成AIの比較です。Midjourneyは高品質な画像を生成します。" * 50
+
+
+@pytest.fixture
+def empty_db(app, client):
+    """テーブルを全て削除し、マイグレーションを最初から適用できる状態にする。"""
+    with app.app_context():
+        db.drop_all()
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql("DROP TABLE IF EXISTS alembic_version")
+            conn.exec_driver_sql("DROP TABLE IF EXISTS search_document_fts")
+    return app
+
+
+@pytest.mark.filterwarnings("ignore:autogenerate skipping metadata-specified expression-based index")
+def test_migrations_match_the_models(empty_db):
+    with empty_db.app_context():
+        upgrade()
+        with db.engine.connect() as conn:
+            diff = compare_metadata(MigrationContext.configure(conn), db.metadata)
+
+    # SQLiteの全文検索の仮想テーブルはモデルに無い
+    assert [
+        change for change in diff
+        if not (change[0] == 'remove_table' and change[1].name.startswith('search_document_fts'))
+    ] == []
+
+
+def test_upgrade_migrates_articles_from_the_initial_schema(empty_db):
+    with empty_db.app_context():
+        # 圧縮導入前のスキーマ（contentがNOT NULL、関連付けの外部キーにON DELETEが無い）
+        upgrade(revision=INITIAL_REVISION)
+        for statement in (
+            "INSERT INTO \"user\" (id, username, email, password_hash) VALUES (1, 'u', 'u@example.com', 'x')",
+            "INSERT INTO project (id, user_id, name) VALUES (1, 1, 'p')",
+            "INSERT INTO message (id, project_id, sender, content) VALUES (1, 1, 'ai', '応答')",
+            "INSERT INTO article (id, title, url, content) VALUES (1, '記事', 'http://a/1', :body)",
+            "INSERT INTO article_message (article_id, message_id) VALUES (1, 1)",
+        ):
+            db.session.execute(text(statement), {"body": BODY})
+        db.session.commit()
+
+        upgrade()
+
+    result = empty_db.test_cli_runner().invoke(args=['compress-articles'])
+
+    assert result.exception is None
+    assert "1件の記事の本文を圧縮しました" in result.output
+    with empty_db.app_context():
+        article = db.session.get(Article, 1)
+        assert article.legacy_content is None
+        assert article_codec.text(article) == BODY
+        # マイグレーションで作り直した外部キーのON DELETE CASCADEで関連付けも削除される
+        db.session.execute(text("DELETE FROM message WHERE id = 1"))
+        db.session.commit()
+        assert db.session.query(article_message).count() == 0
+
+
+def test_init_db_refuses_databases_without_migration_history(empty_db):
+    with empty_db.app_context():
+        db.create_all()
+
+    result = empty_db.test_cli_runner().invoke(args=['init-db'])
+
+    assert result.exit_code != 0
+    assert "db stamp" in result.output
@@ -0,0 +1,43 @@
+# backend/tests/test_rate_limit.py
+from models import db, Message
+from services.rate_limit import TokenBuckets, rate_limiter
+
+
+def test_token_buckets_allow_burst_then_wait():
+    buckets = TokenBuckets()
+
+    waits = [buckets.take('user:1', 1.0, 3) for _ in range(4)]
+
+    assert waits[:3] == [0.0, 0.0, 0.0]
+    assert 0.9 < waits[3] <= 1.0
+
+
+def test_token_buckets_keep_refilling_keys_when_full():
+    buckets = TokenBuckets(max_keys=2)
+    assert buckets.take('user:1', 1 / 60, 1) == 0.0
+
+    # 上限を超えても、満杯に戻っていないバケットは削除されない
+    for key in ('user:2', 'user:3', 'user:4'):
+        buckets.take(key, 1 / 60, 1)
+
+    assert buckets.take('user:1', 1 / 60, 1) > 0
+
+
+def test_send_and_stream_return_429_with_retry_after(app, client, auth, upstreams, monkeypatch):
+    headers, project_id = auth
+    monkeypatch.setitem(app.config, 'USER_RATE_LIMIT_PER_MINUTE', 2)
+    monkeypatch.setitem(app.config, 'USER_RATE_LIMIT_BURST', 2)
+    rate_limiter.init_app(app)
+
+    codes = [
+        client.post(f'/api/chat/{project_id}', json={"content": f"質問{i}"}, headers=headers).status_code
+        for i in range(3)
+    ]
+    stream = client.post(f'/api/chat/{project_id}/stream', json={"content": "質問"}, headers=headers)
+
+    assert codes == [201, 201, 429]
+    assert stream.status_code == 429
+    assert stream.headers['Retry-After'] == '30'
+    with app.app_context():
+        # 拒否したプロンプトは保存しない
+        assert db.session.query(Message).filter_by(sender='user').count() == 2
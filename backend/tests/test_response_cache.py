@@ -0,0 +1,43 @@
+# backend/tests/test_response_cache.py
+from models import db, User, Project, Message, ProjectSummary
+from services.response_cache import ResponseCache
+
+
+def _project(username, summary):
+    user = User(username=username, email=f"{username}@example.com")
+    user.set_password("pw")
+    project = Project(user=user, name="テスト")
+    db.session.add_all([user, project])
+    db.session.flush()
+    db.session.add_all([
+        Message(project_id=project.id, sender='user', content="東京の天気は？"),
+        Message(project_id=project.id, sender='ai', content="晴れです。"),
+        ProjectSummary(project_id=project.id, summary=summary, last_message_id=0),
+    ])
+    db.session.commit()
+    return project
+
+
+def test_same_recent_turns_with_different_summaries_do_not_share_responses(app, client):
+    cache = ResponseCache(enabled=True)
+    with app.app_context():
+        alice = _project("alice", "大阪への出張の予定について話した。")
+        bob = _project("bob", "札幌の観光地について話した。")
+
+        cache.set(cache.context_key(alice), "明日はどう？", "大阪は明日も晴れです。", [])
+
+        assert cache.context_key(alice) != cache.context_key(bob)
+        assert cache.get(cache.context_key(bob), "明日はどう？") is None
+        assert cache.get(cache.context_key(alice), "明日はどう？")["ai_response"] == "大阪は明日も晴れです。"
+
+
+def test_summary_change_invalidates_the_context_key(app, client):
+    cache = ResponseCache(enabled=True)
+    with app.app_context():
+        project = _project("carol", "大阪への出張の予定について話した。")
+        before = cache.context_key(project)
+
+        ProjectSummary.query.filter_by(project_id=project.id).update({"summary": "京都への旅行について話した。"})
+        db.session.commit()
+
+        assert cache.context_key(project) != before
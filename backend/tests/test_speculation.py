@@ -0,0 +1,43 @@
+# backend/tests/test_speculation.py
+import threading
+import time
+from prometheus_client import REGISTRY
+import services.openai_service as openai_service
+import services.pipeline as pipeline
+from config import Config
+
+
+def _speculations(outcome):
+    return REGISTRY.get_sample_value('chat_speculative_completions_total', {'outcome': outcome}) or 0
+
+
+def test_discarded_speculation_keeps_its_slot_until_it_finishes(app, client, auth, upstreams, monkeypatch):
+    headers, project_id = auth
+    monkeypatch.setattr(Config, 'PIPELINE_SPECULATIVE_COMPLETION', True)
+    monkeypatch.setattr(pipeline, '_speculation_slots', threading.BoundedSemaphore(1))
+    release = threading.Event()
+    create_completion = openai_service.create_completion
+
+    def slow_speculation(messages):
+        # 先行生成のみ、記事の取得後も終わらない上流の呼び出しにする
+        if threading.current_thread().name.startswith('speculative-completion'):
+            release.wait(5)
+        return create_completion(messages)
+
+    monkeypatch.setattr(openai_service, 'create_completion', slow_speculation)
+    discarded, skipped = _speculations('discarded'), _speculations('skipped')
+
+    assert client.post(f'/api/chat/{project_id}', json={"content": "質問1"}, headers=headers).status_code == 201
+    assert _speculations('discarded') == discarded + 1
+
+    # 破棄した先行生成が実行中の間は枠が空かず、次のターンは先行生成しない
+    assert client.post(f'/api/chat/{project_id}', json={"content": "質問2"}, headers=headers).status_code == 201
+    assert _speculations('skipped') == skipped + 1
+
+    # 先行生成が終わると枠が空く
+    release.set()
+    deadline = time.monotonic() + 5
+    while not pipeline._speculation_slots.acquire(blocking=False):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    pipeline.release_speculation_slot()
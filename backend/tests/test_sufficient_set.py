@@ -0,0 +1,39 @@
+# backend/tests/test_sufficient_set.py
+import time
+import services.openai_service as openai_service
+from services.dedup import DistinctContents
+
+
+def test_distinct_contents_counts_near_duplicates_once(article_text):
+    distinct = DistinctContents()
+
+    distinct.update([article_text(1), article_text(1) + "（転載）", article_text(2), None])
+
+    assert len(distinct) == 2
+
+
+def test_fetch_waits_for_enough_distinct_articles(app, client, monkeypatch, article_text):
+    # 同じ本文の記事が3件先に届いても、重複を除いて3件揃うまでは待つ
+    plan = {
+        "http://a/1": (0.0, article_text(1)),
+        "http://a/2": (0.0, article_text(1)),
+        "http://a/3": (0.0, article_text(1)),
+        "http://b/1": (0.1, article_text(2)),
+        "http://c/1": (0.3, article_text(3)),
+        "http://d/1": (3.0, article_text(4)),
+    }
+
+    def fetch_article_content(url, timeout=None):
+        delay, content = plan[url]
+        time.sleep(delay)
+        return content
+
+    monkeypatch.setattr(openai_service, 'fetch_article_content', fetch_article_content)
+
+    with app.app_context():
+        started = time.monotonic()
+        contents = openai_service.fetch_articles_concurrently([{"link": url} for url in plan])
+        elapsed = time.monotonic() - started
+
+    assert [content is not None for content in contents] == [True, True, True, True, True, False]
+    assert elapsed < 2.0
@@ -1,6 +1,6 @@
 // frontend/src/components/Chat/Chat.js
 
-import React, { useState, useEffect, useRef, useCallback } from 'react';
+import React, { useState, useEffect, useLayoutEffect, useRef, useCallback } from 'react';
 import { useParams } from 'react-router-dom';
 import { getChatHistory, sendChatPrompt, getProjects } from '../../services/api';
 import { 
@@ -28,6 +28,11 @@ const Chat = () => {
     const [loading, setLoading] = useState(false);
     const chatContainerRef = useRef(null);
     const [isAutoScroll, setIsAutoScroll] = useState(true);
+    // 履歴はページ単位で返されるため、より古いメッセージの取得に使うカーソル（X-Next-Before-Id）
+    const [nextBeforeId, setNextBeforeId] = useState(null);
+    const [loadingOlder, setLoadingOlder] = useState(false);
+    // 古いメッセージを先頭に追加する前のスクロール位置（表示位置を保つため）
+    const prependScrollRef = useRef(null);
 
     // プロジェクト一覧を取得
     const loadProjects = useCallback(async () => {
@@ -39,18 +44,49 @@ const Chat = () => {
         }
     }, []);
 
-    // チャット履歴を取得
+    // チャット履歴（最新のページ）を取得
     const loadChatHistory = useCallback(async () => {
         try {
             const response = await getChatHistory(projectId);
             // 各メッセージに isNew: false を追加
             const historyMessages = response.data.map(msg => ({ ...msg, isNew: false }));
             setMessages(historyMessages);
+            setNextBeforeId(response.headers['x-next-before-id'] || null);
         } catch (error) {
             alert('チャット履歴の取得に失敗しました');
         }
     }, [projectId]);
 
+    // より古いチャット履歴を取得して先頭に追加
+    const loadOlderMessages = async () => {
+        if (!nextBeforeId || loadingOlder) return;
+        setLoadingOlder(true);
+        try {
+            const response = await getChatHistory(projectId, { before_id: nextBeforeId });
+            const olderMessages = response.data.map(msg => ({ ...msg, isNew: false }));
+            const container = chatContainerRef.current;
+            if (container) {
+                prependScrollRef.current = container.scrollHeight - container.scrollTop;
+            }
+            setIsAutoScroll(false);
+            setMessages(prevMessages => [...olderMessages, ...prevMessages]);
+            setNextBeforeId(response.headers['x-next-before-id'] || null);
+        } catch (error) {
+            alert('チャット履歴の取得に失敗しました');
+        } finally {
+            setLoadingOlder(false);
+        }
+    };
+
+    // 古いメッセージを追加した後も、それまで表示していた位置を保つ
+    useLayoutEffect(() => {
+        const container = chatContainerRef.current;
+        if (container && prependScrollRef.current !== null) {
+            container.scrollTop = container.scrollHeight - prependScrollRef.current;
+            prependScrollRef.current = null;
+        }
+    }, [messages]);
+
     useEffect(() => {
         loadProjects();
         if (projectId) {
@@ -147,8 +183,16 @@ const Chat = () => {
                     ref={chatContainerRef}
                     sx={{ flexGrow: 1, overflowY: 'auto', p: 3, bgcolor: '#f5f5f5' }}
                 >
-                    {messages.map((message, index) => (
-                        <AnimatedMessage key={index} message={message} />
+                    {/* より古いメッセージの読み込み */}
+                    {nextBeforeId && (
+                        <Box sx={{ display: 'flex', justifyContent: 'center', mb: 2 }}>
+                            <Button size="small" onClick={loadOlderMessages} disabled={loadingOlder}>
+                                {loadingOlder ? <CircularProgress size={16} /> : '以前のメッセージを読み込む'}
+                            </Button>
+                        </Box>
+                    )}
+                    {messages.map((message) => (
+                        <AnimatedMessage key={message.id} message={message} />
                     ))}
                     {/* ローディングインジケーター */}
                     {loading && (
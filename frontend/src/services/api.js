@@ -31,5 +31,6 @@ export const getProjects = () => apiClient.get('/projects/');
 export const createProject = (projectData) => apiClient.post('/projects/', projectData);
 export const updateProject = (projectId, projectData) => apiClient.put(`/projects/${projectId}`, projectData);
 export const deleteProject = (projectId) => apiClient.delete(`/projects/${projectId}`);
-export const getChatHistory = (projectId) => apiClient.get(`/chat/${projectId}`);
+export const getChatHistory = (projectId, params) => apiClient.get(`/chat/${projectId}`, { params });
 export const sendChatPrompt = (projectId, content) => apiClient.post(`/chat/${projectId}`, { content });
+export const searchHistory = (params) => apiClient.get('/search/', { params });